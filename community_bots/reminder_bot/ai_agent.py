@@ -3,47 +3,59 @@ import requests
 from google.cloud import firestore
 import datetime
 import pytz
-from reminders import get_reminders, delete_reminder, create_reminder
-from utils import format_repeat_days
+from reminders import get_reminders, reminder_local_time, create_reminder, delete_reminders_bulk, ReminderWriteBatch
+from utils import get_timezone
+from recurrence import parse_rule, from_repeat_days, bind_rule, describe_rule, describe_reminder_recurrence
+from gemini_client import generate_content, stream_generate_content, GeminiBudgetExceeded, PRIORITY_INTERACTIVE, PRIORITY_ONBOARDING, PRIORITY_BACKGROUND
+from user_profiles import get_user_profile, set_user_profile, invalidate_user_profile
+from response_cache import make_cache_key, get_cached_response, store_cached_response
+from instrumentation import operation
+from firestore_client import get_db
 from logging_config import logger
 
-db = firestore.Client()
+# Number of recent turns kept on the user doc and sent to Gemini as context
+CHAT_WINDOW_SIZE = int(os.environ.get('CHAT_WINDOW_SIZE', '10'))
+# Also keep every message in the chat_history collection (grows without bound)
+CHAT_HISTORY_ARCHIVE = os.environ.get('CHAT_HISTORY_ARCHIVE', '0') == '1'
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# Modes whose output depends only on the prompt and is served from response_cache
+CACHEABLE_MODES = ("generate_api_message", "generate_welcome_message")
+
+# Gemini budget priority of each get_chat_response mode
+MODE_PRIORITIES = {
+    "respond_user": PRIORITY_INTERACTIVE,
+    "generate_api_message": PRIORITY_ONBOARDING,
+    "generate_welcome_message": PRIORITY_ONBOARDING,
+    "agent_reachout": PRIORITY_BACKGROUND,
+}
 
 def get_user_system_prompt(chat_id):
     """Get user's system prompt from Firestore."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc = doc_ref.get()
-    if doc.exists:
-        return doc.to_dict().get('system_prompt', '')
-    return ''
+    return get_user_profile(chat_id).get('system_prompt', '')
 
 def set_user_system_prompt(chat_id, prompt):
     """Set user's system prompt in Firestore."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({
+    set_user_profile(chat_id, {
         'system_prompt': prompt,
         'updated_at': firestore.SERVER_TIMESTAMP
-    }, merge=True)
+    })
 
 def get_user_api_exhausted_message(chat_id):
     """Get user's api_exhausted_message from Firestore."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc = doc_ref.get()
-    if doc.exists:
-        return doc.to_dict().get('api_exhausted_message', '')
-    return ''
+    return get_user_profile(chat_id).get('api_exhausted_message', '')
 
 def set_user_api_exhausted_message(chat_id, message):
     """Set user's api_exhausted_message in Firestore."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({
+    set_user_profile(chat_id, {
         'api_exhausted_message': message,
         'updated_at': firestore.SERVER_TIMESTAMP
-    }, merge=True)
+    })
 
-def get_chat_history(chat_id, limit=10):
-    """Get recent chat history for user."""
-    docs = db.collection('chat_history').where('chat_id', '==', chat_id).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
+def _load_legacy_chat_history(chat_id, limit):
+    """Read recent turns from the chat_history collection (users without a window yet)."""
+    docs = get_db().collection('chat_history').where('chat_id', '==', chat_id).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(limit).stream()
     messages = []
     for doc in reversed(list(docs)):
         data = doc.to_dict()
@@ -53,27 +65,75 @@ def get_chat_history(chat_id, limit=10):
         })
     return messages
 
-def add_chat_message(chat_id, role, content):
-    """Add a message to chat history."""
-    doc_ref = db.collection('chat_history').document()
-    doc_ref.set({
-        'chat_id': chat_id,
-        'role': role,
-        'content': content,
-        'timestamp': firestore.SERVER_TIMESTAMP
-    })
+def get_chat_history(chat_id, limit=CHAT_WINDOW_SIZE):
+    """Get recent chat history for user.
+
+    Served from the rolling `recent_chat` window on the user doc, which is part
+    of the cached profile, so prompt assembly costs no extra read.
+    """
+    profile = get_user_profile(chat_id)
+    if 'recent_chat' in profile:
+        return profile['recent_chat'][-limit:]
+    return _load_legacy_chat_history(chat_id, limit)
 
-def create_reminder_from_ai(chat_id, next_run_str, text, repeat=None, reminder_id=None):
-    """Create or update a reminder from AI function call. next_run_str is in user's local timezone."""
+@firestore.transactional
+def _append_to_chat_window(transaction, chat_id, messages):
+    """Append to the `recent_chat` window on the user doc and trim it.
+
+    A transactional read-modify-write, so concurrent turns of one chat (e.g. a
+    reachout and a user message) do not drop each other's messages.
+    """
+    user_ref = get_db().collection('users').document(str(chat_id))
+    snapshot = user_ref.get(transaction=transaction)
+    data = snapshot.to_dict() if snapshot.exists else {}
+    if 'recent_chat' in data:
+        window = data['recent_chat']
+    else:
+        window = _load_legacy_chat_history(chat_id, CHAT_WINDOW_SIZE)
+    transaction.set(user_ref, {'recent_chat': (window + messages)[-CHAT_WINDOW_SIZE:]}, merge=True)
+
+def add_chat_messages(chat_id, messages):
+    """Append messages to the user's rolling history window in one transaction.
+
+    messages is a list of {'role': ..., 'content': ...} dicts. With
+    CHAT_HISTORY_ARCHIVE=1 every message is also kept in chat_history.
+    """
+    _append_to_chat_window(get_db().transaction(), chat_id, messages)
+    invalidate_user_profile(chat_id)
+
+    if CHAT_HISTORY_ARCHIVE:
+        batch = get_db().batch()
+        for message in messages:
+            batch.set(get_db().collection('chat_history').document(), {
+                'chat_id': chat_id,
+                'role': message['role'],
+                'content': message['content'],
+                'timestamp': firestore.SERVER_TIMESTAMP
+            })
+        batch.commit()
+
+def create_reminder_from_ai(chat_id, next_run_str, text, repeat=None, reminder_id=None, writes=None, recurrence=None):
+    """Create or update a reminder from AI function call. next_run_str is in user's local timezone.
+
+    `recurrence` is an optional RRULE-style rule (see recurrence.py) that takes
+    precedence over the `repeat` weekday list. With `writes` (a
+    ReminderWriteBatch) the change is only staged in the batch; the caller
+    commits it.
+    """
 
     # Get user timezone
-    user_doc = db.collection('users').document(str(chat_id)).get()
-    user_data = user_doc.to_dict() if user_doc.exists else {}
-    user_tz_str = user_data.get('timezone', 'UTC')
-    user_tz = pytz.timezone(user_tz_str)
+    user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+    user_tz = get_timezone(user_tz_str)
 
     action = "Updating" if reminder_id else "Creating"
-    logger.debug(f"{action} reminder - next_run: '{next_run_str}', text: '{text}', repeat: {repeat}, id: {reminder_id}")
+    logger.debug(f"{action} reminder - next_run: '{next_run_str}', text: '{text}', repeat: {repeat}, recurrence: {recurrence}, id: {reminder_id}")
+    try:
+        rule = parse_rule(recurrence) if recurrence else None
+    except ValueError as e:
+        return f"Invalid recurrence '{recurrence}': {e}"
+    if rule is None and repeat:
+        rule = from_repeat_days(repeat)
+
     try:
         # Parse next_run_str as local time
         next_run_local = datetime.datetime.fromisoformat(next_run_str)
@@ -82,12 +142,18 @@ def create_reminder_from_ai(chat_id, next_run_str, text, repeat=None, reminder_i
 
         # Pass the local datetime directly to create_reminder
         # create_reminder will handle the timezone conversion internally
-        result_id = create_reminder(chat_id, text, next_run_local, repeat, reminder_id)
+        if writes is None:
+            result_id = create_reminder(chat_id, text, next_run_local, repeat, reminder_id, rule)
+        elif reminder_id:
+            writes.update(reminder_id, text, next_run_local, repeat, rule)
+            result_id = reminder_id
+        else:
+            result_id = writes.create(text, next_run_local, repeat, rule)
         if result_id:
             action_done = "updated" if reminder_id else "created"
-            repeat_info = format_repeat_days(repeat)
+            repeat_info = describe_rule(bind_rule(rule, next_run_local)) if rule else ""
             if repeat_info:
-                repeat_info = f". This is a repeated reminder for{repeat_info[1:]}"  # Remove leading space, add period
+                repeat_info = f". This is a repeated reminder:{repeat_info}"
             logger.debug(f"Reminder {action_done} successfully: {result_id}")
             return f"Reminder {action_done}: {text} for {next_run_str} (local time){repeat_info}"
         else:
@@ -98,26 +164,54 @@ def create_reminder_from_ai(chat_id, next_run_str, text, repeat=None, reminder_i
         logger.debug(f"Traceback: {traceback.format_exc()}")
         return f"Failed to set reminder: {str(e)}"
 
-def get_chat_response(chat_id, message, mode="respond_user"):
-    """Get AI response using direct Gemini API calls with proper Function Calling recursion.
-    mode defines the behavior of the function:
-    "respond_user" - direct response to user
-    "agent_reachout" - continue conversation based on internal agent prompt (e.g. to continue chat after delay)
-    "generate_api_message" - generate a custom API exhausted message based on system prompt
-    "generate_welcome_message" - generate a personalized welcome message in user's language
-    """
-    logger.debug(f"Calling Gemini with message in mode: {mode}")
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if not api_key:
-        logger.error("GEMINI_API_KEY environment variable not set")
-        return "Sorry, my AI brain isn't configured properly right now. Ask admins to set Gemini API key"
+# Reminder tools offered to Gemini when replying to the user
+REMINDER_TOOLS = [{
+    'functionDeclarations': [
+        {
+            "name": "set_reminder",
+            "description": "Set a new reminder or update an existing one using index numbers (1-based).",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "next_run": {"type": "string", "description": "ISO datetime string in user's local timezone (e.g., 2026-01-15T09:00:00)"},
+                    "text": {"type": "string", "description": "Reminder message text"},
+                    "repeat": {"type": "array", "items": {"type": "integer"}, "description": "Make reminder repeatable for the following days: 1=Mon, 2=Tue, 3=Wed, 4=Thu, 5=Fri, 6=Sat, 7=Sun"},
+                    "recurrence": {"type": "string", "description": "Other repetition patterns as an RRULE-style rule, used instead of repeat: FREQ=DAILY|WEEKLY|MONTHLY with optional INTERVAL=n, BYDAY=MO,TH (weekly) or BYDAY=2TU / -1FR (monthly nth/last weekday), BYMONTHDAY=15 or -1 (last day), COUNT=n, UNTIL=YYYYMMDD. Examples: FREQ=DAILY;INTERVAL=2, FREQ=WEEKLY;INTERVAL=2;BYDAY=MO, FREQ=MONTHLY;BYDAY=1MO;COUNT=6"},
+                    "index": {"type": "integer", "description": "Optional reminder index to update (1-based, as shown in check_reminders command). If not provided, creates a new reminder."},
+                },
+                "required": ["next_run", "text"]
+            }
+        },
+        {
+            "name": "check_reminders",
+            "description": "Retrieve and display all current reminders for the user",
+            "parameters": {"type": "object", "properties": {}}
+        },
+        {
+            "name": "delete_reminders",
+            "description": "Delete reminders by their index numbers (1-based)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "indices": {"type": "array", "items": {"type": "integer"}, "description": "Index numbers of reminders to delete (1-based, as shown in check_reminders command)"}
+                },
+                "required": ["indices"]
+            }
+        }
+    ]
+}]
 
-    # --- 1. Setup Initial Context ---
+# Function-calling rounds allowed per reply
+MAX_TURNS = 5
+
+def _build_context(chat_id, message, mode):
+    """Build the Gemini contents and system prompt for a call in the given mode.
+
+    Returns (contents, system_prompt_text, user_tz).
+    """
     # Get user timezone
-    user_doc = db.collection('users').document(str(chat_id)).get()
-    user_data = user_doc.to_dict() if user_doc.exists else {}
-    user_tz_str = user_data.get('timezone', 'UTC')
-    user_tz = pytz.timezone(user_tz_str)
+    user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+    user_tz = get_timezone(user_tz_str)
 
     # Get current time in user's timezone
     now_utc = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
@@ -150,65 +244,169 @@ def get_chat_response(chat_id, message, mode="respond_user"):
                     'role': 'user',
                     'parts': [{'text': f"(Internal System Trigger): Continue the conversation naturally and convey the following: {message}"}]
                 })
-    elif mode == "generate_api_message":
-        # For API message generation, use the prompt directly without conversation history
+    elif mode in ("generate_api_message", "generate_welcome_message"):
+        # For API/welcome message generation, use the prompt directly without conversation history
         # This ensures the message is generated based purely on the system prompt
         contents = [{
             'role': 'user',
             'parts': [{'text': message}]
         }]
 
+    return contents, system_prompt_text, user_tz
+
+def _function_response(func_name, api_response):
+    return {
+        "role": "function",
+        "parts": [{
+            "functionResponse": {
+                "name": func_name,
+                "response": api_response
+            }
+        }]
+    }
+
+def _run_tool(chat_id, func_call, reminders, writes, user_tz):
+    """Run one function call against the turn's reminder snapshot.
+
+    Writes are staged in `writes`. Returns (api_response, staged) where staged
+    tells whether the call added writes to the batch.
+    """
+    func_name = func_call['name']
+    func_args = func_call.get('args', {})
+    logger.debug(f"Executing function: {func_name}")
+
+    if func_name == 'set_reminder':
+        # Get the actual document ID from the index if provided
+        reminder_index = func_args.get('index')
+        reminder_id = None
+        
+        if reminder_index is not None:
+            # Convert 1-based index to 0-based and get the document ID
+            if not 1 <= reminder_index <= len(reminders):
+                return {"result": f"Invalid reminder index {reminder_index}. Please use a number between 1 and {len(reminders)}."}, False
+            reminder_id = reminders[reminder_index - 1]['id']
+            if reminder_id in writes.deleted_ids:
+                return {"result": f"Reminder {reminder_index} is being deleted in this step and cannot be updated."}, False
+
+        staged_before = writes.count
+        res_str = create_reminder_from_ai(
+            chat_id,
+            func_args.get('next_run', ''),
+            func_args.get('text', ''),
+            func_args.get('repeat'),
+            reminder_id,
+            writes=writes,
+            recurrence=func_args.get('recurrence'),
+        )
+        return {"result": res_str}, writes.count > staged_before
+
+    elif func_name == 'check_reminders':
+        if not reminders:
+            return {"result": "No active reminders found."}, False
+        rem_list = []
+        for i, r in enumerate(reminders, 1):
+            dt_local = reminder_local_time(r, user_tz)
+            formatted_time = dt_local.strftime('%Y-%m-%d %H:%M')
+            repeat_info = describe_reminder_recurrence(r)
+            rem_list.append({"index": i, "text": r['text'], "time": f"{formatted_time} {repeat_info}"})
+        return {"reminders": rem_list, "instruction": "Reference reminders by their index numbers (1-based) when responding to the user."}, False
+
+    elif func_name == 'delete_reminders':
+        deleted, _ = delete_reminders_bulk(chat_id, func_args.get('indices', []), reminders, writes)
+        return {"result": f"Deleted {len(deleted)} reminders."}, bool(deleted)
+
+    return {}, False
+
+def execute_function_calls(chat_id, function_calls, user_tz):
+    """Run the function calls of one Gemini turn; returns their 'function' contents in order.
+
+    All calls see one snapshot of the user's reminders, read once per turn, so
+    indices refer to the list as it was when the turn started (what the model
+    last saw). The writes of all calls are committed together in one batch.
+    """
+    # Firestore usage of the turn is logged under the tools it ran
+    with operation('tool:' + '+'.join(sorted({call['name'] for call in function_calls}))):
+        # Creating a reminder needs no snapshot; skip the query when that is all the turn does
+        needs_snapshot = any(call['name'] != 'set_reminder' or call.get('args', {}).get('index') is not None
+                             for call in function_calls)
+        reminders = get_reminders(chat_id) if needs_snapshot else []
+        user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+        writes = ReminderWriteBatch(chat_id, user_tz_str)
+
+        results = []
+        for func_call in function_calls:
+            api_response, staged = _run_tool(chat_id, func_call, reminders, writes, user_tz)
+            results.append((func_call['name'], api_response, staged))
+
+        try:
+            writes.commit()
+        except Exception as e:
+            logger.error(f"Committing reminder changes for {chat_id} failed: {e}")
+            results = [(name, {"result": f"Failed to save changes: {str(e)}"} if staged else api_response, staged)
+                       for name, api_response, staged in results]
+
+    return [_function_response(name, api_response) for name, api_response, _ in results]
+
+def _record_exchange(chat_id, message, mode, text_response, cache_key=None):
+    """Store the finished exchange in the chat window (and the response cache)."""
+    exchange = []
+    if mode == "respond_user":
+        exchange.append({'role': 'user', 'content': message})
+    exchange.append({'role': 'assistant', 'content': text_response})
+    add_chat_messages(chat_id, exchange)
+    if cache_key and text_response:
+        store_cached_response(cache_key, text_response, mode, GEMINI_MODEL)
+
+def _exhausted_reply(chat_id):
+    custom_message = get_user_api_exhausted_message(chat_id)
+    if custom_message:
+        return custom_message
+    else:
+        return "API is currently exhausted, please try again later."
+
+def get_chat_response(chat_id, message, mode="respond_user"):
+    """Get AI response using direct Gemini API calls with proper Function Calling recursion.
+    mode defines the behavior of the function:
+    "respond_user" - direct response to user
+    "agent_reachout" - continue conversation based on internal agent prompt (e.g. to continue chat after delay)
+    "generate_api_message" - generate a custom API exhausted message based on system prompt
+    "generate_welcome_message" - generate a personalized welcome message in user's language
+
+    Calls go through the shared Gemini budget with the mode's priority (see
+    MODE_PRIORITIES). Replies to the user fall back to the API exhausted message
+    when no budget is left; other modes raise GeminiBudgetExceeded so the caller
+    can defer or downgrade the work.
+    """
+    logger.debug(f"Calling Gemini with message in mode: {mode}")
+    priority = MODE_PRIORITIES.get(mode, PRIORITY_INTERACTIVE)
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key:
+        logger.error("GEMINI_API_KEY environment variable not set")
+        return "Sorry, my AI brain isn't configured properly right now. Ask admins to set Gemini API key"
+
+    # Onboarding generations depend only on the prompt, so identical prompts reuse earlier output
+    cache_key = None
+    if mode in CACHEABLE_MODES:
+        cache_key = make_cache_key(mode, GEMINI_MODEL, message)
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            logger.debug(f"Response cache hit for mode {mode}")
+            add_chat_messages(chat_id, [{'role': 'assistant', 'content': cached}])
+            return cached
+
+    # --- 1. Setup Initial Context ---
+    contents, system_prompt_text, user_tz = _build_context(chat_id, message, mode)
+
     # --- 2. Define Tools (CONDITIONALLY) ---
     # We ONLY define tools if we are responding to a user. 
-    tools = None
-    
-    if mode == "respond_user": 
-        tools = [{
-            'functionDeclarations': [
-                {
-                    "name": "set_reminder",
-                    "description": "Set a new reminder or update an existing one using index numbers (1-based).",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "next_run": {"type": "string", "description": "ISO datetime string in user's local timezone (e.g., 2026-01-15T09:00:00)"},
-                            "text": {"type": "string", "description": "Reminder message text"},
-                            "repeat": {"type": "array", "items": {"type": "integer"}, "description": "Make reminder repeatable for the following days: 1=Mon, 2=Tue, 3=Wed, 4=Thu, 5=Fri, 6=Sat, 7=Sun"},
-                            "index": {"type": "integer", "description": "Optional reminder index to update (1-based, as shown in check_reminders command). If not provided, creates a new reminder."},
-                        },
-                        "required": ["next_run", "text"]
-                    }
-                },
-                {
-                    "name": "check_reminders",
-                    "description": "Retrieve and display all current reminders for the user",
-                    "parameters": {"type": "object", "properties": {}}
-                },
-                {
-                    "name": "delete_reminders",
-                    "description": "Delete reminders by their index numbers (1-based)",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "indices": {"type": "array", "items": {"type": "integer"}, "description": "Index numbers of reminders to delete (1-based, as shown in check_reminders command)"}
-                        },
-                        "required": ["indices"]
-                    }
-                }
-            ]
-        }]
+    tools = REMINDER_TOOLS if mode == "respond_user" else None
 
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent"
-    headers = {
-        'x-goog-api-key': api_key,
-        'Content-Type': 'application/json'
-    }
+    model_path = f"models/{GEMINI_MODEL}:generateContent"
 
     # --- 3. Main Interaction Loop ---
-    max_turns = 5
     current_turn = 0
 
-    while current_turn < max_turns:
+    while current_turn < MAX_TURNS:
         current_turn += 1
         
         payload = {
@@ -222,7 +420,7 @@ def get_chat_response(chat_id, message, mode="respond_user"):
 
         try:
             logger.debug(f"Turn {current_turn} - Sending request to Gemini (Mode: {mode})...")
-            response = requests.post(url, headers=headers, json=payload, timeout=30)
+            response = generate_content(model_path, payload, api_key, priority)
             response.raise_for_status()
             data = response.json()
 
@@ -238,100 +436,93 @@ def get_chat_response(chat_id, message, mode="respond_user"):
             if not function_calls:
                 # -- FINAL TEXT RESPONSE --
                 text_response = "".join([p.get('text', '') for p in parts])
-                
-                if mode == "respond_user":
-                    add_chat_message(chat_id, "user", message)
-                add_chat_message(chat_id, "assistant", text_response)
-                
+                _record_exchange(chat_id, message, mode, text_response, cache_key)
                 return text_response
 
             else:
                 # -- HANDLE FUNCTION CALL (Only happens if tools were provided) --
                 contents.append(content)
-
-                for func_call in function_calls:
-                    func_name = func_call['name']
-                    func_args = func_call.get('args', {})
-                    logger.debug(f"Executing function: {func_name}")
-
-                    api_response = {}
-
-                    if func_name == 'set_reminder':
-                        # Get the actual document ID from the index if provided
-                        reminder_index = func_args.get('index')
-                        reminder_id = None
-                        
-                        if reminder_index is not None:
-                            # Convert 1-based index to 0-based and get the document ID
-                            reminders = get_reminders(chat_id)
-                            if 1 <= reminder_index <= len(reminders):
-                                reminder_id = reminders[reminder_index - 1]['id']
-                            else:
-                                api_response = {"result": f"Invalid reminder index {reminder_index}. Please use a number between 1 and {len(reminders)}."}
-                                contents.append({
-                                    "role": "function",
-                                    "parts": [{
-                                        "functionResponse": {
-                                            "name": func_name,
-                                            "response": api_response
-                                        }
-                                    }]
-                                })
-                                continue
-                        
-                        res_str = create_reminder_from_ai(
-                            chat_id,
-                            func_args.get('next_run', ''),
-                            func_args.get('text', ''),
-                            func_args.get('repeat'),
-                            reminder_id,
-                        )
-                        api_response = {"result": res_str}
-
-                    elif func_name == 'check_reminders':
-                        reminders = get_reminders(chat_id)
-                        if not reminders:
-                            api_response = {"result": "No active reminders found."}
-                        else:
-                            rem_list = []
-                            for i, r in enumerate(reminders, 1):
-                                dt_utc = datetime.datetime.fromisoformat(r['next_run'])
-                                dt_local = dt_utc.astimezone(user_tz)
-                                formatted_time = dt_local.strftime('%Y-%m-%d %H:%M')
-                                repeat_info = format_repeat_days(r.get('repeat', []))
-                                rem_list.append({"index": i, "text": r['text'], "time": f"{formatted_time} {repeat_info}"})
-                            api_response = {"reminders": rem_list, "instruction": "Reference reminders by their index numbers (1-based) when responding to the user."}
-
-                    elif func_name == 'delete_reminders':
-                        indices = func_args.get('indices', [])
-                        deleted_count = 0
-                        for idx in indices:
-                            # Convert 1-based index to 0-based before calling delete_reminder
-                            zero_based_idx = idx - 1
-                            if delete_reminder(chat_id, zero_based_idx):
-                                deleted_count += 1
-                        api_response = {"result": f"Deleted {deleted_count} reminders."}
-
-                    contents.append({
-                        "role": "function",
-                        "parts": [{
-                            "functionResponse": {
-                                "name": func_name,
-                                "response": api_response
-                            }
-                        }]
-                    })
-                
+                contents.extend(execute_function_calls(chat_id, function_calls, user_tz))
                 continue
 
+        except GeminiBudgetExceeded as e:
+            logger.warning(f"Gemini budget exhausted ({mode}): {e}")
+            if priority != PRIORITY_INTERACTIVE:
+                raise
+            return _exhausted_reply(chat_id)
         except Exception as e:
             logger.error(f"Error in Gemini Loop: {e}")
             if isinstance(e, requests.HTTPError) and e.response.status_code == 429:
-                custom_message = get_user_api_exhausted_message(chat_id)
-                if custom_message:
-                    return custom_message
-                else:
-                    return "API is currently exhausted, please try again later."
+                return _exhausted_reply(chat_id)
+            return f"Error: {str(e)}"
+
+    return "Sorry, the conversation got stuck in a loop."
+
+def stream_chat_response(chat_id, message, on_text):
+    """Reply to the user like get_chat_response(mode="respond_user"), streaming the text.
+
+    Uses streamGenerateContent and calls on_text(text_so_far) as chunks of the
+    answer arrive, so the caller can show the reply while it is generated.
+    Function calls are executed between turns as in get_chat_response; each
+    turn starts its text from scratch. Returns the final reply text.
+    """
+    mode = "respond_user"
+    logger.debug(f"Streaming Gemini reply for chat {chat_id}")
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key:
+        logger.error("GEMINI_API_KEY environment variable not set")
+        return "Sorry, my AI brain isn't configured properly right now. Ask admins to set Gemini API key"
+
+    contents, system_prompt_text, user_tz = _build_context(chat_id, message, mode)
+    model_path = f"models/{GEMINI_MODEL}:streamGenerateContent"
+
+    for current_turn in range(1, MAX_TURNS + 1):
+        payload = {
+            'contents': contents,
+            'system_instruction': {'parts': {'text': system_prompt_text}},
+            'tools': REMINDER_TOOLS,
+        }
+
+        try:
+            logger.debug(f"Turn {current_turn} - Streaming request to Gemini...")
+            text_response = ""
+            # Parts of the model turn as they must be sent back after function calls:
+            # streamed text merged into one part, everything else kept as received
+            model_parts = []
+            function_calls = []
+            received = False
+
+            for chunk in stream_generate_content(model_path, payload, api_key, PRIORITY_INTERACTIVE):
+                if not chunk.get('candidates'):
+                    continue
+                received = True
+                for part in chunk['candidates'][0].get('content', {}).get('parts', []):
+                    if 'functionCall' in part:
+                        function_calls.append(part['functionCall'])
+                        model_parts.append(part)
+                    elif 'text' in part:
+                        text_response += part['text']
+                        on_text(text_response)
+
+            if not received:
+                return "Sorry, I didn't get a response."
+
+            if not function_calls:
+                _record_exchange(chat_id, message, mode, text_response)
+                return text_response
+
+            if text_response:
+                model_parts.insert(0, {'text': text_response})
+            contents.append({'role': 'model', 'parts': model_parts})
+            contents.extend(execute_function_calls(chat_id, function_calls, user_tz))
+
+        except GeminiBudgetExceeded as e:
+            logger.warning(f"Gemini budget exhausted (streaming): {e}")
+            return _exhausted_reply(chat_id)
+        except Exception as e:
+            logger.error(f"Error in Gemini stream: {e}")
+            if isinstance(e, requests.HTTPError) and e.response.status_code == 429:
+                return _exhausted_reply(chat_id)
             return f"Error: {str(e)}"
 
     return "Sorry, the conversation got stuck in a loop."
@@ -354,7 +545,11 @@ def generate_api_exhausted_message(chat_id, system_prompt):
     Keep the message under 5 sentences and make it sound helpful and professional."""
     
     # Use the existing get_chat_response function with a special mode
-    return get_chat_response(chat_id, prompt, mode="generate_api_message")
+    try:
+        return get_chat_response(chat_id, prompt, mode="generate_api_message")
+    except GeminiBudgetExceeded:
+        # Keep Gemini quota for interactive users, onboarding gets the static text
+        return "Sorry, the AI is taking a break. Try again later."
 
 def generate_welcome_message(chat_id, system_prompt):
     """Generate a personalized welcome message in the user's preferred language based on system prompt."""
@@ -375,12 +570,18 @@ def generate_welcome_message(chat_id, system_prompt):
     The message should be 2-3 sentences and match the tone of the AI's role."""
     
     # Use the existing get_chat_response function with a special mode
-    return get_chat_response(chat_id, prompt, mode="generate_welcome_message")
+    try:
+        return get_chat_response(chat_id, prompt, mode="generate_welcome_message")
+    except GeminiBudgetExceeded:
+        # Keep Gemini quota for interactive users, onboarding gets the static text
+        return "Welcome! I'm ready to help you. You can now set up your first reminder using /remind command."
 
 def generate_agent_reachout_message(reminder_data, chat_id, reachout_type="agent_reachout"):
-    """Generate a personalized message for agent reachout using AI."""
+    """Generate a personalized message for agent reachout using AI.
+
+    Raises GeminiBudgetExceeded when background work has to yield to users.
+    """
     purpose = reminder_data.get('text', '').replace('AI check-in: ', '')
     ai_prompt = f"Generate a friendly, natural check-in message about: {purpose}"
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({'last_ai_message': firestore.SERVER_TIMESTAMP}, merge=True)
+    # last_ai_message is recorded by the reachout scheduler when it claims the slot
     return get_chat_response(chat_id, ai_prompt, mode=reachout_type)
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from instrumentation import propagate_context
+from logging_config import logger
+
+# Worker pool size and Telegram rate limits (see https://core.telegram.org/bots/faq)
+DISPATCH_WORKERS = int(os.environ.get('DISPATCH_WORKERS', '8'))
+TELEGRAM_GLOBAL_RATE = float(os.environ.get('TELEGRAM_GLOBAL_RATE', '30'))  # messages per second
+TELEGRAM_PER_CHAT_INTERVAL = float(os.environ.get('TELEGRAM_PER_CHAT_INTERVAL', '1.0'))  # seconds
+
+class SendNotAttempted(Exception):
+    """Raised by a send_func that gave up before contacting Telegram, so the message is retried."""
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls evenly at `rate` calls per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may proceed."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+def _is_retryable(results):
+    """Whether a failed Telegram response is worth retrying on the next tick.
+
+    Only a 429 with no part of the message delivered is known not to have been
+    sent. A 5xx may come after Telegram accepted the message, so retrying it
+    could deliver the reminder twice.
+    """
+    results = results or []
+    if any(r.get('ok', False) for r in results):
+        return False
+    return any(r.get('error_code') == 429 for r in results)
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize_outcomes(outcomes, elapsed):
+    """Build latency and throughput stats for a dispatch run."""
+    latencies = sorted(o['latency'] for o in outcomes if o['status'] != 'skipped')
+    counts = {'sent': 0, 'failed': 0, 'retry': 0, 'skipped': 0}
+    for outcome in outcomes:
+        counts[outcome['status']] += 1
+    return {
+        **counts,
+        'total': len(outcomes),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_s': round(counts['sent'] / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_p50_s': round(_percentile(latencies, 50), 3),
+        'latency_p95_s': round(_percentile(latencies, 95), 3),
+        'latency_max_s': round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+def dispatch_messages(items, send_func, on_sent=None, deadline=None,
+                      workers=None, global_rate=None, per_chat_interval=None):
+    """Send many messages concurrently while respecting Telegram rate limits.
+
+    items: iterable of (chat_id, payload) pairs; payload is passed to send_func
+        and on_sent untouched.
+    send_func(chat_id, payload): performs the send and returns the Telegram
+        results list (as returned by telegram.send_message).
+    on_sent(payload): called in the worker thread after a message was delivered,
+        or failed permanently (e.g. the user blocked the bot).
+    deadline: time.monotonic() value after which no new sends are started.
+
+    Messages for the same chat are sent in order, one at a time, spaced by the
+    per-chat interval. Different chats are handled in parallel.
+
+    Returns (outcomes, stats). Each outcome is a dict with chat_id, payload,
+    status ('sent', 'failed', 'retry' or 'skipped'), latency and error. 'retry'
+    is only used when the message is known not to have been delivered (a
+    connect failure, a 429 or SendNotAttempted); sends with an unclear outcome
+    are 'failed'.
+    """
+    workers = workers or DISPATCH_WORKERS
+    per_chat_interval = TELEGRAM_PER_CHAT_INTERVAL if per_chat_interval is None else per_chat_interval
+    limiter = RateLimiter(TELEGRAM_GLOBAL_RATE if global_rate is None else global_rate)
+
+    # Group by chat so per-chat ordering and spacing come for free
+    by_chat = {}
+    for chat_id, payload in items:
+        by_chat.setdefault(chat_id, []).append(payload)
+
+    def deliver_chat(chat_id, payloads):
+        chat_outcomes = []
+        for i, payload in enumerate(payloads):
+            if deadline is not None and time.monotonic() >= deadline:
+                chat_outcomes.append({'chat_id': chat_id, 'payload': payload, 'status': 'skipped', 'latency': 0.0, 'error': None})
+                continue
+            if i > 0 and per_chat_interval > 0:
+                time.sleep(per_chat_interval)
+            limiter.acquire()
+            started = time.monotonic()
+            status, error = 'sent', None
+            try:
+                results = send_func(chat_id, payload)
+                if not all(r.get('ok', False) for r in results or []):
+                    status = 'retry' if _is_retryable(results) else 'failed'
+                    error = next((r.get('description') for r in results if not r.get('ok', False)), None)
+            except (SendNotAttempted, requests.ConnectionError, requests.ConnectTimeout) as e:
+                # The request never reached Telegram
+                status, error = 'retry', str(e)
+            except Exception as e:
+                # E.g. a read timeout: Telegram may have delivered the message,
+                # so it counts as done rather than being sent again
+                status, error = 'failed', str(e)
+            latency = time.monotonic() - started
+
+            if status in ('sent', 'failed') and on_sent:
+                try:
+                    on_sent(payload)
+                except Exception as e:
+                    logger.error(f"Post-send handler failed for chat {chat_id}: {e}")
+                    status, error = 'failed', str(e)
+            chat_outcomes.append({'chat_id': chat_id, 'payload': payload, 'status': status, 'latency': latency, 'error': error})
+        return chat_outcomes
+
+    started = time.monotonic()
+    outcomes = []
+    if by_chat:
+        with ThreadPoolExecutor(max_workers=min(workers, len(by_chat))) as pool:
+            # Workers account their Telegram calls and writes to the caller's request
+            futures = [pool.submit(propagate_context(deliver_chat), chat_id, payloads)
+                       for chat_id, payloads in by_chat.items()]
+            for future in futures:
+                outcomes.extend(future.result())
+
+    stats = summarize_outcomes(outcomes, time.monotonic() - started)
+    return outcomes, stats
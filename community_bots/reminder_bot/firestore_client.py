@@ -0,0 +1,90 @@
+import threading
+import time
+from google.cloud import firestore
+from instrumentation import record_firestore
+
+# One Firestore client for the whole process. It is created on first use rather
+# than at import time, so credentials are looked up and a channel is opened
+# once per instance, and only by entry points that actually touch Firestore.
+_db = None
+_db_lock = threading.Lock()
+
+
+def _counted_stream(responses, kind, count_response, minimum=0):
+    """Yield from a streaming RPC, recording the documents and time spent in it."""
+    count = 0
+    elapsed = 0.0
+    iterator = iter(responses)
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                response = next(iterator)
+            except StopIteration:
+                elapsed += time.monotonic() - started
+                break
+            elapsed += time.monotonic() - started
+            count += count_response(response)
+            yield response
+    finally:
+        record_firestore(kind, max(count, minimum), elapsed)
+
+
+class _CountingFirestoreApi:
+    """Proxy for the GAPIC Firestore client that records reads, writes and deletes.
+
+    Every document read, query, aggregation and commit of the client library
+    goes through one of these RPCs, so counting here covers references,
+    queries, batches and transactions alike. Reads are counted as billed:
+    a query costs at least one read even when it matches nothing.
+    """
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def batch_get_documents(self, *args, **kwargs):
+        responses = self._api.batch_get_documents(*args, **kwargs)
+        return _counted_stream(responses, 'reads', lambda r: int(r._pb.WhichOneof('result') is not None))
+
+    def run_query(self, *args, **kwargs):
+        responses = self._api.run_query(*args, **kwargs)
+        return _counted_stream(responses, 'reads', lambda r: int(r._pb.HasField('document')), minimum=1)
+
+    def run_aggregation_query(self, *args, **kwargs):
+        responses = self._api.run_aggregation_query(*args, **kwargs)
+        return _counted_stream(responses, 'reads', lambda r: 0, minimum=1)
+
+    def commit(self, *args, request=None, **kwargs):
+        writes = (request.get('writes') if isinstance(request, dict) else getattr(request, 'writes', None)) or []
+        deletes = sum(1 for write in writes if write._pb.WhichOneof('operation') == 'delete')
+        started = time.monotonic()
+        try:
+            return self._api.commit(*args, request=request, **kwargs)
+        finally:
+            elapsed = time.monotonic() - started
+            record_firestore('writes', len(writes) - deletes, elapsed)
+            record_firestore('deletes', deletes, 0.0)
+
+
+class InstrumentedClient(firestore.Client):
+    """firestore.Client that accounts its operations to the current request."""
+
+    _counting_api = None
+
+    @property
+    def _firestore_api(self):
+        if self._counting_api is None:
+            self._counting_api = _CountingFirestoreApi(super()._firestore_api)
+        return self._counting_api
+
+
+def get_db():
+    """The process-wide Firestore client (created on first use)."""
+    global _db
+    with _db_lock:
+        if _db is None:
+            _db = InstrumentedClient()
+        return _db
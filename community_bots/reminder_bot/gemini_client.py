@@ -0,0 +1,272 @@
+import contextvars
+import datetime
+import json
+import os
+import threading
+import time
+from google.cloud import firestore
+from http_client import gemini_post, retry_delay, GEMINI_MAX_RETRIES, HTTP_MAX_RETRY_WAIT
+from firestore_client import get_db
+from logging_config import logger
+
+# Priority classes, most important first
+PRIORITY_INTERACTIVE = 'interactive'  # replies to a user who is waiting
+PRIORITY_ONBOARDING = 'onboarding'    # /start setup generations (have static fallbacks)
+PRIORITY_BACKGROUND = 'background'    # reachouts, can be deferred
+
+# Shared request/token budget (Gemini free tier limits for gemini-2.5-flash)
+GEMINI_RPM = int(os.environ.get('GEMINI_RPM', '10'))
+GEMINI_TPM = int(os.environ.get('GEMINI_TPM', '250000'))
+# 'firestore' shares the budget across instances and functions through a
+# per-minute counter document (one transaction per call); 'memory' keeps it per
+# instance, which only holds the limit for a single instance (e.g. local runs)
+GEMINI_BUDGET_BACKEND = os.environ.get('GEMINI_BUDGET_BACKEND', 'firestore')
+
+# Share of the budget each class must leave untouched for higher priorities
+PRIORITY_RESERVE = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_ONBOARDING: 0.2,
+    PRIORITY_BACKGROUND: 0.5,
+}
+# How long a call may queue for budget before giving up
+PRIORITY_MAX_WAIT_S = {
+    PRIORITY_INTERACTIVE: float(os.environ.get('GEMINI_INTERACTIVE_MAX_WAIT_S', '20')),
+    PRIORITY_ONBOARDING: float(os.environ.get('GEMINI_ONBOARDING_MAX_WAIT_S', '5')),
+    PRIORITY_BACKGROUND: 0.0,
+}
+# Time kept free for the Gemini call itself when a request has a deadline (see
+# set_request_deadline): waits for budget end this long before it, and no call
+# starts with less time left
+GEMINI_CALL_RESERVE_S = float(os.environ.get('GEMINI_CALL_RESERVE_S', '15'))
+# After a 429 lower priorities back off for this long
+GEMINI_COOLDOWN_S = float(os.environ.get('GEMINI_COOLDOWN_S', '60'))
+# Output tokens assumed per call until the real usage is known
+ESTIMATED_OUTPUT_TOKENS = 800
+
+class GeminiBudgetExceeded(Exception):
+    """Raised when a call cannot get Gemini budget within its priority's wait limit."""
+
+def estimate_tokens(payload):
+    """Rough token estimate for a request (about 4 characters per token)."""
+    return len(json.dumps(payload)) // 4 + ESTIMATED_OUTPUT_TOKENS
+
+class TokenBucket:
+    """Token bucket with `capacity` tokens refilled evenly over one minute."""
+
+    def __init__(self, capacity):
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.refill_per_s = capacity / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_s)
+        self.updated = now
+
+    def wait_time(self, amount, reserve):
+        """Seconds until `amount` tokens can be taken while keeping `reserve` of capacity."""
+        needed = amount + reserve * self.capacity - self.tokens
+        if needed <= 0:
+            return 0.0
+        if amount + reserve * self.capacity > self.capacity:
+            return float('inf')
+        return needed / self.refill_per_s
+
+class MemoryBudget:
+    """RPM/TPM budget shared by all threads of this instance."""
+
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cooldown_until = 0.0
+        self.lock = threading.Lock()
+
+    def try_acquire(self, priority, est_tokens):
+        """Take budget if available; otherwise return the seconds to wait."""
+        reserve = PRIORITY_RESERVE[priority]
+        with self.lock:
+            if priority != PRIORITY_INTERACTIVE and time.monotonic() < self.cooldown_until:
+                return self.cooldown_until - time.monotonic()
+            self.requests.refill()
+            self.tokens.refill()
+            wait = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(est_tokens, reserve))
+            if wait > 0:
+                return wait
+            self.requests.tokens -= 1
+            self.tokens.tokens -= est_tokens
+            return 0.0
+
+    def record_usage(self, est_tokens, actual_tokens):
+        with self.lock:
+            self.tokens.tokens -= actual_tokens - est_tokens
+
+    def record_rate_limited(self):
+        with self.lock:
+            self.cooldown_until = time.monotonic() + GEMINI_COOLDOWN_S
+            self.requests.tokens = min(self.requests.tokens, 0.0)
+
+class FirestoreBudget:
+    """RPM/TPM budget shared by all instances via gemini_budget/{minute} counters."""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+
+    def _minute_ref(self, now):
+        return get_db().collection('gemini_budget').document(now.strftime('%Y%m%d%H%M'))
+
+    def try_acquire(self, priority, est_tokens):
+        reserve = PRIORITY_RESERVE[priority]
+        now = datetime.datetime.now(datetime.timezone.utc)
+        seconds_to_next_minute = 60 - now.second - now.microsecond / 1e6
+
+        @firestore.transactional
+        def take(transaction, doc_ref):
+            snapshot = doc_ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else {}
+            if priority != PRIORITY_INTERACTIVE and data.get('rate_limited'):
+                return False
+            requests_used = data.get('requests', 0)
+            tokens_used = data.get('tokens', 0)
+            if (requests_used + 1 > self.rpm * (1 - reserve)
+                    or tokens_used + est_tokens > self.tpm * (1 - reserve)):
+                return False
+            transaction.set(doc_ref, {
+                'requests': requests_used + 1,
+                'tokens': tokens_used + est_tokens,
+                'expires_at': now + datetime.timedelta(hours=1)
+            }, merge=True)
+            return True
+
+        if take(get_db().transaction(), self._minute_ref(now)):
+            return 0.0
+        return seconds_to_next_minute
+
+    def record_usage(self, est_tokens, actual_tokens):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._minute_ref(now).set({'tokens': firestore.Increment(actual_tokens - est_tokens)}, merge=True)
+
+    def record_rate_limited(self):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        self._minute_ref(now).set({'rate_limited': True, 'expires_at': now + datetime.timedelta(hours=1)}, merge=True)
+
+_budget = None
+_budget_lock = threading.Lock()
+# Deadline (a time.monotonic() value) of the request being handled, if any
+_request_deadline = contextvars.ContextVar('gemini_request_deadline', default=None)
+
+def get_budget():
+    """The process-wide Gemini budget (created on first use)."""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            if GEMINI_BUDGET_BACKEND == 'firestore':
+                _budget = FirestoreBudget(GEMINI_RPM, GEMINI_TPM)
+            else:
+                _budget = MemoryBudget(GEMINI_RPM, GEMINI_TPM)
+        return _budget
+
+def set_request_deadline(deadline):
+    """Bound the Gemini calls of the current request by `deadline` (time.monotonic(), None for none).
+
+    Set by entry points that must answer within a timeout, so a tool loop of
+    several calls cannot outlast it by queueing for budget.
+    """
+    _request_deadline.set(deadline)
+
+def acquire_budget(priority, est_tokens):
+    """Wait for Gemini budget, at most the priority's max wait.
+
+    The wait also ends GEMINI_CALL_RESERVE_S before the request deadline, if
+    one is set. Raises GeminiBudgetExceeded when the budget does not free up in
+    time or too little of the request is left for another call.
+    """
+    budget = get_budget()
+    deadline = time.monotonic() + PRIORITY_MAX_WAIT_S[priority]
+    request_deadline = _request_deadline.get()
+    if request_deadline is not None:
+        deadline = min(deadline, request_deadline - GEMINI_CALL_RESERVE_S)
+        if time.monotonic() > deadline:
+            raise GeminiBudgetExceeded(f"Too little time left in the request for another {priority} call")
+    while True:
+        wait = budget.try_acquire(priority, est_tokens)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            raise GeminiBudgetExceeded(f"No Gemini budget for {priority} call (next slot in {wait:.1f}s)")
+        time.sleep(min(wait, 1.0))
+
+def _post_within_budget(model_path, payload, api_key, priority, est_tokens, stream=False):
+    """POST to Gemini, taking budget before every attempt.
+
+    A 429 makes lower priorities back off for GEMINI_COOLDOWN_S and is retried
+    up to GEMINI_MAX_RETRIES times, each retry queueing for budget again. The
+    last 429 is returned when retries run out or no budget frees up in time.
+    """
+    acquire_budget(priority, est_tokens)
+    for attempt in range(GEMINI_MAX_RETRIES + 1):
+        response = gemini_post(model_path, payload, api_key, stream=stream)
+        if response.status_code != 429:
+            return response
+        logger.warning(f"Gemini rate limited a {priority} call, backing off lower priorities")
+        get_budget().record_rate_limited()
+        if attempt >= GEMINI_MAX_RETRIES:
+            return response
+        delay = retry_delay(response, attempt)
+        if delay > HTTP_MAX_RETRY_WAIT:
+            return response
+        request_deadline = _request_deadline.get()
+        if request_deadline is not None and time.monotonic() + delay > request_deadline - GEMINI_CALL_RESERVE_S:
+            return response
+        time.sleep(delay)
+        try:
+            acquire_budget(priority, est_tokens)
+        except GeminiBudgetExceeded:
+            return response
+        response.close()
+    return response
+
+def generate_content(model_path, payload, api_key, priority=PRIORITY_INTERACTIVE):
+    """Call Gemini generateContent within the shared budget.
+
+    Returns the requests.Response. A 429 from Gemini makes lower priorities back
+    off for GEMINI_COOLDOWN_S.
+    """
+    est_tokens = estimate_tokens(payload)
+    response = _post_within_budget(model_path, payload, api_key, priority, est_tokens)
+    if response.ok:
+        try:
+            usage = response.json().get('usageMetadata', {})
+            if 'totalTokenCount' in usage:
+                get_budget().record_usage(est_tokens, usage['totalTokenCount'])
+        except ValueError:
+            pass
+    return response
+
+def stream_generate_content(model_path, payload, api_key, priority=PRIORITY_INTERACTIVE):
+    """Call Gemini streamGenerateContent within the shared budget.
+
+    `model_path` is 'models/<model>:streamGenerateContent'. Yields the
+    GenerateContentResponse chunks as they arrive over server-sent events.
+    Raises requests.HTTPError when the call is rejected.
+    """
+    est_tokens = estimate_tokens(payload)
+    response = _post_within_budget(model_path, payload, api_key, priority, est_tokens, stream=True)
+    try:
+        response.raise_for_status()
+
+        usage = {}
+        for line in response.iter_lines(decode_unicode=True):
+            # Events are single 'data: {...}' lines separated by blank lines
+            if not line or not line.startswith('data:'):
+                continue
+            chunk = json.loads(line[len('data:'):])
+            # Every chunk carries the running usage; the last one has the total
+            usage = chunk.get('usageMetadata', usage)
+            yield chunk
+
+        if 'totalTokenCount' in usage:
+            get_budget().record_usage(est_tokens, usage['totalTokenCount'])
+    finally:
+        response.close()
@@ -0,0 +1,123 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from instrumentation import span
+from logging_config import logger
+
+# API endpoints (overridable to point at local stub servers)
+TELEGRAM_API_BASE = os.environ.get('TELEGRAM_API_BASE', 'https://api.telegram.org')
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com')
+
+# Connection pool size per host; should be >= the dispatch worker count
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))
+
+# (connect, read) timeouts in seconds
+TELEGRAM_TIMEOUT = (float(os.environ.get('TELEGRAM_CONNECT_TIMEOUT', '5')),
+                    float(os.environ.get('TELEGRAM_READ_TIMEOUT', '30')))
+GEMINI_TIMEOUT = (float(os.environ.get('GEMINI_CONNECT_TIMEOUT', '5')),
+                  float(os.environ.get('GEMINI_READ_TIMEOUT', '30')))
+
+# Retries for 429/5xx and connection failures (Gemini 429s are retried by
+# gemini_client, so each retry takes Gemini budget again)
+TELEGRAM_MAX_RETRIES = int(os.environ.get('TELEGRAM_MAX_RETRIES', '3'))
+GEMINI_MAX_RETRIES = int(os.environ.get('GEMINI_MAX_RETRIES', '2'))
+# Never sleep longer than this for a single retry; longer waits are returned to the caller
+HTTP_MAX_RETRY_WAIT = float(os.environ.get('HTTP_MAX_RETRY_WAIT', '10'))
+
+# Sessions live at module level so warm function instances reuse open connections
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(name):
+    """Get the shared keep-alive session for an upstream API ('telegram' or 'gemini')."""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[name] = session
+        return session
+
+def retry_delay(response, attempt):
+    """Seconds to wait before retrying, honoring Telegram's retry_after and Retry-After."""
+    if response is not None:
+        try:
+            retry_after = response.json().get('parameters', {}).get('retry_after')
+            if retry_after is not None:
+                return float(retry_after)
+        except (ValueError, AttributeError):
+            pass
+        header = response.headers.get('Retry-After')
+        if header and header.isdigit():
+            return float(header)
+    # Exponential backoff with jitter: ~0.5s, 1s, 2s, ...
+    return 0.5 * 2 ** attempt * (1 + random.random() * 0.25)
+
+def post_with_retry(name, url, timeout, max_retries, retry_rate_limited=True, **kwargs):
+    """POST through the named session, retrying 429/5xx responses and failed connects.
+
+    Read timeouts are not retried, since the request may already have been
+    processed (e.g. a Telegram message delivered). With retry_rate_limited=False
+    a 429 is returned at once. Returns the last response.
+    """
+    session = get_session(name)
+    for attempt in range(max_retries + 1):
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except requests.ConnectionError as e:
+            if attempt >= max_retries:
+                raise
+            delay = retry_delay(None, attempt)
+            logger.warning(f"{name} connection failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code != 429 and response.status_code < 500:
+            return response
+        if response.status_code == 429 and not retry_rate_limited:
+            return response
+        if attempt >= max_retries:
+            return response
+
+        delay = retry_delay(response, attempt)
+        if delay > HTTP_MAX_RETRY_WAIT:
+            logger.warning(f"{name} asked to retry after {delay:.1f}s, giving up")
+            return response
+        logger.warning(f"{name} returned {response.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    return response
+
+def telegram_post(method, payload, bot_token, timeout=None):
+    """Call a Telegram Bot API method and return the response.
+
+    `timeout` overrides TELEGRAM_TIMEOUT, e.g. for long-polling getUpdates.
+    """
+    url = f"{TELEGRAM_API_BASE}/bot{bot_token}/{method}"
+    with span(f"telegram.{method}"):
+        return post_with_retry('telegram', url, timeout or TELEGRAM_TIMEOUT, TELEGRAM_MAX_RETRIES, json=payload)
+
+def gemini_post(path, payload, api_key, stream=False):
+    """Call a Gemini REST endpoint (e.g. 'models/gemini-2.5-flash:generateContent').
+
+    With stream=True the body is not read up front, for server-sent events
+    from streamGenerateContent; the caller must close the response. A 429 is
+    returned without retrying (see gemini_client).
+    """
+    url = f"{GEMINI_API_BASE}/v1beta/{path}"
+    headers = {
+        'x-goog-api-key': api_key,
+        'Content-Type': 'application/json'
+    }
+    kwargs = {}
+    if stream:
+        kwargs['params'] = {'alt': 'sse'}
+        kwargs['stream'] = True
+    # For streams the span ends when the response headers arrive
+    with span(f"gemini.{path.rsplit(':', 1)[-1]}", model=path.split(':', 1)[0]):
+        return post_with_retry('gemini', url, GEMINI_TIMEOUT, GEMINI_MAX_RETRIES, retry_rate_limited=False,
+                               headers=headers, json=payload, **kwargs)
@@ -0,0 +1,143 @@
+import contextlib
+import contextvars
+import functools
+import os
+import threading
+import time
+from logging_config import logger
+
+# Set TRACING=1 to also export spans through OpenTelemetry (needs opentelemetry-api
+# and a configured exporter; without them only the logged timings are kept)
+TRACING = os.environ.get('TRACING', '0') == '1'
+
+_tracer = None
+if TRACING:
+    try:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer(__name__)
+    except ImportError:
+        logger.warning("TRACING=1 but opentelemetry is not installed; spans are only logged")
+
+# Firestore operations and timed calls are accumulated per request (webhook
+# call, queued update or scheduler tick) and logged once when it ends, broken
+# down by the command, tool or scheduler step that made them.
+_usage = contextvars.ContextVar('usage', default=None)
+_operation = contextvars.ContextVar('operation', default=None)
+
+# Process-wide Firestore totals, including work outside any request
+_totals = {'reads': 0, 'writes': 0, 'deletes': 0}
+_totals_lock = threading.Lock()
+
+
+class RequestUsage:
+    """Firestore reads/writes/deletes and span timings of one request."""
+
+    def __init__(self, entry_point):
+        self.entry_point = entry_point
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.firestore = {}
+        self.spans = {}
+
+    def add_firestore(self, operation, kind, count, elapsed):
+        with self.lock:
+            counts = self.firestore.setdefault(operation or self.entry_point,
+                                               {'reads': 0, 'writes': 0, 'deletes': 0, 'ms': 0.0})
+            counts[kind] += count
+            counts['ms'] += elapsed * 1000
+
+    def add_span(self, name, elapsed):
+        with self.lock:
+            timing = self.spans.setdefault(name, {'calls': 0, 'ms': 0.0})
+            timing['calls'] += 1
+            timing['ms'] += elapsed * 1000
+
+    def fields(self):
+        """Structured log fields for the request."""
+        with self.lock:
+            by_operation = {name: dict(counts, ms=round(counts['ms'], 1)) for name, counts in self.firestore.items()}
+            spans = {name: dict(timing, ms=round(timing['ms'], 1)) for name, timing in self.spans.items()}
+        total = {kind: sum(counts[kind] for counts in by_operation.values()) for kind in ('reads', 'writes', 'deletes')}
+        return {
+            'entry_point': self.entry_point,
+            'duration_ms': round((time.monotonic() - self.started) * 1000, 1),
+            'firestore': total,
+            'firestore_by_operation': by_operation,
+            'spans': spans,
+        }
+
+
+def record_firestore(kind, count, elapsed):
+    """Account `count` Firestore reads, writes or deletes taking `elapsed` seconds."""
+    if not count and not elapsed:
+        return
+    with _totals_lock:
+        _totals[kind] += count
+    usage = _usage.get()
+    if usage is not None:
+        usage.add_firestore(_operation.get(), kind, count, elapsed)
+
+def firestore_totals():
+    """Firestore reads/writes/deletes made by this process so far."""
+    with _totals_lock:
+        return dict(_totals)
+
+@contextlib.contextmanager
+def track_request(entry_point):
+    """Account the work done inside the block to `entry_point` and log it at the end."""
+    usage = RequestUsage(entry_point)
+    usage_token = _usage.set(usage)
+    operation_token = _operation.set(None)
+    try:
+        yield usage
+    finally:
+        _operation.reset(operation_token)
+        _usage.reset(usage_token)
+        fields = usage.fields()
+        totals = fields['firestore']
+        logger.info(f"{entry_point} used {totals['reads']} Firestore reads, {totals['writes']} writes, "
+                    f"{totals['deletes']} deletes in {fields['duration_ms']} ms", extra={'fields': fields})
+
+def tracked(entry_point):
+    """Decorator form of track_request for function entry points."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track_request(entry_point):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def set_operation(name):
+    """Attribute the rest of the current request to `name` (e.g. a command)."""
+    _operation.set(name)
+
+@contextlib.contextmanager
+def operation(name):
+    """Attribute the Firestore work inside the block to `name` (e.g. a tool call)."""
+    token = _operation.set(name)
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Time an outbound call (Telegram, Gemini); exported as a span with TRACING=1."""
+    started = time.monotonic()
+    try:
+        if _tracer is not None:
+            with _tracer.start_as_current_span(name, attributes=attributes):
+                yield
+        else:
+            yield
+    finally:
+        usage = _usage.get()
+        if usage is not None:
+            usage.add_span(name, time.monotonic() - started)
+
+def propagate_context(func):
+    """Wrap `func` to run in a copy of the caller's context (for thread pool workers)."""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func)
+
@@ -4,14 +4,17 @@ import sys
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
-        return json.dumps({
+        entry = {
             "severity": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
             "module": record.module,
             "function": record.funcName,
             "line": record.lineno
-        })
+        }
+        # Structured fields passed as logger.info(..., extra={'fields': {...}})
+        entry.update(getattr(record, 'fields', None) or {})
+        return json.dumps(entry, default=str)
 
 def setup_logging():
     """Configure structured JSON logging for Cloud Functions."""
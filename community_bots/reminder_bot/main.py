@@ -1,23 +1,52 @@
 import functions_framework
 from cloudevents.http import CloudEvent
 import os
-import random
-from telegram import send_message, parse_command, answer_callback_query
-from reminders import create_reminder, get_reminders, delete_reminder, get_due_reminders, mark_reminder_sent
-from ai_agent import get_chat_response, set_user_system_prompt, set_user_api_exhausted_message, generate_agent_reachout_message
-from setup_handlers import process_setup_callback, start_timezone_setup
-from start_handler import handle_start_command, process_start_callback
-from google.cloud import firestore
 import datetime
-import pytz
-from utils import format_repeat_days
+import time
+from pubsub_client import publish_json, decode_pubsub_event
+from update_queue import publish_update, decode_update_event, register_update_handler
+from instrumentation import tracked, set_operation
 from logging_config import logger
 
-db = firestore.Client()
+# Each Cloud Function loads this module, but only the dependencies of its own
+# entry point are imported (inside the functions below): the scheduler never
+# loads the AI stack, and an async-mode webhook, which only publishes the
+# update, loads neither Firestore nor the Telegram client.
+
+# Stop starting new sends after this many seconds so the tick finishes within
+# the function timeout (60s); anything left over is picked up by the next tick
+SCHEDULER_TICK_BUDGET_S = float(os.environ.get('SCHEDULER_TICK_BUDGET_S', '45'))
+
+# 'sync' processes updates inside the webhook request, 'async' hands them to
+# telegram_update_worker through the updates queue (see update_queue.py)
+WEBHOOK_MODE = os.environ.get('WEBHOOK_MODE', 'sync')
+
+# Number of shards the scheduler splits the due reminders into (1 = no fan-out)
+# and the topic shard messages are published to (the scheduler's own topic)
+SCHEDULER_SHARDS = int(os.environ.get('SCHEDULER_SHARDS', '1'))
+SCHEDULER_TOPIC = os.environ.get('SCHEDULER_TOPIC', 'scheduler-tick')
+
+# Set to 0 when the long-running reminder worker (reminder_worker.py) delivers
+# reminders; scheduler ticks then only run migrations and check-ins
+SCHEDULER_DELIVERS_REMINDERS = os.environ.get('SCHEDULER_DELIVERS_REMINDERS', '1') == '1'
+
+# Time an update may take before Gemini calls are refused with a "try again"
+# reply, within the webhook's 60s function timeout (Telegram redelivers updates
+# that time out)
+UPDATE_TIME_BUDGET_S = float(os.environ.get('UPDATE_TIME_BUDGET_S', '55'))
+
+# Stream AI replies into a placeholder message that is edited as tokens arrive
+GEMINI_STREAMING = os.environ.get('GEMINI_STREAMING', '0') == '1'
 
 @functions_framework.http
+@tracked('telegram_webhook')
 def telegram_webhook(request):
-    """Handle incoming Telegram messages with token authentication."""
+    """Handle incoming Telegram messages with token authentication.
+
+    In async mode (WEBHOOK_MODE=async) the update is only published to the
+    updates topic and acknowledged right away; telegram_update_worker does the
+    actual processing.
+    """
     try:
         # Check webhook authentication token
         expected_token = os.environ.get('WEBHOOK_SECRET')
@@ -32,6 +61,52 @@ def telegram_webhook(request):
         if not update:
             return 'Invalid request', 400
 
+        if WEBHOOK_MODE == 'async':
+            publish_update(update)
+            return 'OK'
+
+        return process_update(update)
+
+    except Exception as e:
+        logger.error(f"Error in telegram_webhook: {e}")
+        return 'Error', 500
+
+@functions_framework.cloud_event
+@tracked('telegram_update_worker')
+def telegram_update_worker(cloud_event: CloudEvent):
+    """Process a Telegram update published to the updates topic by telegram_webhook."""
+    try:
+        update = decode_update_event(cloud_event)
+        logger.debug(f"Processing queued update: {update}")
+        return process_update(update)
+    except Exception as e:
+        logger.error(f"Error in telegram_update_worker: {e}")
+        return 'Error', 500
+
+def process_update(update):
+    """Run command / AI dispatch for a single Telegram update.
+
+    Redeliveries of an already processed update_id are skipped before any work
+    beyond the cheap edited-message and whitelist checks.
+    """
+    from telegram import send_message, parse_command, answer_callback_query
+    from reminders import create_reminder, get_reminders, delete_reminders_bulk
+    from ai_agent import get_chat_response, set_user_system_prompt, set_user_api_exhausted_message
+    from setup_handlers import process_setup_callback, start_timezone_setup
+    from start_handler import handle_start_command, process_start_callback, process_start_message
+    from reachout import reachout_fields_after_ai_message
+    from update_dedup import claim_update, release_update
+    from user_profiles import get_user_profile, set_user_profile, reset_user_profile_cache
+    from streaming import stream_reply
+    from utils import parse_index_list, get_timezone
+    from recurrence import parse_rule, bind_rule, describe_rule, describe_reminder_recurrence
+    from gemini_client import set_request_deadline
+
+    reset_user_profile_cache()
+    set_request_deadline(time.monotonic() + UPDATE_TIME_BUDGET_S)
+    update_id = update.get('update_id')
+    claimed = False
+    try:
         if 'edited_message' in update:
             return 'OK'
 
@@ -53,46 +128,52 @@ def telegram_webhook(request):
                 if str(user_id) not in [uid.strip() for uid in whitelist.split(',')]:
                     return 'OK'
 
+            if not claim_update(update_id):
+                return 'OK'
+            claimed = True
+
             command, args = parse_command(text)
+            set_operation(command or 'ai_message')
 
             if command == '/remind':
-                # /remind <time> <text> [repeat_days]
+                # /remind <time> <text> [repeat]
                 if len(args) < 2:
-                    send_message(chat_id, "Usage: /remind <time> <text> [repeat_days]\nExample: /remind 2026-01-15T09:00:00+00:00 workout 1,3")
+                    send_message(chat_id, "Usage: /remind <time> <text> [repeat]\nExample: /remind 2026-01-15T09:00:00+00:00 workout 1,3\n"
+                                          "repeat: weekday numbers (1=Mon), daily, weekdays, weekends, weekly, monthly "
+                                          "or a rule like FREQ=MONTHLY;BYDAY=-1FR")
                     return 'OK'
 
                 # Debug logging
                 logger.info(f"Remind command args: {args}")
 
                 # Parse arguments - handle repeat at end
-                try:
-                    repeat = [int(x.strip()) for x in args[-1].split(',')]
-                    time_str = args[0]
-                    reminder_text = ' '.join(args[1:-1])
-                except (ValueError, IndexError):
-                    time_str = args[0]
-                    reminder_text = ' '.join(args[1:])
-                    repeat = None
+                rule = None
+                if len(args) > 2:
+                    try:
+                        rule = parse_rule(args[-1])
+                    except ValueError:
+                        rule = None
+                time_str = args[0]
+                reminder_text = ' '.join(args[1:-1] if rule else args[1:])
 
-                logger.info(f"Parsed: time='{time_str}', text='{reminder_text}', repeat={repeat}")
+                logger.info(f"Parsed: time='{time_str}', text='{reminder_text}', rule={rule}")
 
                 try:
                     next_run = datetime.datetime.fromisoformat(time_str)
                     # Don't convert to UTC here - pass the local time directly to create_reminder
                     # create_reminder will handle timezone conversion internally
-                    reminder_id = create_reminder(chat_id, reminder_text, next_run, repeat)
+                    reminder_id = create_reminder(chat_id, reminder_text, next_run, rule=rule)
                     # Get user timezone to display the time correctly
-                    user_doc = db.collection('users').document(str(chat_id)).get()
-                    user_data = user_doc.to_dict() if user_doc.exists else {}
-                    user_tz_str = user_data.get('timezone', 'UTC')
-                    user_tz = pytz.timezone(user_tz_str)
+                    user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+                    user_tz = get_timezone(user_tz_str)
                     
                     if next_run.tzinfo is None:
                         next_run_local = user_tz.localize(next_run)
                     else:
                         next_run_local = next_run.astimezone(user_tz)
                     
-                    send_message(chat_id, f"Reminder set for {next_run_local.strftime('%Y-%m-%d %H:%M')}")
+                    repeat_info = describe_rule(bind_rule(rule, next_run_local)) if rule else ""
+                    send_message(chat_id, f"Reminder set for {next_run_local.strftime('%Y-%m-%d %H:%M')}{repeat_info}")
                     logger.info(f"Reminder created: {reminder_id}")
                 except Exception as e:
                     logger.error(f"Time parsing failed for '{time_str}': {str(e)}")
@@ -100,10 +181,8 @@ def telegram_webhook(request):
 
             elif command == '/list_reminders':
                 # Get user timezone
-                user_doc = db.collection('users').document(str(chat_id)).get()
-                user_data = user_doc.to_dict() if user_doc.exists else {}
-                user_tz_str = user_data.get('timezone', 'UTC')
-                user_tz = pytz.timezone(user_tz_str)
+                user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+                user_tz = get_timezone(user_tz_str)
 
                 reminders = get_reminders(chat_id)
                 if not reminders:
@@ -113,15 +192,15 @@ def telegram_webhook(request):
                     for i, r in enumerate(reminders, 1):
                         # Use the display_time from get_reminders function
                         display_time = r.get('display_time', '')
-                        repeat_info = format_repeat_days(r.get('repeat', []))
+                        repeat_info = describe_reminder_recurrence(r)
                         msg += f"{i}. {r['text']} - {display_time}{repeat_info}\n"
                     send_message(chat_id, msg)
 
             elif command == '/list_commands':
                 commands_msg = """Available commands:
-/remind <time> <text> [repeat_days] - Set a reminder
+/remind <time> <text> [repeat] - Set a reminder
 /list_reminders - List all active reminders
-/delete <reminder_number> - Delete a reminder
+/delete <reminder_numbers> - Delete reminders (e.g. 1 3 5-7)
 /system_prompt <text> - Customize AI personality
 /set_api_exhausted_message <text> - Set custom API exhausted message
 /set_timezone - Set your timezone
@@ -129,8 +208,9 @@ def telegram_webhook(request):
 
 Examples:
 /remind 2026-01-15T09:00:00 workout 1,3
+/remind 2026-01-31T18:00:00 pay rent FREQ=MONTHLY;BYMONTHDAY=-1
 /list_reminders
-/delete 1
+/delete 1 3-4
 /system_prompt You are a fitness coach
 /set_api_exhausted_message Try again later
 /set_timezone"""
@@ -138,16 +218,23 @@ Examples:
 
             elif command == '/delete':
                 if not args:
-                    send_message(chat_id, "Usage: /delete <reminder_number>")
+                    send_message(chat_id, "Usage: /delete <reminder_numbers>\nExample: /delete 1 3 5-7")
                     return 'OK'
                 try:
-                    idx = int(args[0]) - 1
-                    if delete_reminder(chat_id, idx):
-                        send_message(chat_id, "Reminder deleted.")
-                    else:
-                        send_message(chat_id, "Invalid reminder number.")
+                    indices = parse_index_list(args)
                 except ValueError:
                     send_message(chat_id, "Invalid number.")
+                    return 'OK'
+                deleted, invalid = delete_reminders_bulk(chat_id, indices)
+                if len(deleted) == 1:
+                    msg = "Reminder deleted."
+                elif deleted:
+                    msg = f"{len(deleted)} reminders deleted."
+                else:
+                    msg = "Invalid reminder number."
+                if deleted and invalid:
+                    msg += f" No reminder with number {', '.join(str(i) for i in invalid)}."
+                send_message(chat_id, msg)
 
             elif command == '/system_prompt':
                 if not args:
@@ -175,23 +262,27 @@ Examples:
 
             elif command is None:
                 # Check if user is in start setup mode and handle accordingly
-                from start_handler import process_start_message
                 if process_start_message(chat_id, text):
                     return 'OK'
                 
                 # Not a command, treat as natural language message to AI
-                ai_response = get_chat_response(chat_id, text, mode="respond_user")
-                logger.debug(f"Sending AI response to user {chat_id}")
-                result = send_message(chat_id, ai_response)
-                logger.info(f"Message sent to user {chat_id}, result: {result}")
+                if GEMINI_STREAMING:
+                    stream_reply(chat_id, text)
+                else:
+                    ai_response = get_chat_response(chat_id, text, mode="respond_user")
+                    logger.debug(f"Sending AI response to user {chat_id}")
+                    result = send_message(chat_id, ai_response)
+                    logger.info(f"Message sent to user {chat_id}, result: {result}")
                 # Update last AI message timestamp
-                doc_ref = db.collection('users').document(str(chat_id))
-                doc_ref.set({'last_ai_message': firestore.SERVER_TIMESTAMP}, merge=True)
+                set_user_profile(chat_id, reachout_fields_after_ai_message(chat_id))
 
             else:
                 send_message(chat_id, "Unknown command. Use /list_commands to check available commands")
 
         elif 'callback_query' in update:
+            if not claim_update(update_id):
+                return 'OK'
+            claimed = True
             callback_query = update['callback_query']
             chat_id = callback_query['message']['chat']['id']
             callback_data = callback_query['data']
@@ -199,6 +290,7 @@ Examples:
             answer_callback_query(callback_query_id)
             
             # Handle different types of callbacks
+            set_operation(f"callback:{callback_data.split('_', 1)[0]}")
             if callback_data.startswith('start_'):
                 process_start_callback(chat_id, callback_data)
             else:
@@ -208,49 +300,111 @@ Examples:
         return 'OK'
 
     except Exception as e:
-        logger.error(f"Error in telegram_webhook: {e}")
+        logger.error(f"Error processing update: {e}")
+        # Let Telegram's redelivery of this update be processed again
+        if claimed:
+            release_update(update_id)
         return 'Error', 500
 
+def deliver_due_reminders(deadline, shard=0, shard_count=1, send_func=None, due_reminders=None):
+    """Claim, send and reschedule the due reminders of one shard.
+
+    `due_reminders` are snapshots the caller already knows to be due (the
+    long-running worker's, see reminder_worker.py); without them the due
+    query is run. Returns the dispatch stats dict.
+    """
+    from telegram import send_message
+    from reminders import get_due_reminders, claim_due_reminders, commit_sent_reminders, release_reminder_claims
+    from user_profiles import prefetch_user_profiles
+    from dispatch import dispatch_messages
+
+    if send_func is None:
+        send_func = lambda chat_id, doc: send_message(chat_id, f"Reminder: {doc.get('text')}")
+
+    if due_reminders is None:
+        due_reminders = get_due_reminders(shard, shard_count)
+    # Lease the due set so overlapping ticks / parallel instances never double-send
+    due_reminders = claim_due_reminders(due_reminders)
+    # One batched read for every owner instead of one read per reminder
+    prefetch_user_profiles(doc.get('chat_id') for doc in due_reminders)
+
+    # Send concurrently; only delivered (or permanently failed) reminders are
+    # rescheduled, the rest stay due and are retried on the next tick
+    outcomes, stats = dispatch_messages(
+        ((doc.get('chat_id'), doc) for doc in due_reminders),
+        send_func,
+        deadline=deadline,
+    )
+    logger.info(f"Reminder dispatch stats (shard {shard}/{shard_count}): {stats}")
+    for outcome in outcomes:
+        if outcome['status'] != 'sent':
+            logger.warning(f"Reminder {outcome['payload'].id} {outcome['status']}: {outcome['error']}")
+
+    # Reschedule/delete everything that was handled in batched writes
+    handled = [o['payload'] for o in outcomes if o['status'] in ('sent', 'failed')]
+    failed_ids = commit_sent_reminders(handled)
+    if failed_ids:
+        logger.error(f"Could not reschedule {len(failed_ids)} reminders: {failed_ids}")
+    # Reminders left for a retry become claimable again right away
+    release_reminder_claims([o['payload'] for o in outcomes if o['status'] in ('retry', 'skipped')])
+    return stats
+
+def fan_out_shards(shard_count):
+    """Publish one shard message per shard to the scheduler topic."""
+    futures = [publish_json(SCHEDULER_TOPIC, {'shard': shard, 'shards': shard_count}, wait=False)
+               for shard in range(shard_count)]
+    for future in futures:
+        future.result(timeout=30)
+
 @functions_framework.cloud_event
+@tracked('scheduler_tick')
 def scheduler_tick(cloud_event: CloudEvent):
-    """Check for due reminders and send them."""
+    """Check for due reminders and send them.
+
+    A tick from Cloud Scheduler acts as coordinator. With SCHEDULER_SHARDS > 1 it
+    publishes one shard message per shard back to the scheduler topic and each of
+    those invocations (a worker) delivers the reminders of its shard, so peak
+    throughput scales with the scheduler instance count.
+    """
+    from migrations import run_pending_migrations
+    from reachout import run_reachout_pass
+    from user_profiles import reset_user_profile_cache
+
+    tick_started = time.monotonic()
+    reset_user_profile_cache()
     try:
-        due_reminders = get_due_reminders()
-        processed_count = 0
-        for doc in due_reminders:
-            data = doc.to_dict()
-            chat_id = data['chat_id']
-            message_text = f"Reminder: {data['text']}"
-            send_message(chat_id, message_text)
-            # system type not handled here
-
-            mark_reminder_sent(doc.reference)
-            processed_count += 1
-
-        # System reachout check every hour at :00 minutes
-        now = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
-        if now.minute == 0 and 6 <= now.hour < 22:  # Exclude night hours 22:00-06:00 UTC
-            twelve_hours_ago = now - datetime.timedelta(hours=12)
-            users_to_reachout = db.collection('users').where('last_ai_message', '<', twelve_hours_ago).stream()
-            reachout_count = 0
-            for user_doc in users_to_reachout:
-                chat_id = int(user_doc.id)
-
-                # Check if last 3 messages were from AI agent
-                last_messages = db.collection('chat_history').where('chat_id', '==', chat_id).order_by('timestamp', direction=firestore.Query.DESCENDING).limit(3).stream()
-                last_three_from_ai = all(doc.to_dict().get('role') == 'assistant' for doc in last_messages)
-
-                if not last_three_from_ai and random.random() < 0.2:  # 20% probability, but skip if last 3 were from AI
-                    message_text = generate_agent_reachout_message({'text': 'general check-in'}, chat_id, reachout_type='agent_reachout')
-                    send_message(chat_id, message_text)
-                    # Update last AI message timestamp
-                    user_doc.reference.set({'last_ai_message': firestore.SERVER_TIMESTAMP}, merge=True)
-                    reachout_count += 1
-
-            logger.info(f"System reachout: checked users, sent {reachout_count} messages")
-
-        return f"Processed {processed_count} reminders, {reachout_count if 'reachout_count' in locals() else 0} system reachouts"
+        message = decode_pubsub_event(cloud_event) if cloud_event.data else {}
+        if 'shard' in message:
+            set_operation('deliver_reminders')
+            stats = deliver_due_reminders(tick_started + SCHEDULER_TICK_BUDGET_S,
+                                          message['shard'], message['shards'])
+            return f"Processed {stats['sent']} reminders in shard {message['shard']}/{message['shards']}"
+
+        set_operation('deliver_reminders')
+        if not SCHEDULER_DELIVERS_REMINDERS:
+            processed_count = 0
+        elif SCHEDULER_SHARDS > 1:
+            fan_out_shards(SCHEDULER_SHARDS)
+            processed_count = 0
+        else:
+            stats = deliver_due_reminders(tick_started + SCHEDULER_TICK_BUDGET_S)
+            processed_count = stats['sent']
+
+        # System reachouts whose per-user slot is due (spread over the hour,
+        # quiet hours follow each user's timezone)
+        set_operation('reachout')
+        reachout_count = run_reachout_pass(deadline=tick_started + SCHEDULER_TICK_BUDGET_S)
+
+        # Migrations normally run at deploy time (see migrations.py); anything
+        # still pending continues here with the time the tick has left
+        set_operation('migrations')
+        run_pending_migrations(deadline=tick_started + SCHEDULER_TICK_BUDGET_S)
+
+        return f"Processed {processed_count} reminders, {reachout_count} system reachouts"
 
     except Exception as e:
         logger.error(f"Error in scheduler_tick: {e}")
         return 'Error', 500
+
+# Lets the in-process queue backend (local development) run queued updates
+register_update_handler(process_update)
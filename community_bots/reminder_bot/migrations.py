@@ -0,0 +1,106 @@
+"""Data migrations (backfills of fields newer code depends on).
+
+Run them to completion once per deployment (optional_deploy.sh does):
+
+    GOOGLE_CLOUD_PROJECT=my-project python migrations.py
+
+scheduler_tick also runs whatever is still pending, after its deliveries and
+only with the tick's leftover time, so a deployment that skipped the step
+catches up without holding back reminders.
+"""
+import sys
+import time
+from google.cloud import firestore
+from firestore_client import get_db
+from reminders import backfill_next_run_utc, backfill_shard_key
+from reachout import backfill_next_reachout_at
+from logging_config import logger
+
+# Ordered list of (name, collection, backfill). backfill(doc) returns the
+# fields to update on one document, or None if it needs no change, so each
+# migration is safe to re-run.
+MIGRATIONS = [
+    ('reminders_next_run_utc', 'reminders', backfill_next_run_utc),
+    ('reminders_shard_key', 'reminders', backfill_shard_key),
+    ('users_next_reachout_at', 'users', backfill_next_reachout_at),
+]
+
+# Documents read (and at most written, in one batch) per page. The id of the
+# last document of each page is saved in meta/migrations, so a run cut short by
+# its deadline resumes where it stopped instead of rescanning the collection.
+MIGRATION_PAGE_SIZE = 500
+
+# Set once all migrations are known to be applied, so warm instances skip the check
+_migrations_checked = False
+
+def _migrate_page(collection, backfill, cursor):
+    """Apply `backfill` to the page after document id `cursor`.
+
+    Returns (updated, cursor), with cursor None once the collection is done.
+    """
+    query = get_db().collection(collection).order_by('__name__').limit(MIGRATION_PAGE_SIZE)
+    if cursor is not None:
+        query = query.start_after({'__name__': get_db().collection(collection).document(cursor)})
+    docs = list(query.stream())
+
+    batch = get_db().batch()
+    updated = 0
+    for doc in docs:
+        fields = backfill(doc)
+        if fields:
+            batch.update(doc.reference, fields)
+            updated += 1
+    if updated:
+        batch.commit()
+
+    if len(docs) < MIGRATION_PAGE_SIZE:
+        return updated, None
+    return updated, docs[-1].id
+
+def run_pending_migrations(deadline=None):
+    """Apply data migrations that have not been recorded in meta/migrations yet.
+
+    With a `deadline` (a time.monotonic() value) no page is started after it
+    and the rest is left for the next call. Returns True once everything is
+    applied.
+    """
+    global _migrations_checked
+    if _migrations_checked:
+        return True
+
+    doc_ref = get_db().collection('meta').document('migrations')
+    doc = doc_ref.get()
+    state = doc.to_dict() if doc.exists else {}
+    applied = state.get('applied', [])
+    cursors = state.get('cursors', {})
+
+    for name, collection, backfill in MIGRATIONS:
+        if name in applied:
+            continue
+        cursor = cursors.get(name)
+        logger.info(f"Running migration: {name}" + (f" (resuming after {cursor})" if cursor else ""))
+        updated = 0
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                logger.info(f"Migration {name} paused after {cursor}: {updated} documents updated this run")
+                return False
+            page_updated, cursor = _migrate_page(collection, backfill, cursor)
+            updated += page_updated
+            if cursor is None:
+                break
+            doc_ref.set({
+                'cursors': {name: cursor},
+                'updated_at': firestore.SERVER_TIMESTAMP
+            }, merge=True)
+        logger.info(f"Migration {name} done: {updated} documents updated")
+        doc_ref.set({
+            'applied': firestore.ArrayUnion([name]),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        }, merge=True)
+
+    _migrations_checked = True
+    return True
+
+if __name__ == '__main__':
+    run_pending_migrations()
+    sys.exit(0)
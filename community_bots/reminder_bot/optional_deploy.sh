@@ -13,4 +13,56 @@ gcloud firestore indexes composite create \
     --project="$PROJECT_ID" \
     --quiet
 
+# Index: Due reminders (scheduler range query on next_run_utc)
+# A range filter on a single field is served by Firestore's automatic
+# single-field index, so we only make sure it is not exempted.
+echo "   📋 Index: Reminders by next_run_utc"
+gcloud firestore indexes fields update next_run_utc \
+    --collection-group="reminders" \
+    --index=order=ascending \
+    --project="$PROJECT_ID" \
+    --quiet
+
+# Index: Due reminders of one scheduler shard (shard_key IN [...] AND next_run_utc <= now)
+echo "   📋 Index: Reminders by shard_key and next_run_utc"
+gcloud firestore indexes composite create \
+    --collection-group="reminders" \
+    --field-config field-path=shard_key,order=ascending \
+    --field-config field-path=next_run_utc,order=ascending \
+    --project="$PROJECT_ID" \
+    --quiet
+
+# TTL: processed Telegram update ids (webhook dedup) expire automatically
+echo "   📋 TTL: processed_updates.expires_at"
+gcloud firestore fields ttls update expires_at \
+    --collection-group="processed_updates" \
+    --enable-ttl \
+    --project="$PROJECT_ID" \
+    --quiet
+
+# TTL: per-minute Gemini budget counters (GEMINI_BUDGET_BACKEND=firestore)
+echo "   📋 TTL: gemini_budget.expires_at"
+gcloud firestore fields ttls update expires_at \
+    --collection-group="gemini_budget" \
+    --enable-ttl \
+    --project="$PROJECT_ID" \
+    --quiet
+
+# TTL: cached onboarding generations (response_cache.py)
+echo "   📋 TTL: llm_cache.expires_at"
+gcloud firestore fields ttls update expires_at \
+    --collection-group="llm_cache" \
+    --enable-ttl \
+    --project="$PROJECT_ID" \
+    --quiet
+
+# Data migrations (backfills); scheduler_tick finishes them if this is skipped
+echo "   📋 Migrations: backfilling fields of older reminders and users"
+if python3 -c "import google.cloud.firestore" 2>/dev/null; then
+    (cd "$(dirname "$0")" && GOOGLE_CLOUD_PROJECT="$PROJECT_ID" python3 migrations.py) \
+        || echo "   ⚠️ Migrations failed; scheduler_tick will continue them"
+else
+    echo "   ⚠️ google-cloud-firestore is not installed locally; scheduler_tick will run the migrations"
+fi
+
 echo "   ✅ Index deployment commands sent"
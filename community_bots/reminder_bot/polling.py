@@ -0,0 +1,180 @@
+"""Fetch updates with getUpdates long polling instead of receiving a webhook.
+
+For self-hosted deployments and local testing: no public HTTPS endpoint is
+needed. Updates are fetched in batches and handed to main.process_update,
+the same dispatch the webhook uses. Each chat's updates run in order, and
+different chats run concurrently on a worker pool.
+
+    python polling.py                 # updates only
+    python polling.py --reminders     # also deliver reminders (reminder_worker.py)
+
+Starting the poller removes the bot's webhook, since Telegram does not serve
+getUpdates while one is set. Run telegram.set_webhook again to switch back.
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from telegram import get_updates, delete_webhook
+from instrumentation import track_request
+from logging_config import logger
+
+# Seconds a getUpdates call waits for new updates before returning empty
+POLLING_TIMEOUT_S = int(os.environ.get('POLLING_TIMEOUT_S', '30'))
+# Updates fetched per call (Telegram allows 1-100)
+POLLING_BATCH_SIZE = int(os.environ.get('POLLING_BATCH_SIZE', '100'))
+# Chats processed concurrently
+POLLING_WORKERS = int(os.environ.get('POLLING_WORKERS', '8'))
+# Stop fetching while this many updates are waiting to be processed
+POLLING_MAX_PENDING = int(os.environ.get('POLLING_MAX_PENDING', '1000'))
+# Wait before polling again after a failed getUpdates call
+POLLING_ERROR_BACKOFF_S = float(os.environ.get('POLLING_ERROR_BACKOFF_S', '5'))
+
+ALLOWED_UPDATES = ['message', 'edited_message', 'callback_query']
+
+def update_chat_id(update):
+    """Chat an update belongs to (None if it has none)."""
+    if 'callback_query' in update:
+        return update['callback_query'].get('message', {}).get('chat', {}).get('id')
+    for key in ('message', 'edited_message'):
+        if key in update:
+            return update[key].get('chat', {}).get('id')
+    return None
+
+
+class UpdatePoller:
+    """Polls getUpdates and runs `handler` on each update, in order per chat.
+
+    Each chat with work gets a queue and one drain task on the pool, so a
+    slow AI reply holds up only its own chat. Fetched updates are confirmed
+    on the next poll, before they are processed. A stop drains what was
+    already fetched; updates in flight when the process is killed are lost,
+    not redelivered.
+    """
+
+    def __init__(self, handler, workers=POLLING_WORKERS, max_pending=POLLING_MAX_PENDING):
+        self.handler = handler
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.queues = {}
+        self.pending = 0
+        self.offset = None
+        self.stopping = threading.Event()
+        self.stats = {'received': 0, 'processed': 0, 'failed': 0, 'polls': 0}
+
+    def submit(self, updates):
+        """Queue updates behind the earlier ones of their chat."""
+        with self.lock:
+            for update in sorted(updates, key=lambda u: u['update_id']):
+                chat_id = update_chat_id(update)
+                self.pending += 1
+                self.stats['received'] += 1
+                queue = self.queues.get(chat_id)
+                if queue is None:
+                    self.queues[chat_id] = deque([update])
+                    self.pool.submit(self._drain, chat_id)
+                else:
+                    queue.append(update)
+
+    def _drain(self, chat_id):
+        while True:
+            with self.lock:
+                queue = self.queues[chat_id]
+                if not queue:
+                    del self.queues[chat_id]
+                    return
+                update = queue.popleft()
+            ok = self._process(update)
+            with self.lock:
+                self.pending -= 1
+                self.stats['processed' if ok else 'failed'] += 1
+                self.changed.notify_all()
+
+    def _process(self, update):
+        try:
+            with track_request('telegram_polling'):
+                result = self.handler(update)
+        except Exception as e:
+            logger.error(f"Update {update.get('update_id')} failed: {e}")
+            return False
+        if result != 'OK':
+            logger.warning(f"Update {update.get('update_id')} returned {result}")
+            return False
+        return True
+
+    def _wait_for_capacity(self):
+        with self.lock:
+            while self.pending >= self.max_pending and not self.stopping.is_set():
+                self.changed.wait(1.0)
+
+    def poll_once(self, timeout=POLLING_TIMEOUT_S):
+        """Fetch one batch and queue it. Returns the number of updates fetched."""
+        response = get_updates(self.offset, timeout=timeout, limit=POLLING_BATCH_SIZE,
+                               allowed_updates=ALLOWED_UPDATES)
+        with self.lock:
+            self.stats['polls'] += 1
+        if not response.get('ok'):
+            raise RuntimeError(f"getUpdates failed: {response.get('description')}")
+        updates = response.get('result', [])
+        if updates:
+            self.offset = updates[-1]['update_id'] + 1
+            self.submit(updates)
+        return len(updates)
+
+    def run(self):
+        """Poll until stop() is called, then finish the queued updates."""
+        result = delete_webhook()
+        if not result.get('ok'):
+            logger.warning(f"deleteWebhook failed: {result.get('description')}")
+        while not self.stopping.is_set():
+            self._wait_for_capacity()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Polling failed, retrying in {POLLING_ERROR_BACKOFF_S}s: {e}")
+                self.stopping.wait(POLLING_ERROR_BACKOFF_S)
+        self.pool.shutdown(wait=True)
+        logger.info(f"Poller stopped: {self.stats}")
+
+    def stop(self):
+        """Stop after the current poll (which can take up to POLLING_TIMEOUT_S)."""
+        self.stopping.set()
+        with self.lock:
+            self.changed.notify_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', action='store_true', help='also run the reminder worker in this process')
+    args = parser.parse_args()
+
+    from main import process_update
+    poller = UpdatePoller(process_update)
+    stoppables = [poller]
+    worker_thread = None
+    if args.reminders:
+        from reminder_worker import ReminderWorker
+        worker = ReminderWorker()
+        worker_thread = threading.Thread(target=worker.run, daemon=True)
+        worker_thread.start()
+        stoppables.append(worker)
+
+    def stop(signum, frame):
+        for stoppable in stoppables:
+            stoppable.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    logger.info(f"Polling for updates with {POLLING_WORKERS} workers")
+    poller.run()
+    if worker_thread is not None:
+        worker_thread.join(timeout=60)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
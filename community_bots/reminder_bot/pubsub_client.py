@@ -0,0 +1,42 @@
+import base64
+import json
+import os
+import threading
+from logging_config import logger
+
+PUBLISH_TIMEOUT_S = float(os.environ.get('PUBSUB_PUBLISH_TIMEOUT_S', '10'))
+
+# Created on first use and kept for warm invocations
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def _get_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            from google.cloud import pubsub_v1
+            _publisher = pubsub_v1.PublisherClient()
+        return _publisher
+
+def publish_json(topic_name, payload, wait=True):
+    """Publish a JSON payload to a topic in this project.
+
+    Honors PUBSUB_EMULATOR_HOST for local runs. With wait=False the publish
+    future is returned instead of its message id.
+    """
+    publisher = _get_publisher()
+    project_id = os.environ.get('PROJECT_ID') or os.environ.get('GOOGLE_CLOUD_PROJECT')
+    topic_path = publisher.topic_path(project_id, topic_name)
+    future = publisher.publish(topic_path, data=json.dumps(payload).encode('utf-8'))
+    if not wait:
+        return future
+    message_id = future.result(timeout=PUBLISH_TIMEOUT_S)
+    logger.debug(f"Published message {message_id} to {topic_name}")
+    return message_id
+
+def decode_pubsub_event(cloud_event):
+    """Extract the JSON payload from a Pub/Sub CloudEvent."""
+    data = cloud_event.data.get('message', {}).get('data')
+    if not data:
+        return {}
+    return json.loads(base64.b64decode(data).decode('utf-8'))
@@ -0,0 +1,171 @@
+import datetime
+import math
+import os
+import random
+import zlib
+import pytz
+from google.api_core.exceptions import FailedPrecondition
+from google.cloud import firestore
+from firestore_client import get_db
+from telegram import send_message
+from dispatch import dispatch_messages, SendNotAttempted
+from utils import get_timezone
+from user_profiles import get_user_profile, cache_user_profile_snapshot
+from logging_config import logger
+
+# A user becomes eligible for a check-in after this many idle hours...
+REACHOUT_IDLE_HOURS = int(os.environ.get('REACHOUT_IDLE_HOURS', '12'))
+# ...and then gets one with this chance at each hourly slot
+REACHOUT_PROBABILITY = float(os.environ.get('REACHOUT_PROBABILITY', '0.2'))
+# Check-ins only go out between these local hours of the user
+REACHOUT_DAY_START_HOUR = int(os.environ.get('REACHOUT_DAY_START_HOUR', '6'))
+REACHOUT_DAY_END_HOUR = int(os.environ.get('REACHOUT_DAY_END_HOUR', '22'))
+# Most check-ins handled per tick; the rest stay due for the next minute
+REACHOUT_MAX_PER_TICK = int(os.environ.get('REACHOUT_MAX_PER_TICK', '50'))
+# Concurrent Gemini generations + sends
+REACHOUT_WORKERS = int(os.environ.get('REACHOUT_WORKERS', '4'))
+# Check-ins deferred for lack of Gemini budget are retried after this long
+REACHOUT_DEFER_MINUTES = int(os.environ.get('REACHOUT_DEFER_MINUTES', '10'))
+
+def get_reachout_minute(chat_id):
+    """The user's stable minute of the hour for check-ins (spreads load over the hour)."""
+    return zlib.crc32(str(chat_id).encode('utf-8')) % 60
+
+def _next_awake_slot(chat_id, after, user_tz):
+    """First slot strictly after `after` that falls inside the user's local daytime."""
+    candidate = after.replace(minute=get_reachout_minute(chat_id), second=0, microsecond=0)
+    if candidate <= after:
+        candidate += datetime.timedelta(hours=1)
+    for _ in range(48):
+        local_hour = candidate.astimezone(user_tz).hour
+        if REACHOUT_DAY_START_HOUR <= local_hour < REACHOUT_DAY_END_HOUR:
+            return candidate
+        candidate += datetime.timedelta(hours=1)
+    return candidate
+
+def compute_next_reachout_at(chat_id, last_ai_message, tz_name='UTC'):
+    """When the user's next check-in should fire.
+
+    Equivalent to rolling REACHOUT_PROBABILITY at every daytime slot once the
+    user has been idle for REACHOUT_IDLE_HOURS, but the number of slots until
+    the roll succeeds is drawn up front (geometric distribution), so only the
+    users that actually get a check-in are ever touched by the scheduler.
+    """
+    user_tz = get_timezone(tz_name)
+    slot = last_ai_message.astimezone(pytz.UTC) + datetime.timedelta(hours=REACHOUT_IDLE_HOURS)
+    if REACHOUT_PROBABILITY >= 1:
+        skips = 0
+    else:
+        # P(skips = k) = (1 - p)^k * p
+        skips = int(math.log(1.0 - random.random()) / math.log(1.0 - REACHOUT_PROBABILITY))
+    slot = _next_awake_slot(chat_id, slot - datetime.timedelta(minutes=1), user_tz)
+    for _ in range(min(skips, 24 * 30)):
+        slot = _next_awake_slot(chat_id, slot, user_tz)
+    return slot
+
+def reachout_fields_after_ai_message(chat_id, now=None):
+    """Profile fields to write whenever the assistant messages the user."""
+    now = now or datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
+    tz_name = get_user_profile(chat_id).get('timezone', 'UTC')
+    return {
+        'last_ai_message': firestore.SERVER_TIMESTAMP,
+        'next_reachout_at': compute_next_reachout_at(chat_id, now, tz_name)
+    }
+
+def _claim_reachout(user_doc, fields):
+    """Write `fields` only if the user is unchanged since the query read it.
+
+    Returns False when another tick (or a new message) updated the user first.
+    """
+    option = get_db().write_option(last_update_time=user_doc.update_time)
+    try:
+        user_doc.reference.update(fields, option=option)
+    except FailedPrecondition:
+        return False
+    return True
+
+def select_reachout_candidates(now, limit=None):
+    """Claim users whose check-in slot is due, via one indexed query.
+
+    Each due user is rescheduled with a write preconditioned on the update time
+    the query saw, and users whose write fails are skipped, so a check-in is
+    attempted at most once per slot even if ticks overlap. Users whose last 3
+    messages were all from the assistant get no check-in and no new slot until
+    they write again.
+    """
+    limit = REACHOUT_MAX_PER_TICK if limit is None else limit
+    query = (get_db().collection('users')
+             .where('next_reachout_at', '<=', now)
+             .order_by('next_reachout_at')
+             .limit(limit))
+
+    users = list(query.stream())
+    if not users:
+        return []
+    # The AI stack is only loaded by ticks that have check-ins to consider
+    from ai_agent import get_chat_history
+
+    selected = []
+    skipped = 0
+    for user_doc in users:
+        chat_id = int(user_doc.id)
+        cache_user_profile_snapshot(user_doc)
+        last_messages = get_chat_history(chat_id, limit=3)
+        if all(m.get('role') == 'assistant' for m in last_messages):
+            if not _claim_reachout(user_doc, {'next_reachout_at': firestore.DELETE_FIELD}):
+                skipped += 1
+        elif _claim_reachout(user_doc, reachout_fields_after_ai_message(chat_id, now)):
+            selected.append(chat_id)
+        else:
+            skipped += 1
+    if skipped:
+        logger.info(f"System reachout: {skipped} users changed since the query, skipped")
+    # The cached snapshots stay valid for generating the check-ins: only the
+    # scheduling fields changed, and nothing reads them again this tick
+    return selected
+
+def _send_reachout(chat_id, _payload):
+    from ai_agent import generate_agent_reachout_message
+    from gemini_client import GeminiBudgetExceeded
+    try:
+        message_text = generate_agent_reachout_message({'text': 'general check-in'}, chat_id, reachout_type='agent_reachout')
+    except GeminiBudgetExceeded as e:
+        raise SendNotAttempted(str(e)) from e
+    return send_message(chat_id, message_text)
+
+def run_reachout_pass(now=None, deadline=None):
+    """Send AI check-ins to the users whose slot is due. Returns the number sent."""
+    now = now or datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
+    candidates = select_reachout_candidates(now)
+    if not candidates:
+        return 0
+
+    outcomes, stats = dispatch_messages(
+        ((chat_id, None) for chat_id in candidates),
+        _send_reachout,
+        deadline=deadline,
+        workers=REACHOUT_WORKERS,
+    )
+    logger.info(f"System reachout: {len(candidates)} selected, stats: {stats}")
+
+    # Check-ins that yielded to interactive Gemini traffic (or ran out of tick
+    # time) are deferred instead of waiting for their next regular slot
+    deferred = [o['chat_id'] for o in outcomes if o['status'] in ('retry', 'skipped')]
+    if deferred:
+        retry_at = now + datetime.timedelta(minutes=REACHOUT_DEFER_MINUTES)
+        batch = get_db().batch()
+        for chat_id in deferred:
+            batch.update(get_db().collection('users').document(str(chat_id)), {'next_reachout_at': retry_at})
+        batch.commit()
+        logger.info(f"System reachout: deferred {len(deferred)} check-ins to {retry_at.isoformat()}")
+    return stats['sent']
+
+def backfill_next_reachout_at(doc):
+    """Migration step: next_reachout_at for a user who chatted before reachout slots existed.
+
+    Returns the fields to update, or None if the user needs no change.
+    """
+    data = doc.to_dict()
+    if 'next_reachout_at' in data or not data.get('last_ai_message'):
+        return None
+    return {'next_reachout_at': compute_next_reachout_at(int(doc.id), data['last_ai_message'], data.get('timezone', 'UTC'))}
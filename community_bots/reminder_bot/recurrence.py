@@ -0,0 +1,313 @@
+import calendar
+import datetime
+import functools
+from typing import NamedTuple, Optional
+import pytz
+
+# Recurrence rules are stored on reminders as a compact RRULE-like string, e.g.
+#   FREQ=DAILY;INTERVAL=2
+#   FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH
+#   FREQ=MONTHLY;BYMONTHDAY=-1          (last day of the month)
+#   FREQ=MONTHLY;BYDAY=2TU;COUNT=6      (second Tuesday, 6 more times)
+#   FREQ=WEEKLY;BYDAY=FR;UNTIL=20261231
+#   FREQ=DAILY;BYHOUR=9;BYMINUTE=30     (at 09:30 local time)
+# Occurrences are at the rule's wall-clock time in the user's timezone. It is
+# taken from the first occurrence when the reminder is created (see bind_rule)
+# and stored with the rule, so an occurrence moved by a DST gap does not move
+# the ones after it.
+
+DAY_CODES = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+DAY_NAMES = ["Mondays", "Tuesdays", "Wednesdays", "Thursdays", "Fridays", "Saturdays", "Sundays"]
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+WEEKDAYS_MASK = 0b0011111
+WEEKENDS_MASK = 0b1100000
+
+class Recurrence(NamedTuple):
+    freq: str                 # 'DAILY', 'WEEKLY' or 'MONTHLY'
+    interval: int = 1
+    weekdays: int = 0         # bitmask, bit 0 = Monday ... bit 6 = Sunday
+    month_day: int = 0        # MONTHLY on this day of the month (-1 = last day)
+    nth: int = 0              # MONTHLY on the nth `weekdays` day (1-4, -1 = last)
+    count: Optional[int] = None               # occurrences left, including the scheduled one
+    until: Optional[datetime.date] = None     # last local date an occurrence may fall on
+    wall_time: Optional[datetime.time] = None # local time of day of every occurrence
+
+def _lowest_bit(mask):
+    return (mask & -mask).bit_length() - 1
+
+def from_repeat_days(repeat_days):
+    """Rule for the legacy `repeat` list (1=Monday ... 7=Sunday)."""
+    mask = 0
+    for day in repeat_days:
+        if 1 <= day <= 7:
+            mask |= 1 << (day - 1)
+    if not mask:
+        raise ValueError(f"No valid weekdays in {repeat_days}")
+    return Recurrence('WEEKLY', weekdays=mask)
+
+@functools.lru_cache(maxsize=256)
+def _weekly_rule(repeat_days):
+    return from_repeat_days(repeat_days)
+
+def _parse_until(value):
+    # Accepts 20261231, 2026-12-31 and 20261231T235959Z
+    value = value.split('T')[0].replace('-', '')
+    return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+
+def _parse_rrule(text):
+    parts = {}
+    for item in text.upper().removeprefix('RRULE:').split(';'):
+        if not item:
+            continue
+        key, _, value = item.partition('=')
+        parts[key.strip()] = value.strip()
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    interval = int(parts.pop('INTERVAL', '1'))
+    if interval < 1:
+        raise ValueError("INTERVAL must be at least 1")
+
+    weekdays = 0
+    nth = 0
+    by_day = parts.pop('BYDAY', '')
+    if by_day and freq == 'DAILY':
+        raise ValueError("BYDAY needs FREQ=WEEKLY or FREQ=MONTHLY")
+    for code in filter(None, by_day.split(',')):
+        day = code[-2:]
+        if day not in DAY_CODES:
+            raise ValueError(f"Unknown day '{code}'")
+        if code[:-2]:
+            if freq != 'MONTHLY' or nth:
+                raise ValueError("Numbered days (e.g. 2TU) are only supported once, with FREQ=MONTHLY")
+            nth = int(code[:-2])
+            if nth not in (1, 2, 3, 4, -1):
+                raise ValueError("Numbered days must be 1-4 or -1 (last)")
+        weekdays |= 1 << DAY_CODES.index(day)
+    if nth and weekdays & (weekdays - 1):
+        raise ValueError("A numbered day (e.g. 2TU) cannot be combined with other days")
+    if freq == 'MONTHLY' and weekdays and not nth:
+        raise ValueError("FREQ=MONTHLY needs a numbered day (e.g. 1MO) or BYMONTHDAY")
+
+    month_day = int(parts.pop('BYMONTHDAY', '0'))
+    if month_day and (freq != 'MONTHLY' or nth or not (1 <= month_day <= 31 or month_day == -1)):
+        raise ValueError("BYMONTHDAY must be 1-31 or -1 (last day), with FREQ=MONTHLY")
+
+    count = int(parts.pop('COUNT')) if 'COUNT' in parts else None
+    if count is not None and count < 1:
+        raise ValueError("COUNT must be at least 1")
+    until = _parse_until(parts.pop('UNTIL')) if 'UNTIL' in parts else None
+
+    wall_time = None
+    if 'BYHOUR' in parts:
+        try:
+            wall_time = datetime.time(int(parts.pop('BYHOUR')), int(parts.pop('BYMINUTE', '0')),
+                                      int(parts.pop('BYSECOND', '0')))
+        except ValueError:
+            raise ValueError("BYHOUR, BYMINUTE and BYSECOND must be a single time of day (e.g. BYHOUR=9;BYMINUTE=30)")
+    elif 'BYMINUTE' in parts or 'BYSECOND' in parts:
+        raise ValueError("BYMINUTE and BYSECOND need BYHOUR")
+
+    if parts:
+        raise ValueError(f"Unsupported rule parts: {', '.join(parts)}")
+    return Recurrence(freq, interval, weekdays, month_day, nth, count, until, wall_time)
+
+@functools.lru_cache(maxsize=4096)
+def parse_rule(text):
+    """Parse a recurrence given by a user or the AI.
+
+    Accepts an RRULE-style rule (see the top of this module), a legacy weekday
+    list like '1,3,5', or one of: daily, weekdays, weekends, weekly, monthly.
+    Raises ValueError if the text is not a recurrence.
+    """
+    text = text.strip()
+    keyword = text.lower()
+    if keyword == 'daily':
+        return Recurrence('DAILY')
+    if keyword == 'weekdays':
+        return Recurrence('WEEKLY', weekdays=WEEKDAYS_MASK)
+    if keyword == 'weekends':
+        return Recurrence('WEEKLY', weekdays=WEEKENDS_MASK)
+    if keyword == 'weekly':
+        return Recurrence('WEEKLY')
+    if keyword == 'monthly':
+        return Recurrence('MONTHLY')
+    if 'FREQ=' in text.upper():
+        return _parse_rrule(text)
+    return from_repeat_days([int(x) for x in text.split(',')])
+
+def bind_rule(rule, start):
+    """Fill in what a rule leaves implicit from its first occurrence `start`.
+
+    'weekly' repeats on the start's weekday, 'monthly' on its day of the month,
+    and every rule at the start's local time of day. `start` should be the
+    intended local time (e.g. 02:30 even if a DST gap moves that day's
+    occurrence to 03:30).
+    """
+    if rule.freq == 'WEEKLY' and not rule.weekdays:
+        rule = rule._replace(weekdays=1 << start.weekday())
+    if rule.freq == 'MONTHLY' and not rule.nth and not rule.month_day:
+        rule = rule._replace(month_day=start.day)
+    if rule.wall_time is None:
+        rule = rule._replace(wall_time=start.time().replace(tzinfo=None, microsecond=0))
+    return rule
+
+def format_rule(rule):
+    """Canonical string form, as stored in a reminder's `rule` field."""
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.weekdays:
+        prefix = str(rule.nth) if rule.nth else ''
+        parts.append("BYDAY=" + ','.join(prefix + code for i, code in enumerate(DAY_CODES) if rule.weekdays >> i & 1))
+    if rule.month_day:
+        parts.append(f"BYMONTHDAY={rule.month_day}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={rule.until.strftime('%Y%m%d')}")
+    if rule.wall_time is not None:
+        parts.append(f"BYHOUR={rule.wall_time.hour};BYMINUTE={rule.wall_time.minute}")
+        if rule.wall_time.second:
+            parts.append(f"BYSECOND={rule.wall_time.second}")
+    return ';'.join(parts)
+
+def _join(names):
+    if len(names) == 1:
+        return names[0]
+    return f"{', '.join(names[:-1])} and {names[-1]}"
+
+def describe_rule(rule):
+    """Human readable form, e.g. ' (every 2 weeks on Mondays and Fridays)'."""
+    days = [DAY_NAMES[i] for i in range(7) if rule.weekdays >> i & 1]
+    if rule.freq == 'DAILY':
+        text = "repeat daily" if rule.interval == 1 else f"every {rule.interval} days"
+    elif rule.freq == 'WEEKLY':
+        text = f"repeat {_join(days)}" if rule.interval == 1 else f"every {rule.interval} weeks on {_join(days)}"
+    else:
+        if rule.nth:
+            ordinal = {1: 'first', 2: 'second', 3: 'third', 4: 'fourth', -1: 'last'}[rule.nth]
+            day = f"the {ordinal} {days[0][:-1]}"
+        elif rule.month_day == -1:
+            day = "the last day"
+        else:
+            day = f"day {rule.month_day}"
+        text = f"monthly on {day}" if rule.interval == 1 else f"every {rule.interval} months on {day}"
+    if rule.until is not None:
+        text += f" until {rule.until.isoformat()}"
+    if rule.count is not None:
+        text += f", {rule.count} left"
+    return f" ({text})"
+
+def get_reminder_rule(data):
+    """The recurrence of a reminder document, or None for one-time reminders."""
+    if data.get('rule'):
+        return parse_rule(data['rule'])
+    if data.get('repeat'):
+        return _weekly_rule(tuple(data['repeat']))
+    return None
+
+def describe_reminder_recurrence(data):
+    """describe_rule for a reminder document ('' for one-time reminders)."""
+    try:
+        rule = get_reminder_rule(data)
+    except ValueError:
+        return " (invalid repeat rule)"
+    return describe_rule(rule) if rule else ""
+
+def _month_occurrence(rule, year, month):
+    last_day = calendar.monthrange(year, month)[1]
+    if rule.nth:
+        weekday = _lowest_bit(rule.weekdays)
+        if rule.nth > 0:
+            first = datetime.date(year, month, 1)
+            return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + (rule.nth - 1) * 7)
+        last = datetime.date(year, month, last_day)
+        return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+    # Days beyond the end of a short month fall on its last day
+    day = last_day if rule.month_day == -1 else min(rule.month_day, last_day)
+    return datetime.date(year, month, day)
+
+def _first_date_on_or_after(rule, anchor, day):
+    """First date >= `day` on the rule's grid, which is anchored at `anchor` (a date > anchor)."""
+    if rule.freq == 'DAILY':
+        steps = -(-(day - anchor).days // rule.interval)
+        return anchor + datetime.timedelta(days=steps * rule.interval)
+
+    if rule.freq == 'WEEKLY':
+        anchor_monday = anchor - datetime.timedelta(days=anchor.weekday())
+        week, weekday = divmod((day - anchor_monday).days, 7)
+        if week % rule.interval == 0:
+            later_days = rule.weekdays >> weekday
+            if later_days:
+                return day + datetime.timedelta(days=_lowest_bit(later_days))
+            week += rule.interval
+        else:
+            week += rule.interval - week % rule.interval
+        return anchor_monday + datetime.timedelta(days=week * 7 + _lowest_bit(rule.weekdays))
+
+    # MONTHLY: months are counted from the anchor's month
+    months = (day.year - anchor.year) * 12 + day.month - anchor.month
+    months = -(-months // rule.interval) * rule.interval
+    while True:
+        year, month = divmod(anchor.year * 12 + anchor.month - 1 + months, 12)
+        candidate = _month_occurrence(rule, year, month + 1)
+        if candidate >= day:
+            return candidate
+        months += rule.interval
+
+def localize(tz, day, wall_time):
+    """Aware datetime for a local date and time in `tz`.
+
+    Times skipped by a DST change move forward by the gap (02:30 becomes 03:30);
+    repeated times resolve to their second occurrence.
+    """
+    return tz.normalize(tz.localize(datetime.datetime.combine(day, wall_time), is_dst=False))
+
+def next_occurrence(rule, current, tz, now=None):
+    """The first occurrence after both `current` and `now`, or None once the rule has ended.
+
+    `current` is the occurrence that just fired (aware). Occurrences missed
+    while the bot was down are skipped rather than sent in a burst. The result
+    is an aware datetime in `tz` at the rule's wall-clock time, so it stays
+    correct across DST changes. Cost is constant: the date is computed
+    arithmetically from the rule, not by stepping through days.
+    """
+    now = now or datetime.datetime.now(pytz.UTC)
+    current_local = current.astimezone(tz)
+    # Rules stored before wall_time existed take it from the fired occurrence
+    rule = bind_rule(rule, current_local)
+    wall_time = rule.wall_time
+    anchor = current_local.date()
+    after = max(current, now)
+
+    # At most one occurrence per day, so anything after `current` is on a later date
+    day = max(anchor + datetime.timedelta(days=1), after.astimezone(tz).date())
+    day = _first_date_on_or_after(rule, anchor, day)
+    occurrence = localize(tz, day, wall_time)
+    if occurrence <= after:
+        day = _first_date_on_or_after(rule, anchor, day + datetime.timedelta(days=1))
+        occurrence = localize(tz, day, wall_time)
+
+    if rule.until is not None and day > rule.until:
+        return None
+    return occurrence
+
+def advance(rule, current, tz, now=None):
+    """Step a reminder past its fired occurrence.
+
+    Returns (next_occurrence, rule) with COUNT decremented, or (None, None)
+    when the reminder has no further occurrences. The returned rule is bound
+    (see bind_rule), so it keeps its wall-clock time from here on.
+    """
+    rule = bind_rule(rule, current.astimezone(tz))
+    if rule.count is not None:
+        if rule.count <= 1:
+            return None, None
+        rule = rule._replace(count=rule.count - 1)
+    occurrence = next_occurrence(rule, current, tz, now)
+    if occurrence is None:
+        return None, None
+    return occurrence, rule
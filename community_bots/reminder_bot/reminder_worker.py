@@ -0,0 +1,290 @@
+"""Long-running reminder worker for Cloud Run (always-on CPU) or a VM.
+
+Instead of polling for due reminders once a minute, the worker keeps the
+reminders due within the next WORKER_WINDOW_S in an in-memory heap, kept in
+sync by a Firestore snapshot listener, and fires each one within about a
+second of its next_run_utc. Delivery itself is the scheduler's: reminders
+are leased, sent through the dispatcher and rescheduled in the same
+transactions, so the worker can run next to scheduler_tick (or several
+workers next to each other) without double sends.
+
+    python reminder_worker.py
+
+Set SCHEDULER_DELIVERS_REMINDERS=0 on scheduler_tick once the worker runs,
+so ticks stop polling and only run migrations and check-ins.
+"""
+import datetime
+import heapq
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytz
+from firestore_client import get_db
+from instrumentation import record_firestore, track_request
+from reminders import get_shard_keys, REMINDER_LEASE_S
+from logging_config import logger
+
+# Reminders due within this many seconds are held in memory. The listener is
+# renewed halfway through the window; each renewal re-reads the reminders in
+# the window, every other change costs one read per changed reminder.
+WORKER_WINDOW_S = int(os.environ.get('WORKER_WINDOW_S', '3600'))
+# This worker's shard of the reminders (see reminders.get_shard_key); run one
+# worker per shard to split the load
+WORKER_SHARD = int(os.environ.get('WORKER_SHARD', '0'))
+WORKER_SHARDS = int(os.environ.get('WORKER_SHARDS', '1'))
+# Stop starting new sends for a batch after this many seconds; the rest is
+# released and fires again right away
+WORKER_SEND_BUDGET_S = float(os.environ.get('WORKER_SEND_BUDGET_S', '30'))
+# Due reminders are collected for this long before a batch is sent, so a
+# peak (e.g. everything at 09:00) goes out as one dispatch
+WORKER_BATCH_WAIT_S = float(os.environ.get('WORKER_BATCH_WAIT_S', '0.2'))
+
+def _fire_at(data):
+    """Epoch seconds at which a reminder is due, or None if it has no next run.
+
+    A reminder leased by a scheduler instance is not due again before its
+    lease expires; if the lease is released early, the listener sees the
+    change and reschedules it.
+    """
+    next_run_utc = data.get('next_run_utc')
+    if next_run_utc is None:
+        return None
+    fire_at = next_run_utc.timestamp()
+    claimed_until = data.get('claimed_until')
+    if claimed_until is not None:
+        fire_at = max(fire_at, claimed_until.timestamp())
+    return fire_at
+
+
+class ReminderSchedule:
+    """Min-heap of reminder snapshots by due time.
+
+    Updates do not search the heap: the current snapshot of each reminder is
+    kept in `entries` and heap items whose time no longer matches are skipped
+    when they reach the top.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.entries = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+
+    def __len__(self):
+        with self.condition:
+            return len(self.entries)
+
+    def _schedule(self, snapshot):
+        fire_at = _fire_at(snapshot.to_dict() or {})
+        if fire_at is None:
+            self.entries.pop(snapshot.id, None)
+            return
+        self.entries[snapshot.id] = (fire_at, snapshot)
+        heapq.heappush(self.heap, (fire_at, snapshot.id))
+
+    def apply(self, changes):
+        """Apply the changes of a listener snapshot."""
+        with self.condition:
+            for change in changes:
+                if change.type.name == 'REMOVED':
+                    self.entries.pop(change.document.id, None)
+                else:
+                    self._schedule(change.document)
+            self.condition.notify()
+
+    def replace(self, snapshots):
+        """Replace the schedule with the full result of a new listener."""
+        with self.condition:
+            self.heap = []
+            self.entries = {}
+            for snapshot in snapshots:
+                self._schedule(snapshot)
+            self.condition.notify()
+
+    def defer(self, snapshots, fire_at):
+        """Schedule snapshots again at `fire_at`, unless the listener already has newer state."""
+        with self.condition:
+            for snapshot in snapshots:
+                if snapshot.id not in self.entries:
+                    self.entries[snapshot.id] = (fire_at, snapshot)
+                    heapq.heappush(self.heap, (fire_at, snapshot.id))
+            self.condition.notify()
+
+    def _pop_due(self, now):
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, reminder_id = heapq.heappop(self.heap)
+            entry = self.entries.get(reminder_id)
+            if entry is not None and entry[0] == fire_at:
+                del self.entries[reminder_id]
+                due.append(entry[1])
+        return due
+
+    def wait_for_due(self, max_wait):
+        """Block until reminders are due (or `max_wait` passes); returns their snapshots."""
+        deadline = time.time() + max_wait
+        with self.condition:
+            while not self.stopped:
+                now = time.time()
+                due = self._pop_due(now)
+                if due:
+                    return due
+                if now >= deadline:
+                    return []
+                next_at = self.heap[0][0] if self.heap else deadline
+                self.condition.wait(min(next_at, deadline) - now)
+        return []
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+
+class ReminderWorker:
+    """Keeps a ReminderSchedule in sync with Firestore and delivers what falls due."""
+
+    def __init__(self, shard=WORKER_SHARD, shard_count=WORKER_SHARDS, window_s=WORKER_WINDOW_S):
+        self.shard = shard
+        self.shard_count = shard_count
+        # Raises ValueError for shard settings outside 1..REMINDER_SHARD_SPACE
+        self.shard_keys = get_shard_keys(shard, shard_count)
+        self.window_s = window_s
+        self.schedule = ReminderSchedule()
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.watches = {}
+        self.generation = 0
+        self.active_generation = 0
+        self.renew_at = 0.0
+        self.stats = {'sent': 0, 'batches': 0, 'max_lag_s': 0.0, 'listener_reads': 0}
+
+    def _query(self, horizon):
+        query = get_db().collection('reminders').where('next_run_utc', '<=', horizon)
+        if self.shard_count > 1:
+            query = query.where('shard_key', 'in', self.shard_keys)
+        return query
+
+    def _listen(self):
+        """Start a listener for the reminders due before now + window.
+
+        The previous listener keeps feeding the schedule until the new one has
+        delivered its first snapshot, which then replaces the schedule.
+        """
+        horizon = datetime.datetime.now(pytz.UTC) + datetime.timedelta(seconds=self.window_s)
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+
+        def on_snapshot(docs, changes, read_time):
+            # Listener reads are billed per changed document (and per result
+            # of the first snapshot); count them with the rest of the usage
+            record_firestore('reads', len(changes), 0.0)
+            with self.lock:
+                self.stats['listener_reads'] += len(changes)
+                if self.stopping.is_set() or generation < self.active_generation:
+                    return
+                if generation == self.active_generation:
+                    self.schedule.apply(changes)
+                    return
+                self.active_generation = generation
+                self.schedule.replace(docs)
+                stale = [self.watches.pop(g) for g in list(self.watches) if g < generation]
+            logger.info(f"Reminder listener until {horizon.isoformat()}: {len(docs)} reminders scheduled")
+            for watch in stale:
+                watch.unsubscribe()
+
+        watch = self._query(horizon).on_snapshot(on_snapshot)
+        with self.lock:
+            self.watches[generation] = watch
+        self.renew_at = time.time() + self.window_s / 2
+
+    def _deliver(self, due):
+        from main import deliver_due_reminders
+        from user_profiles import reset_user_profile_cache
+
+        now = time.time()
+        lag = max(now - (doc.get('next_run_utc').timestamp()) for doc in due)
+        with track_request('reminder_worker'):
+            reset_user_profile_cache()
+            stats = deliver_due_reminders(time.monotonic() + WORKER_SEND_BUDGET_S, self.shard, self.shard_count,
+                                          due_reminders=due)
+        with self.lock:
+            self.stats['sent'] += stats['sent']
+            self.stats['batches'] += 1
+            self.stats['max_lag_s'] = max(self.stats['max_lag_s'], lag)
+        logger.info(f"Reminder worker fired {len(due)} reminders, {stats['sent']} sent, up to {lag:.1f}s after their time")
+
+    def run(self):
+        """Listen and deliver until stop() is called."""
+        from migrations import run_pending_migrations
+        # The listener query depends on next_run_utc and shard_key being filled in
+        run_pending_migrations()
+        self._listen()
+        while not self.stopping.is_set():
+            if time.time() >= self.renew_at:
+                self._listen()
+            due = self.schedule.wait_for_due(max(0.0, self.renew_at - time.time()))
+            if not due:
+                continue
+            # Let reminders due in the same instant join the batch
+            time.sleep(WORKER_BATCH_WAIT_S)
+            due.extend(self.schedule.wait_for_due(0))
+            try:
+                self._deliver(due)
+            except Exception as e:
+                logger.error(f"Reminder worker failed to deliver {len(due)} reminders: {e}")
+            # Sent reminders come back through the listener (rescheduled or
+            # removed). Anything that did not change, e.g. because its claim
+            # failed, is tried again once a lease would have expired.
+            self.schedule.defer(due, time.time() + REMINDER_LEASE_S)
+        with self.lock:
+            watches, self.watches = list(self.watches.values()), {}
+        for watch in watches:
+            watch.unsubscribe()
+
+    def stop(self):
+        self.stopping.set()
+        self.schedule.stop()
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, scheduled=len(self.schedule), shard=self.shard, shards=self.shard_count)
+
+
+def _serve_health(worker, port):
+    """Answer Cloud Run's health checks (and show the worker's counters)."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(worker.status()).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    worker = ReminderWorker()
+    # Cloud Run sends SIGTERM before stopping an instance
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+    if os.environ.get('PORT'):
+        _serve_health(worker, int(os.environ['PORT']))
+    logger.info(f"Reminder worker started for shard {worker.shard}/{worker.shard_count}")
+    worker.run()
+    logger.info(f"Reminder worker stopped: {worker.status()}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
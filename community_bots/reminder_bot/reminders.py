@@ -1,21 +1,55 @@
 from google.cloud import firestore
+from firestore_client import get_db
 import datetime
+import os
+import socket
+import time
+import uuid
+import zlib
 import pytz
-from dateutil import parser as date_parser
+from user_profiles import get_user_profile
+from utils import get_timezone, parse_iso_datetime
+from recurrence import from_repeat_days, bind_rule, format_rule, get_reminder_rule, advance
+from logging_config import logger
 
-db = firestore.Client()
+# How long a scheduler instance owns the reminders it claimed; must exceed the
+# time a tick spends sending (SCHEDULER_TICK_BUDGET_S in main.py)
+REMINDER_LEASE_S = int(os.environ.get('REMINDER_LEASE_S', '120'))
+SCHEDULER_INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+# Reminders carry shard_key = hash(chat_id) % REMINDER_SHARD_SPACE so the scheduler
+# can fan out by shard. 60 keeps every shard's key list within Firestore's
+# 30-value limit for 'in' filters whenever there are 2 or more shards.
+REMINDER_SHARD_SPACE = 60
+
+def get_shard_key(chat_id):
+    """Stable shard key for a chat (the same on every instance and Python run)."""
+    return zlib.crc32(str(chat_id).encode('utf-8')) % REMINDER_SHARD_SPACE
+
+def get_shard_keys(shard, shard_count):
+    """shard_key values that belong to `shard` out of `shard_count` shards.
+
+    Raises ValueError unless 1 <= shard_count <= REMINDER_SHARD_SPACE, since
+    larger counts would leave some shards without keys.
+    """
+    if not 1 <= shard_count <= REMINDER_SHARD_SPACE:
+        raise ValueError(f"Shard count must be between 1 and {REMINDER_SHARD_SPACE}, got {shard_count}")
+    if not 0 <= shard < shard_count:
+        raise ValueError(f"Shard must be between 0 and {shard_count - 1}, got {shard}")
+    return [key for key in range(REMINDER_SHARD_SPACE) if key % shard_count == shard]
+
+def reminder_fields(text, next_run, repeat, user_tz_str, rule=None):
+    """Fields written when a reminder is created or edited.
+
+    next_run may be an ISO string or a datetime; naive values are taken as the
+    user's local time. The recurrence is `rule` (a recurrence.Recurrence) or
+    a `repeat` weekday list, which is stored as the equivalent rule.
+    """
+    user_tz = get_timezone(user_tz_str)
 
-def create_reminder(chat_id, text, next_run, repeat=None, reminder_id=None):
-    """Create a new reminder or update existing one in Firestore."""
-    # Get user timezone
-    user_doc = db.collection('users').document(str(chat_id)).get()
-    user_data = user_doc.to_dict() if user_doc.exists else {}
-    user_tz_str = user_data.get('timezone', 'UTC')
-    user_tz = pytz.timezone(user_tz_str)
-    
     # Parse and normalize the datetime
     if isinstance(next_run, str):
-        next_run = date_parser.parse(next_run)
+        next_run = parse_iso_datetime(next_run)
     
     if next_run.tzinfo is None:
         # If no timezone info, assume it's in user's local timezone
@@ -23,58 +57,211 @@ def create_reminder(chat_id, text, next_run, repeat=None, reminder_id=None):
     else:
         # Convert to user's timezone
         next_run_local = next_run.astimezone(user_tz)
+
+    if rule is None and repeat:
+        rule = from_repeat_days(repeat)
+
+    return {
+        'text': text,
+        'next_run': next_run_local.isoformat(),
+        'next_run_utc': next_run_local.astimezone(pytz.UTC),
+        'rule': format_rule(bind_rule(rule, next_run_local)) if rule else None,
+        'timezone_hint': user_tz_str  # Store for reference
+    }
+
+def create_reminder(chat_id, text, next_run, repeat=None, reminder_id=None, rule=None):
+    """Create a new reminder or update existing one in Firestore."""
+    # Get user timezone
+    user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+    writes = ReminderWriteBatch(chat_id, user_tz_str)
     
     if reminder_id:
-        doc_ref = db.collection('reminders').document(reminder_id)
-        doc = doc_ref.get()
+        doc = get_db().collection('reminders').document(reminder_id).get()
         if not doc.exists or doc.to_dict().get('chat_id') != chat_id:
             return None
-        update_data = {
-            'text': text,
-            'next_run': next_run_local.isoformat(),
-            'repeat': repeat,
-            'timezone_hint': user_tz_str  # Store for reference
-        }
-        doc_ref.update(update_data)
-        return reminder_id
+        writes.update(reminder_id, text, next_run, repeat, rule)
     else:
-        doc_ref = db.collection('reminders').document()
-        data = {
-            'chat_id': chat_id,
-            'text': text,
-            'next_run': next_run_local.isoformat(),
-            'repeat': repeat,
-            'timezone_hint': user_tz_str,  # Store for reference
+        reminder_id = writes.create(text, next_run, repeat, rule)
+    writes.commit()
+    return reminder_id
+
+class ReminderWriteBatch:
+    """Reminder creates, updates and deletes of one chat, committed together.
+
+    The commit is one transaction that also updates the chat's reminder index
+    (see get_reminders). Callers are responsible for only passing ids of
+    reminders that belong to the chat (e.g. taken from get_reminders).
+    """
+
+    def __init__(self, chat_id, user_tz_str='UTC'):
+        self.chat_id = chat_id
+        self.user_tz_str = user_tz_str
+        self.ops = []
+        self.deleted_ids = set()
+
+    @property
+    def count(self):
+        return len(self.ops)
+
+    def create(self, text, next_run, repeat=None, rule=None):
+        """Stage a new reminder and return its document id."""
+        doc_ref = get_db().collection('reminders').document()
+        fields = reminder_fields(text, next_run, repeat, self.user_tz_str, rule)
+        self.ops.append((self.chat_id, 'set', doc_ref, {
+            'chat_id': self.chat_id,
+            **fields,
+            'shard_key': get_shard_key(self.chat_id),
             'created_at': firestore.SERVER_TIMESTAMP
-        }
-        doc_ref.set(data)
+        }, _index_entry(doc_ref.id, fields)))
         return doc_ref.id
 
+    def update(self, reminder_id, text, next_run, repeat=None, rule=None):
+        fields = reminder_fields(text, next_run, repeat, self.user_tz_str, rule)
+        entry = _index_entry(reminder_id, fields)
+        fields.update({
+            # An edit ends any scheduler lease, so a scheduler still sending the
+            # old version leaves the edited reminder alone (see commit_sent_reminders)
+            'claimed_until': firestore.DELETE_FIELD,
+            'claimed_by': firestore.DELETE_FIELD,
+            # Reminders from before rules existed have a `repeat` weekday list
+            # instead; the edit's rule replaces it
+            'repeat': firestore.DELETE_FIELD
+        })
+        self.ops.append((self.chat_id, 'update', get_db().collection('reminders').document(reminder_id), fields, entry))
+
+    def delete(self, reminder_id):
+        """Stage a delete. Returns False if the reminder is already being deleted."""
+        if reminder_id in self.deleted_ids:
+            return False
+        self.ops.append((self.chat_id, 'delete', get_db().collection('reminders').document(reminder_id), None, None))
+        self.deleted_ids.add(reminder_id)
+        return True
+
+    def commit(self):
+        """Apply the staged writes atomically (no-op when nothing was staged)."""
+        if self.ops:
+            _commit_with_index(get_db().transaction(), self.ops)
+
+# Per-chat reminder index: reminder_index/{chat_id} holds one compact entry per
+# reminder, sorted by next occurrence, so listing and resolving the numbers
+# users see is a single document read. Every reminder write goes through
+# _commit_with_index, which updates the index in the same transaction.
+
+def _index_ref(chat_id):
+    return get_db().collection('reminder_index').document(str(chat_id))
+
+def _index_entry(reminder_id, data):
+    rule = data.get('rule')
+    if not rule and data.get('repeat'):
+        # Reminder from before rules existed
+        try:
+            rule = format_rule(get_reminder_rule(data))
+        except ValueError:
+            rule = None
+    return {
+        'id': reminder_id,
+        'text': data.get('text', ''),
+        'next_run': data.get('next_run'),
+        'next_run_utc': data.get('next_run_utc'),
+        'rule': rule
+    }
+
+_NO_NEXT_RUN = datetime.datetime.max.replace(tzinfo=pytz.UTC)
+
+def _sorted_entries(entries):
+    return sorted(entries, key=lambda e: (e.get('next_run_utc') or _NO_NEXT_RUN, e['id']))
+
+def _query_index_entries(transaction, chat_id):
+    query = get_db().collection('reminders').where('chat_id', '==', chat_id)
+    return {doc.id: _index_entry(doc.id, doc.to_dict()) for doc in query.stream(transaction=transaction)}
+
+def _read_index_entries(transaction, chat_ids):
+    """Index entries keyed by reminder id for each chat (rebuilt from the reminders if missing)."""
+    chats_by_doc_id = {str(chat_id): chat_id for chat_id in chat_ids}
+    indexes = {}
+    for snapshot in transaction.get_all([_index_ref(chat_id) for chat_id in chat_ids]):
+        if snapshot.exists:
+            entries = snapshot.to_dict().get('entries', [])
+            indexes[chats_by_doc_id[snapshot.id]] = {e['id']: e for e in entries}
+    for chat_id in chat_ids:
+        if chat_id not in indexes:
+            indexes[chat_id] = _query_index_entries(transaction, chat_id)
+    return indexes
+
+def _write_index(transaction, chat_id, entries):
+    transaction.set(_index_ref(chat_id), {
+        'chat_id': chat_id,
+        'entries': entries,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    })
+
+@firestore.transactional
+def _commit_with_index(transaction, ops):
+    """Apply reminder writes and the matching index updates in one transaction."""
+    _write_with_index(transaction, ops)
+
+def _write_with_index(transaction, ops):
+    """Stage reminder writes and the matching index updates in `transaction`.
+
+    ops are (chat_id, kind, ref, data, entry) with kind 'set', 'update' or
+    'delete'; entry is the new index entry (None for deletes). Each op plus one
+    write per chat counts towards Firestore's 500 writes per transaction.
+    """
+    chat_ids = list(dict.fromkeys(op[0] for op in ops))
+    indexes = _read_index_entries(transaction, chat_ids)
+
+    for chat_id, kind, ref, data, entry in ops:
+        if kind == 'set':
+            transaction.set(ref, data)
+        elif kind == 'update':
+            transaction.update(ref, data)
+        else:
+            transaction.delete(ref)
+        if entry is None:
+            indexes[chat_id].pop(ref.id, None)
+        else:
+            indexes[chat_id][ref.id] = entry
+
+    for chat_id, entries in indexes.items():
+        _write_index(transaction, chat_id, _sorted_entries(entries.values()))
+
+@firestore.transactional
+def _rebuild_index(transaction, chat_id):
+    entries = _sorted_entries(_query_index_entries(transaction, chat_id).values())
+    _write_index(transaction, chat_id, entries)
+    return entries
+
+def rebuild_reminder_index(chat_id):
+    """Rebuild a chat's reminder index from its reminder documents; returns the entries.
+
+    Missing indexes (chats from before the index existed) are built on first
+    use; this is only needed to repair reminders edited outside the bot.
+    """
+    return _rebuild_index(get_db().transaction(), chat_id)
+
 def get_reminders(chat_id):
-    """Get all active reminders for a chat, optionally filtered by type."""
-    query = db.collection('reminders').where('chat_id', '==', chat_id)
-    docs = query.stream()
+    """Get all active reminders for a chat, ordered by next occurrence.
+
+    Served from the chat's reminder index document, so the numbering shown to
+    the user is stable and costs one read.
+    """
+    snapshot = _index_ref(chat_id).get()
+    if snapshot.exists:
+        entries = snapshot.to_dict().get('entries', [])
+    else:
+        entries = rebuild_reminder_index(chat_id)
     
     # Get user's current timezone
-    user_doc = db.collection('users').document(str(chat_id)).get()
-    user_data = user_doc.to_dict() if user_doc.exists else {}
-    user_tz_str = user_data.get('timezone', 'UTC')
-    user_tz = pytz.timezone(user_tz_str)
+    user_tz_str = get_user_profile(chat_id).get('timezone', 'UTC')
+    user_tz = get_timezone(user_tz_str)
     
     reminders = []
-    for doc in docs:
-        data = doc.to_dict()
+    for entry in entries:
+        data = {'chat_id': chat_id, **entry}
         
         # Convert to user's current timezone for display
-        if 'next_run' in data:
-            next_run_str = data['next_run']
-            next_run = date_parser.parse(next_run_str)
-            
-            # Convert to user's current timezone for display
-            if next_run.tzinfo is None:
-                next_run_local = user_tz.localize(next_run)
-            else:
-                next_run_local = next_run.astimezone(user_tz)
+        if data.get('next_run'):
+            next_run_local = reminder_local_time(data, user_tz)
             
             # Format for display
             formatted_time = next_run_local.strftime('%Y-%m-%d %H:%M')
@@ -83,158 +270,268 @@ def get_reminders(chat_id):
             data['display_time'] = formatted_time
             data['timezone'] = user_tz_str
         
-        reminders.append({'id': doc.id, **data})
+        reminders.append(data)
     
     return reminders
 
 def delete_reminder(chat_id, index):
     """Delete a reminder by its index position in the user's reminder list."""
-    reminders = get_reminders(chat_id)
-    if 0 <= index < len(reminders):
-        reminder_id = reminders[index]['id']
-        return delete_reminder_by_id(chat_id, reminder_id)
-    return False
-
-def delete_reminder_by_id(chat_id, reminder_id):
-    """Delete a reminder by document ID."""
-    doc_ref = db.collection('reminders').document(reminder_id)
-    doc = doc_ref.get()
-    if doc.exists and doc.to_dict()['chat_id'] == chat_id:
-        doc_ref.delete()
-        return True
-    return False
+    deleted, _ = delete_reminders_bulk(chat_id, [index + 1])
+    return bool(deleted)
+
+def delete_reminders_bulk(chat_id, indices, reminders=None, writes=None):
+    """Delete reminders by their 1-based positions in the user's reminder list.
+
+    All indices are resolved against one listing (`reminders`, read with
+    get_reminders when not given), so they mean what the user saw no matter how
+    many are deleted. The deletes are committed in one batch, or only staged in
+    `writes` (a ReminderWriteBatch) when one is passed.
+
+    Returns (deleted, invalid): the deleted reminders and the indices that
+    matched no reminder.
+    """
+    if reminders is None:
+        reminders = get_reminders(chat_id)
+    batch = writes if writes is not None else ReminderWriteBatch(chat_id)
+
+    deleted = []
+    invalid = []
+    for index in indices:
+        if not 1 <= index <= len(reminders):
+            invalid.append(index)
+            continue
+        reminder = reminders[index - 1]
+        if batch.delete(reminder['id']):
+            deleted.append(reminder)
+
+    if writes is None:
+        batch.commit()
+    return deleted, invalid
+
+def get_due_reminders(shard=0, shard_count=1):
+    """Get all reminders that are due (next_run_utc <= now).
+
+    Served by a single range query on the normalized `next_run_utc` field, so the
+    cost grows with the number of due reminders rather than the number stored.
+    Reminders written before the field existed are filled in by
+    `backfill_next_run_utc` (see migrations.py).
 
-def get_due_reminders():
-    """Get all reminders that are due (next_run <= now) with timezone awareness."""
+    With shard_count > 1 only the reminders whose shard_key belongs to `shard`
+    are returned (composite index: shard_key ASC, next_run_utc ASC).
+    """
     now_utc = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
-    due_reminders = []
-    
-    # Get all reminders
-    all_reminders = db.collection('reminders').stream()
-    
-    for doc in all_reminders:
-        data = doc.to_dict()
-        chat_id = data['chat_id']
-        
-        # Get user's current timezone
-        user_doc = db.collection('users').document(str(chat_id)).get()
-        user_data = user_doc.to_dict() if user_doc.exists else {}
-        user_tz_str = user_data.get('timezone', 'UTC')
-        user_tz = pytz.timezone(user_tz_str)
-        
-        # Convert current UTC time to user's local time
-        now_local = now_utc.astimezone(user_tz)
-        
-        # Check if this is a new format reminder (with next_run) or old format
-        if 'next_run' in data:
-            # New format: parse next_run and convert to UTC for comparison
-            next_run_str = data['next_run']
-            next_run = date_parser.parse(next_run_str)
-            
-            # Convert to UTC for comparison (next_run is stored in user's local timezone)
-            if next_run.tzinfo is None:
-                next_run_local = user_tz.localize(next_run)
-            else:
-                next_run_local = next_run.astimezone(user_tz)
-            
-            next_run_utc = next_run_local.astimezone(pytz.UTC)
-            
-            # Check if due
-            if next_run_utc <= now_utc:
-                due_reminders.append(doc)
-        else:
-            # Old format: use existing logic for backward compatibility
-            next_run_str = data['next_run']
-            next_run = date_parser.parse(next_run_str)
-            if next_run.tzinfo is None:
-                next_run = next_run.replace(tzinfo=pytz.UTC)
-            
-            if next_run <= now_utc:
-                due_reminders.append(doc)
-    
-    return due_reminders
+    query = get_db().collection('reminders').where('next_run_utc', '<=', now_utc)
+    if shard_count > 1:
+        query = query.where('shard_key', 'in', get_shard_keys(shard, shard_count))
+    return list(query.stream())
+
+def claim_due_reminders(docs, lease_seconds=None, chunk_size=100):
+    """Lease due reminders to this scheduler instance so each is sent only once.
+
+    Each chunk is claimed in a transaction that re-reads the reminders and sets
+    `claimed_until` / `claimed_by` on those that are still due and not leased by
+    another instance. Overlapping ticks or parallel scheduler instances can
+    therefore work on the same due set without sending anything twice. A lease
+    that is never released (e.g. the instance crashed) expires after
+    `lease_seconds`, after which the reminder is picked up again.
+
+    Returns the snapshots of the reminders claimed by this call.
+    """
+    lease_seconds = REMINDER_LEASE_S if lease_seconds is None else lease_seconds
+    now_utc = datetime.datetime.utcnow().replace(tzinfo=pytz.UTC)
+    lease_until = now_utc + datetime.timedelta(seconds=lease_seconds)
+
+    claimed = []
+    for start in range(0, len(docs), chunk_size):
+        refs = [doc.reference for doc in docs[start:start + chunk_size]]
+        try:
+            claimed.extend(_claim_chunk(get_db().transaction(), refs, now_utc, lease_until))
+        except Exception as e:
+            logger.error(f"Failed to claim {len(refs)} due reminders: {e}")
+    return claimed
+
+@firestore.transactional
+def _claim_chunk(transaction, refs, now_utc, lease_until):
+    claimed = []
+    for snapshot in transaction.get_all(refs):
+        if not snapshot.exists:
+            continue
+        data = snapshot.to_dict()
+        next_run_utc = data.get('next_run_utc')
+        claimed_until = data.get('claimed_until')
+        if next_run_utc is None or next_run_utc > now_utc:
+            continue
+        if claimed_until is not None and claimed_until > now_utc:
+            continue
+        transaction.update(snapshot.reference, {
+            'claimed_until': lease_until,
+            'claimed_by': SCHEDULER_INSTANCE_ID
+        })
+        claimed.append(snapshot)
+    return claimed
 
-def get_next_weekday(last_run_dt, repeat_days):
+def release_reminder_claims(docs):
+    """Drop the lease on reminders that were claimed but not handled this tick."""
+    for start in range(0, len(docs), 500):
+        batch = get_db().batch()
+        for doc in docs[start:start + 500]:
+            batch.update(doc.reference, {
+                'claimed_until': firestore.DELETE_FIELD,
+                'claimed_by': firestore.DELETE_FIELD
+            })
+        try:
+            batch.commit()
+        except Exception as e:
+            # Leases expire on their own, this only delays the retry
+            logger.warning(f"Failed to release reminder claims: {e}")
+
+def reminder_local_time(data, user_tz):
+    """A reminder's next run as an aware datetime in the user's timezone.
+
+    Uses the stored next_run_utc timestamp when present (the same instant as
+    next_run), so the string is only parsed for reminders that predate it.
     """
-    Calculate the next occurrence based on repeat days (1=Monday, ..., 7=Sunday).
-    last_run_dt: The datetime when the reminder was originally supposed to run.
+    next_run_utc = data.get('next_run_utc')
+    if next_run_utc is not None:
+        return next_run_utc.astimezone(user_tz)
+    next_run = parse_iso_datetime(data['next_run'])
+    if next_run.tzinfo is None:
+        return user_tz.localize(next_run)
+    return next_run.astimezone(user_tz)
+
+def compute_next_run_utc(next_run_str, user_tz):
+    """Convert a stored next_run ISO string to an aware UTC datetime.
+
+    Strings without an offset are interpreted in the user's timezone.
     """
-    if not repeat_days:
-        return last_run_dt
+    next_run = parse_iso_datetime(next_run_str)
+    if next_run.tzinfo is None:
+        next_run = user_tz.localize(next_run)
+    return next_run.astimezone(pytz.UTC)
 
-    # Convert 1-7 (ISO) to 0-6 (Python)
-    target_weekdays = sorted([(d - 1) for d in repeat_days])
-    
-    # Use current date as starting point if last_run_dt is in the past
-    # This prevents setting future reminders in the past when reminders are triggered late
-    today = datetime.datetime.now(last_run_dt.tzinfo).date()
-    last_run_date = last_run_dt.date()
-    
-    if last_run_date < today:
-        # Reminder is being triggered late, use today as starting point
-        start_date = today
-    else:
-        # Reminder is on time or in future, use original date
-        start_date = last_run_date
-    
-    current_wd = start_date.weekday()
-
-    days_ahead = None
-    # Look for the next day later this week
-    for wd in target_weekdays:
-        if wd > current_wd:
-            days_ahead = wd - current_wd
-            break
-    
-    # If no days left this week, take the first day of next week
-    if days_ahead is None:
-        days_ahead = (7 - current_wd) + target_weekdays[0]
-
-    # Create new datetime with the calculated date but preserve time and timezone
-    next_date = start_date + datetime.timedelta(days=days_ahead)
-    return datetime.datetime.combine(
-        next_date, 
-        last_run_dt.time(),
-        tzinfo=last_run_dt.tzinfo
-    )
-
-def mark_reminder_sent(reminder_ref):
-    """Mark reminder as sent and schedule next run if recurring."""
-    doc = reminder_ref.get()
-    if not doc.exists:
-        return
-        
+def backfill_next_run_utc(doc):
+    """Migration step: `next_run_utc` for a reminder created before the field existed.
+
+    Returns the fields to update, or None if the reminder needs no change.
+    """
     data = doc.to_dict()
-    chat_id = data['chat_id']
-    repeat = data.get('repeat')
-    
-    # --- IMPORTANT: Re-add your follow-up logic here ---
-    # (If you still want the AI check-ins we discussed earlier)
-
-    if repeat and len(repeat) > 0:
-        # Get user's current timezone
-        user_doc = db.collection('users').document(str(chat_id)).get()
-        user_data = user_doc.to_dict() if user_doc.exists else {}
-        user_tz_str = user_data.get('timezone', 'UTC')
-        user_tz = pytz.timezone(user_tz_str)
-        
-        # Parse the stored next_run
-        next_run_str = data['next_run']
-        next_run = date_parser.parse(next_run_str)
-        
-        # Convert to user's current timezone
-        if next_run.tzinfo is None:
-            next_run_local = user_tz.localize(next_run)
+    if 'next_run_utc' in data or 'next_run' not in data:
+        return None
+    user_tz = get_timezone(get_user_profile(data['chat_id']).get('timezone', 'UTC'))
+    try:
+        return {'next_run_utc': compute_next_run_utc(data['next_run'], user_tz)}
+    except (ValueError, OverflowError):
+        return None
+
+def backfill_shard_key(doc):
+    """Migration step: `shard_key` for a reminder created before sharding existed."""
+    data = doc.to_dict()
+    if 'shard_key' in data:
+        return None
+    return {'shard_key': get_shard_key(data['chat_id'])}
+
+def compute_reminder_after_send(data, now=None):
+    """Compute the fields to update once a reminder has fired.
+
+    Returns None for one-time reminders and for recurrences that have ended,
+    which should be deleted instead. Occurrences missed while the scheduler
+    was down are skipped, so a late reminder is sent once, not once per miss.
+    """
+    rule = get_reminder_rule(data)
+    if rule is None:
+        return None
+
+    # Get user's current timezone
+    user_tz_str = get_user_profile(data['chat_id']).get('timezone', 'UTC')
+    user_tz = get_timezone(user_tz_str)
+
+    # The stored next run in the user's current timezone
+    next_run_local = reminder_local_time(data, user_tz)
+
+    # Calculate next occurrence in local timezone
+    next_run_local, rule = advance(rule, next_run_local, user_tz, now)
+    if next_run_local is None:
+        return None
+
+    return {
+        'next_run': next_run_local.isoformat(),
+        'next_run_utc': next_run_local.astimezone(pytz.UTC),
+        'rule': format_rule(rule),
+        # Release the scheduler lease (see claim_due_reminders)
+        'claimed_until': firestore.DELETE_FIELD,
+        'claimed_by': firestore.DELETE_FIELD
+    }
+
+def _sent_reminder_op(doc):
+    """Index-aware write op rescheduling (or deleting) a reminder that fired."""
+    data = doc.to_dict()
+    try:
+        update_data = compute_reminder_after_send(data)
+    except (ValueError, OverflowError) as e:
+        # Keep the reminder (the user can still see and fix it) but take it off
+        # the schedule; a null next_run_utc matches no due query
+        logger.error(f"Cannot reschedule reminder {doc.id}, disabling it: {e}")
+        update_data = {
+            'next_run_utc': None,
+            'claimed_until': firestore.DELETE_FIELD,
+            'claimed_by': firestore.DELETE_FIELD
+        }
+    if update_data:
+        return (data['chat_id'], 'update', doc.reference, update_data, _index_entry(doc.id, {**data, **update_data}))
+    # One-time reminder
+    return (data['chat_id'], 'delete', doc.reference, None, None)
+
+def commit_sent_reminders(docs, chunk_size=250, max_attempts=3):
+    """Reschedule or delete fired reminders, together with their reminder indexes.
+
+    Each chunk of up to `chunk_size` reminders (plus one index write per chat,
+    within Firestore's 500 writes) is one transaction that re-reads the
+    reminders and computes their next run from the current data. Reminders
+    no longer leased to this instance are left alone: deleted ones, edited
+    ones (an edit drops the lease) and ones whose lease expired and was taken
+    over. A failed chunk is retried with backoff; if it still fails, its
+    reminders are committed one by one so a single bad document does not hold
+    back the others.
+
+    Returns the ids of reminders whose post-send write could not be applied.
+    """
+    refs = [doc.reference for doc in docs]
+
+    failed_ids = []
+    for start in range(0, len(refs), chunk_size):
+        chunk = refs[start:start + chunk_size]
+        for attempt in range(1, max_attempts + 1):
+            try:
+                _commit_sent_chunk(get_db().transaction(), chunk)
+                break
+            except Exception as e:
+                logger.warning(f"Reminder batch commit failed (attempt {attempt}/{max_attempts}): {e}")
+                if attempt < max_attempts:
+                    time.sleep(0.5 * 2 ** (attempt - 1))
         else:
-            next_run_local = next_run.astimezone(user_tz)
-        
-        # Calculate next occurrence in local timezone
-        next_run_local = get_next_weekday(next_run_local, repeat)
-        
-        reminder_ref.update({
-            'next_run': next_run_local.isoformat(),
-            'repeat': repeat
-        })
-    else:
-        # One-time reminder
-        reminder_ref.delete()
+            failed_ids.extend(_commit_sent_individually(chunk))
+
+    return failed_ids
+
+@firestore.transactional
+def _commit_sent_chunk(transaction, refs):
+    ops = []
+    for snapshot in transaction.get_all(refs):
+        data = snapshot.to_dict() if snapshot.exists else None
+        if data is None or data.get('claimed_by') != SCHEDULER_INSTANCE_ID:
+            logger.info(f"Reminder {snapshot.id} was deleted, edited or re-leased while it was sent; not rescheduling it")
+            continue
+        ops.append(_sent_reminder_op(snapshot))
+    if ops:
+        _write_with_index(transaction, ops)
+
+def _commit_sent_individually(refs):
+    """Fallback for a chunk that keeps failing; returns ids that still failed."""
+    failed_ids = []
+    for ref in refs:
+        try:
+            _commit_sent_chunk(get_db().transaction(), [ref])
+        except Exception as e:
+            logger.error(f"Failed to reschedule reminder {ref.id}: {e}")
+            failed_ids.append(ref.id)
+    return failed_ids
@@ -0,0 +1,73 @@
+import datetime
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from google.cloud import firestore
+from firestore_client import get_db
+from logging_config import logger
+
+# Cached generations expire after this long (Firestore TTL policy on expires_at)
+RESPONSE_CACHE_TTL_S = int(os.environ.get('RESPONSE_CACHE_TTL_S', str(7 * 24 * 3600)))
+# Entries kept in the in-process tier (least recently used are evicted first)
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '256'))
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+
+def normalize_prompt(prompt):
+    """Collapse whitespace and case so trivially different prompts share an entry."""
+    return ' '.join(prompt.split()).casefold()
+
+def make_cache_key(mode, model, prompt):
+    """Content-addressed key for a generation."""
+    material = '\0'.join([mode, model, normalize_prompt(prompt)])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def _remember(key, text, expires_at):
+    with _lock:
+        _memory_cache[key] = (text, expires_at)
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > RESPONSE_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+def get_cached_response(key):
+    """Return a cached generation or None, checking memory first, then Firestore."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with _lock:
+        entry = _memory_cache.get(key)
+        if entry is not None:
+            text, expires_at = entry
+            if expires_at > now:
+                _memory_cache.move_to_end(key)
+                return text
+            del _memory_cache[key]
+
+    try:
+        doc = get_db().collection('llm_cache').document(key).get()
+    except Exception as e:
+        logger.warning(f"Response cache read failed: {e}")
+        return None
+    if not doc.exists:
+        return None
+    data = doc.to_dict()
+    # TTL deletion is lazy, so expired docs may still be around
+    if data['expires_at'] <= now:
+        return None
+    _remember(key, data['text'], data['expires_at'])
+    return data['text']
+
+def store_cached_response(key, text, mode, model):
+    """Save a generation in both tiers."""
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=RESPONSE_CACHE_TTL_S)
+    _remember(key, text, expires_at)
+    try:
+        get_db().collection('llm_cache').document(key).set({
+            'text': text,
+            'mode': mode,
+            'model': model,
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'expires_at': expires_at
+        })
+    except Exception as e:
+        logger.warning(f"Response cache write failed: {e}")
@@ -1,8 +1,7 @@
 import pytz
 from telegram import send_message
 from google.cloud import firestore
-
-db = firestore.Client()
+from user_profiles import get_user_profile, set_user_profile
 
 # Group timezones by region
 def get_timezone_regions():
@@ -62,21 +61,15 @@ TIMEZONE_SETUP_FLOW = {
 
 def get_user_setup_state(chat_id):
     """Get current setup state for user."""
-    doc = db.collection('users').document(str(chat_id)).get()
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get('setup_state', {})
-    return {}
+    return get_user_profile(chat_id).get('setup_state', {})
 
 def set_user_setup_state(chat_id, state):
     """Set setup state for user."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({'setup_state': state}, merge=True)
+    set_user_profile(chat_id, {'setup_state': state})
 
 def clear_user_setup_state(chat_id):
     """Clear setup state for user."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.update({'setup_state': firestore.DELETE_FIELD})
+    set_user_profile(chat_id, {'setup_state': firestore.DELETE_FIELD})
 
 def process_setup_callback(chat_id, callback_data):
     """Process callback query for setup flows."""
@@ -102,8 +95,7 @@ def send_timezone_options(chat_id, region):
 
 def save_timezone(chat_id, timezone):
     """Save selected timezone for user."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({'timezone': timezone}, merge=True)
+    set_user_profile(chat_id, {'timezone': timezone})
     
     # Check if this was part of start setup flow
     state = get_user_setup_state(chat_id)
@@ -1,10 +1,9 @@
 from telegram import send_message
 from google.cloud import firestore
+from user_profiles import get_user_profile, set_user_profile
 from ai_agent import set_user_system_prompt, set_user_api_exhausted_message, generate_api_exhausted_message, generate_welcome_message
 from setup_handlers import start_timezone_setup
 
-db = firestore.Client()
-
 # Setup flow states
 SETUP_STATES = {
     'start_mode': 'start_mode',
@@ -14,21 +13,15 @@ SETUP_STATES = {
 
 def get_user_setup_state(chat_id):
     """Get current setup state for user."""
-    doc = db.collection('users').document(str(chat_id)).get()
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get('setup_state', {})
-    return {}
+    return get_user_profile(chat_id).get('setup_state', {})
 
 def set_user_setup_state(chat_id, state):
     """Set setup state for user."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.set({'setup_state': state}, merge=True)
+    set_user_profile(chat_id, {'setup_state': state})
 
 def clear_user_setup_state(chat_id):
     """Clear setup state for user."""
-    doc_ref = db.collection('users').document(str(chat_id))
-    doc_ref.update({'setup_state': firestore.DELETE_FIELD})
+    set_user_profile(chat_id, {'setup_state': firestore.DELETE_FIELD})
 
 def handle_start_command(chat_id):
     """Handle /start command - initiate setup mode."""
@@ -148,11 +141,7 @@ def handle_timezone_setup_complete(chat_id):
 
 def get_user_timezone(chat_id):
     """Get user's timezone from Firestore."""
-    doc = db.collection('users').document(str(chat_id)).get()
-    if doc.exists:
-        data = doc.to_dict()
-        return data.get('timezone', 'UTC')
-    return 'UTC'
+    return get_user_profile(chat_id).get('timezone', 'UTC')
 
 def process_start_message(chat_id, message_text):
     """Process text messages during start setup flow."""
@@ -0,0 +1,88 @@
+import os
+import time
+from telegram import send_message, edit_message_text
+from ai_agent import stream_chat_response
+from logging_config import logger
+
+# Minimum seconds between edits of a streamed reply (Telegram throttles
+# frequent edits of the same message)
+STREAM_EDIT_INTERVAL_S = float(os.environ.get('STREAM_EDIT_INTERVAL_S', '1.0'))
+# Shown until the first tokens arrive
+STREAM_PLACEHOLDER = os.environ.get('STREAM_PLACEHOLDER', '…')
+# Telegram message size limit used by send_message
+MESSAGE_CHUNK_SIZE = 4000
+
+class StreamingMessage:
+    """A Telegram message edited in place while a reply is being generated."""
+
+    def __init__(self, chat_id, interval=None):
+        self.chat_id = chat_id
+        self.interval = STREAM_EDIT_INTERVAL_S if interval is None else interval
+        self.message_id = None
+        self.shown_text = None
+        self.last_edit = 0.0
+        self.edits = 0
+
+    def start(self):
+        """Send the placeholder. Returns False if it could not be sent."""
+        results = send_message(self.chat_id, STREAM_PLACEHOLDER)
+        if results and results[0].get('ok'):
+            self.message_id = results[0]['result']['message_id']
+            self.shown_text = STREAM_PLACEHOLDER
+            self.last_edit = time.monotonic()
+            return True
+        logger.warning(f"Could not send placeholder to {self.chat_id}: {results}")
+        return False
+
+    def _edit(self, text):
+        if self.message_id is None or text == self.shown_text:
+            return
+        result = edit_message_text(self.chat_id, self.message_id, text)
+        if not result.get('ok'):
+            logger.warning(f"Editing streamed message for {self.chat_id} failed: {result}")
+            return
+        self.shown_text = text
+        self.last_edit = time.monotonic()
+        self.edits += 1
+
+    def update(self, text):
+        """Show the partial reply: the first tokens right away, then at most once per interval."""
+        if not text.strip():
+            return
+        if self.edits and time.monotonic() - self.last_edit < self.interval:
+            return
+        # While streaming only the first message worth of text is shown
+        self._edit(text[:MESSAGE_CHUNK_SIZE])
+
+    def finish(self, text):
+        """Show the complete reply, sending any overflow as follow-up messages."""
+        if self.message_id is None:
+            return send_message(self.chat_id, text)
+        if not text:
+            text = "Sorry, I didn't get a response."
+        self._edit(text[:MESSAGE_CHUNK_SIZE])
+        if len(text) > MESSAGE_CHUNK_SIZE:
+            return send_message(self.chat_id, text[MESSAGE_CHUNK_SIZE:])
+        return []
+
+def stream_reply(chat_id, text):
+    """Answer a user message with a streamed AI reply. Returns the reply text."""
+    started = time.monotonic()
+    message = StreamingMessage(chat_id)
+    message.start()
+
+    first_token_at = None
+
+    def on_text(partial):
+        nonlocal first_token_at
+        if first_token_at is None:
+            first_token_at = time.monotonic() - started
+        message.update(partial)
+
+    ai_response = stream_chat_response(chat_id, text, on_text)
+    message.finish(ai_response)
+
+    first_token = f"{first_token_at:.2f}s" if first_token_at is not None else "n/a"
+    logger.info(f"Streamed reply to {chat_id}: first token {first_token}, "
+                f"total {time.monotonic() - started:.2f}s, {message.edits} edits")
+    return ai_response
@@ -1,5 +1,5 @@
-import requests
 import os
+from http_client import telegram_post, TELEGRAM_TIMEOUT
 from logging_config import logger
 
 def get_bot_token():
@@ -18,7 +18,6 @@ def send_message(chat_id, text, bot_token=None, reply_markup=None):
 
     results = []
     for msg in messages:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
         payload = {
             "chat_id": chat_id,
             "text": msg,
@@ -27,23 +26,66 @@ def send_message(chat_id, text, bot_token=None, reply_markup=None):
             payload["parse_mode"] = parse_mode
         if reply_markup:
             payload["reply_markup"] = reply_markup
-        response = requests.post(url, json=payload)
+        response = telegram_post("sendMessage", payload, bot_token)
         logger.debug(f"Telegram API response status: {response.status_code}")
         logger.debug(f"Telegram API response body: {response.json()}")
         results.append(response.json())
 
     return results
 
+def edit_message_text(chat_id, message_id, text, bot_token=None):
+    """Replace the text of a message the bot sent earlier."""
+    if bot_token is None:
+        bot_token = get_bot_token()
+
+    payload = {
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "text": text
+    }
+    response = telegram_post("editMessageText", payload, bot_token)
+    logger.debug(f"Telegram editMessageText response status: {response.status_code}")
+    return response.json()
+
 def set_webhook(url, bot_token=None):
     """Set Telegram webhook URL."""
     if bot_token is None:
         bot_token = get_bot_token()
 
-    webhook_url = f"https://api.telegram.org/bot{bot_token}/setWebhook"
     payload = {
         "url": url
     }
-    response = requests.post(webhook_url, json=payload)
+    response = telegram_post("setWebhook", payload, bot_token)
+    return response.json()
+
+def delete_webhook(bot_token=None):
+    """Remove the webhook so updates can be fetched with getUpdates."""
+    if bot_token is None:
+        bot_token = get_bot_token()
+
+    response = telegram_post("deleteWebhook", {}, bot_token)
+    return response.json()
+
+def get_updates(offset=None, timeout=30, limit=100, allowed_updates=None, bot_token=None):
+    """Long-poll for updates; waits up to `timeout` seconds for the first one.
+
+    Passing `offset` confirms every update with a lower update_id, which
+    Telegram then stops returning.
+    """
+    if bot_token is None:
+        bot_token = get_bot_token()
+
+    payload = {
+        "timeout": timeout,
+        "limit": limit
+    }
+    if offset is not None:
+        payload["offset"] = offset
+    if allowed_updates is not None:
+        payload["allowed_updates"] = allowed_updates
+    # The request stays open for the whole poll, so the read timeout must outlast it
+    http_timeout = (TELEGRAM_TIMEOUT[0], timeout + TELEGRAM_TIMEOUT[1])
+    response = telegram_post("getUpdates", payload, bot_token, timeout=http_timeout)
     return response.json()
 
 def answer_callback_query(callback_query_id, text=None, bot_token=None):
@@ -51,13 +93,12 @@ def answer_callback_query(callback_query_id, text=None, bot_token=None):
     if bot_token is None:
         bot_token = get_bot_token()
 
-    url = f"https://api.telegram.org/bot{bot_token}/answerCallbackQuery"
     payload = {
         "callback_query_id": callback_query_id
     }
     if text:
         payload["text"] = text
-    response = requests.post(url, json=payload)
+    response = telegram_post("answerCallbackQuery", payload, bot_token)
     return response.json()
 
 def parse_command(text):
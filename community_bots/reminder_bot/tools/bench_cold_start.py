@@ -0,0 +1,130 @@
+"""Measure cold-start time: interpreter start, import of main.py, first response.
+
+Every run is a fresh Python process (like a new function instance). It loads
+the entry point through functions_framework and sends it a single request,
+timing each phase. The requests go to the Firestore emulator and to the stub
+Telegram/Gemini servers from stub_servers.py. Each phase is reported as
+median and p90 over --runs, together with the heavy modules the entry point
+ended up loading.
+
+    export FIRESTORE_EMULATOR_HOST=localhost:8081 GOOGLE_CLOUD_PROJECT=demo-reminder-bot
+    python tools/bench_cold_start.py --target scheduler_tick --runs 20
+    python tools/bench_cold_start.py --target telegram_webhook --text "How should I train today?"
+
+With --source pointing at another checkout of the bot (e.g. a git worktree of
+an older commit), the same measurement is taken for that code, for a
+before/after comparison.
+"""
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+BOT_DIR = os.path.dirname(TOOLS_DIR)
+
+# Reported when loaded, to show what each entry point pulls in
+WATCHED_MODULES = ['google.cloud.firestore', 'requests', 'pytz', 'dateutil.parser',
+                   'ai_agent', 'reminders', 'reachout', 'streaming']
+
+
+def run_child(args):
+    """One cold start; prints its timings as a RESULT line."""
+    process_started = time.time()
+    sys.path.insert(0, args.source)
+    sys.path.insert(0, TOOLS_DIR)
+    from stub_servers import start_stub_servers
+    telegram, gemini = start_stub_servers()
+    os.environ['TELEGRAM_API_BASE'] = f"http://127.0.0.1:{telegram.server_port}"
+    os.environ['GEMINI_API_BASE'] = f"http://127.0.0.1:{gemini.server_port}"
+    os.environ['WEBHOOK_SECRET'] = 'bench'
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'bench')
+    os.environ.setdefault('GEMINI_API_KEY', 'bench')
+    os.environ['WEBHOOK_MODE'] = args.webhook_mode
+
+    started = time.perf_counter()
+    import functions_framework
+    signature_type = 'http' if args.target == 'telegram_webhook' else 'cloudevent'
+    app = functions_framework.create_app(args.target, os.path.join(args.source, 'main.py'), signature_type)
+    imported = time.perf_counter()
+
+    client = app.test_client()
+    if args.target == 'telegram_webhook':
+        chat_id = 100000 + args.run
+        update = {
+            'update_id': int(time.time() * 1000) + args.run,
+            'message': {'message_id': 1, 'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Bench'},
+                        'chat': {'id': chat_id, 'type': 'private'}, 'date': int(time.time()), 'text': args.text},
+        }
+        response = client.post('/?token=bench', json=update)
+    else:
+        response = client.post('/', json={'message': {'data': base64.b64encode(b'{}').decode('ascii')}}, headers={
+            'ce-id': f"bench-{args.run}",
+            'ce-source': '//pubsub.googleapis.com/projects/demo/topics/scheduler-tick',
+            'ce-type': 'google.cloud.pubsub.topic.v1.messagePublished',
+            'ce-specversion': '1.0',
+        })
+    responded = time.perf_counter()
+
+    print("RESULT " + json.dumps({
+        'status': response.status_code,
+        'process_started': process_started,
+        'import_ms': (imported - started) * 1000,
+        'first_response_ms': (responded - imported) * 1000,
+        'total_ms': (responded - started) * 1000,
+        'modules': len(sys.modules),
+        'loaded': [name for name in WATCHED_MODULES if name in sys.modules],
+    }), flush=True)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--target', choices=['telegram_webhook', 'scheduler_tick'], default='telegram_webhook')
+    parser.add_argument('--webhook-mode', choices=['sync', 'async'], default='sync',
+                        help='async needs PUBSUB_EMULATOR_HOST')
+    parser.add_argument('--text', default='/list_commands', help='message text sent to the webhook')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--source', default=BOT_DIR, help='bot source directory to measure')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--run', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return 0
+    if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+        sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to run against a real project")
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'demo-reminder-bot')
+
+    results = []
+    for run in range(args.runs):
+        spawned = time.time()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--run', str(run), '--target', args.target,
+             '--webhook-mode', args.webhook_mode, '--text', args.text, '--source', os.path.abspath(args.source)],
+            capture_output=True, text=True, check=True).stdout
+        result = json.loads(next(line for line in output.splitlines() if line.startswith('RESULT '))[len('RESULT '):])
+        result['interpreter_ms'] = (result['process_started'] - spawned) * 1000
+        results.append(result)
+
+    print(f"{args.target} ({args.webhook_mode if args.target == 'telegram_webhook' else 'tick'}), "
+          f"{args.runs} cold starts of {args.source}")
+    for phase in ('interpreter_ms', 'import_ms', 'first_response_ms', 'total_ms'):
+        values = [r[phase] for r in results]
+        print(f"  {phase[:-3]:16s} p50 {percentile(values, 50):7.1f} ms   p90 {percentile(values, 90):7.1f} ms")
+    statuses = sorted({r['status'] for r in results})
+    print(f"  statuses {statuses}, {results[-1]['modules']} modules loaded")
+    print(f"  loaded: {', '.join(results[-1]['loaded']) or '-'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
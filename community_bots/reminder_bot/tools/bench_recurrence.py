@@ -0,0 +1,216 @@
+"""Benchmark recurrence.next_occurrence and check it against a brute-force reference.
+
+Generates random rules (daily/weekly/monthly, intervals, nth weekdays, until),
+anchors and "now" instants across DST-observing zones, then times N
+next-occurrence computations and reports the rate per rule kind. With
+--verify K, the first K cases are also recomputed by stepping day by day and
+any mismatch is printed. The verification also follows reminders set inside
+each zone's DST gaps for a few occurrences, and checks that every rule the
+parser accepts survives format_rule/parse_rule unchanged.
+
+    python tools/bench_recurrence.py --count 1000000 --verify 20000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+from recurrence import Recurrence, DAY_CODES, next_occurrence, localize, parse_rule, format_rule, _month_occurrence
+
+ZONES = ['Europe/Berlin', 'America/New_York', 'Australia/Sydney', 'Asia/Kolkata', 'UTC', 'America/Santiago']
+
+
+def random_rule(rng):
+    freq = rng.choice(['DAILY', 'WEEKLY', 'MONTHLY'])
+    interval = rng.choice([1, 1, 1, 2, 3])
+    until = None
+    if rng.random() < 0.2:
+        until = datetime.date(2026, 1, 1) + datetime.timedelta(days=rng.randrange(0, 900))
+    count = rng.randrange(1, 20) if rng.random() < 0.2 else None
+    wall_time = datetime.time(rng.randrange(24), rng.choice([0, 15, 30, 45]))
+    if freq == 'DAILY':
+        return Recurrence('DAILY', interval, until=until, count=count, wall_time=wall_time)
+    if freq == 'WEEKLY':
+        return Recurrence('WEEKLY', interval, weekdays=rng.randrange(1, 128), until=until, count=count, wall_time=wall_time)
+    if rng.random() < 0.5:
+        return Recurrence('MONTHLY', interval, weekdays=1 << rng.randrange(7), nth=rng.choice([1, 2, 3, 4, -1]),
+                          until=until, count=count, wall_time=wall_time)
+    return Recurrence('MONTHLY', interval, month_day=rng.choice([1, 15, 28, 29, 30, 31, -1]), until=until,
+                      count=count, wall_time=wall_time)
+
+
+def random_case(rng):
+    tz = pytz.timezone(rng.choice(ZONES))
+    rule = random_rule(rng)
+    anchor_day = datetime.date(2026, 1, 1) + datetime.timedelta(days=rng.randrange(0, 730))
+    if rule.freq == 'MONTHLY':
+        # Anchors are always on the rule's grid
+        anchor_day = _month_occurrence(rule, anchor_day.year, anchor_day.month)
+    elif rule.freq == 'WEEKLY':
+        while not rule.weekdays >> anchor_day.weekday() & 1:
+            anchor_day += datetime.timedelta(days=1)
+    current = localize(tz, anchor_day, rule.wall_time)
+    # Mostly on time, sometimes after an outage of up to 90 days
+    late = rng.choice([0, 0, 0, 60, 3600, 86400 * rng.randrange(1, 90)])
+    now = current.astimezone(pytz.UTC) + datetime.timedelta(seconds=late)
+    return rule, current, tz, now
+
+
+def on_grid(rule, anchor, day):
+    if rule.freq == 'DAILY':
+        return (day - anchor).days % rule.interval == 0
+    if rule.freq == 'WEEKLY':
+        weeks = ((day - datetime.timedelta(days=day.weekday())) - (anchor - datetime.timedelta(days=anchor.weekday()))).days // 7
+        return weeks % rule.interval == 0 and rule.weekdays >> day.weekday() & 1
+    months = (day.year - anchor.year) * 12 + day.month - anchor.month
+    return months % rule.interval == 0 and _month_occurrence(rule, day.year, day.month) == day
+
+
+def reference_next(rule, current, tz, now):
+    """Step day by day from the fired occurrence (slow but obviously right).
+
+    The time of day is the rule's, never the fired occurrence's: after a DST
+    gap moved one occurrence (02:30 -> 03:30), the next is at 02:30 again.
+    """
+    anchor = current.astimezone(tz).date()
+    wall_time = rule.wall_time
+    after = max(current, now)
+    day = anchor
+    for _ in range(4000):
+        day += datetime.timedelta(days=1)
+        if rule.until is not None and day > rule.until:
+            return None
+        if on_grid(rule, anchor, day):
+            occurrence = localize(tz, day, wall_time)
+            if occurrence > after:
+                return occurrence
+    raise RuntimeError("no occurrence within 4000 days")
+
+
+def dst_gap_cases():
+    """Reminders set inside each zone's 2026/2027 DST gaps, fired the day before the gap."""
+    cases = []
+    for name in ZONES:
+        tz = pytz.timezone(name)
+        day = datetime.date(2026, 1, 1)
+        while day < datetime.date(2028, 1, 1):
+            day += datetime.timedelta(days=1)
+            # Only days on which the UTC offset grows can have a gap
+            noon = datetime.time(12)
+            if localize(tz, day, noon).utcoffset() <= localize(tz, day - datetime.timedelta(days=1), noon).utcoffset():
+                continue
+            for quarter in range(96):
+                wall_time = datetime.time(quarter // 4, quarter % 4 * 15)
+                if localize(tz, day, wall_time).time() != wall_time:
+                    current = localize(tz, day - datetime.timedelta(days=1), wall_time)
+                    for rule in (Recurrence('DAILY', wall_time=wall_time),
+                                 Recurrence('WEEKLY', weekdays=0b1111111, wall_time=wall_time),
+                                 Recurrence('WEEKLY', weekdays=1 << day.weekday() | 1 << (day.weekday() + 1) % 7,
+                                            wall_time=wall_time)):
+                        cases.append((rule, current, tz))
+                    break
+    return cases
+
+
+def verify_round_trip(rules, rng, fuzz_count):
+    """Rules must survive format_rule/parse_rule; returns the number of failures.
+
+    Besides the generated rules, random rule strings are parsed: whatever the
+    parser accepts has to round-trip too (or it would fail to parse once stored).
+    """
+    failures = 0
+
+    def check(rule, source):
+        nonlocal failures
+        try:
+            ok = parse_rule(format_rule(rule)) == rule
+        except ValueError as e:
+            ok = False
+            source += f" ({e})"
+        if not ok:
+            failures += 1
+            if failures <= 10:
+                print(f"ROUND TRIP {source}: {rule} -> {format_rule(rule)}")
+
+    for rule in rules:
+        check(rule, "generated")
+    pieces = ['INTERVAL=2', 'BYMONTHDAY=15', 'BYMONTHDAY=-1', 'COUNT=3', 'UNTIL=20271231',
+              'BYHOUR=9', 'BYMINUTE=30', 'BYSECOND=5']
+    for _ in range(fuzz_count):
+        days = [rng.choice(['', '', '1', '2', '-1']) + rng.choice(DAY_CODES) for _ in range(rng.randrange(0, 3))]
+        parts = [f"FREQ={rng.choice(['DAILY', 'WEEKLY', 'MONTHLY'])}"] + rng.sample(pieces, rng.randrange(0, 3))
+        if days:
+            parts.append('BYDAY=' + ','.join(days))
+        text = ';'.join(rng.sample(parts, len(parts)))
+        try:
+            rule = parse_rule(text)
+        except ValueError:
+            continue
+        check(rule, text)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000000, help='next-occurrence computations to time')
+    parser.add_argument('--verify', type=int, default=10000, help='cases to check against the reference')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [random_case(rng) for _ in range(min(args.count, 50000))]
+
+    mismatches = 0
+
+    def verify(rule, current, tz, now):
+        nonlocal mismatches
+        expected = reference_next(rule, current, tz, now)
+        got = next_occurrence(rule, current, tz, now)
+        if got != expected:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"MISMATCH {rule} current={current} now={now}: got {got}, expected {expected}")
+        return got
+
+    for rule, current, tz, now in cases[:args.verify]:
+        verify(rule, current, tz, now)
+    print(f"verified {min(args.verify, len(cases))} cases, {mismatches} mismatches")
+
+    gap_cases = dst_gap_cases() if args.verify else []
+    gap_mismatches = mismatches
+    for rule, current, tz in gap_cases:
+        # Through the gap day and two more occurrences
+        for _ in range(3):
+            current = verify(rule, current, tz, current)
+    gap_mismatches = mismatches - gap_mismatches
+    print(f"verified {len(gap_cases)} DST gap cases over 3 occurrences, {gap_mismatches} mismatches")
+
+    round_trip_failures = verify_round_trip([rule for rule, _, _, _ in cases[:args.verify]], rng, args.verify)
+    print(f"round-tripped {min(args.verify, len(cases))} rules and {args.verify} random rule strings, "
+          f"{round_trip_failures} failures")
+
+    timings = defaultdict(lambda: [0, 0.0])
+    started = time.perf_counter()
+    for i in range(args.count):
+        rule, current, tz, now = cases[i % len(cases)]
+        t0 = time.perf_counter()
+        next_occurrence(rule, current, tz, now)
+        kind = timings[rule.freq]
+        kind[0] += 1
+        kind[1] += time.perf_counter() - t0
+    elapsed = time.perf_counter() - started
+
+    for freq, (n, total) in sorted(timings.items()):
+        print(f"{freq:8s} {n:9d} calls  {total / n * 1e6:6.2f} us/call")
+    print(f"total    {args.count:9d} calls in {elapsed:.2f}s ({args.count / elapsed:,.0f}/s)")
+    return 1 if mismatches or round_trip_failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
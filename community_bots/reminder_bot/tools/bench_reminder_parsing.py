@@ -0,0 +1,118 @@
+"""Microbenchmark the per-reminder CPU cost of timezone lookup and datetime parsing.
+
+Builds N synthetic reminder documents (mixed zones, one-time and recurring,
+a share without next_run_utc as for legacy documents) and times, per
+reminder, the work done when listing reminders and when rescheduling a fired
+one: once the way it was done before (pytz.timezone + dateutil parse on every
+reminder) and once with the memoized/fast paths now used in reminders.py.
+
+No Firestore calls are made and no credentials are needed: the shared client
+(firestore_client.get_db) is only created on first use, and the profile
+lookup that would use it is replaced by the synthetic users' zones.
+
+    python tools/bench_reminder_parsing.py --reminders 100000
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytz
+from dateutil import parser as date_parser
+import reminders
+from recurrence import advance, get_reminder_rule
+from utils import get_timezone, parse_iso_datetime
+
+ZONES = ['Europe/Berlin', 'America/New_York', 'Asia/Kolkata', 'Australia/Sydney', 'UTC', 'Europe/Moscow']
+
+
+def synthetic_reminders(count, legacy_share, seed):
+    rng = random.Random(seed)
+    start = datetime.datetime(2026, 10, 1, tzinfo=pytz.UTC)
+    docs = []
+    for i in range(count):
+        tz_name = rng.choice(ZONES)
+        local = (start + datetime.timedelta(minutes=rng.randrange(0, 60 * 24 * 60))).astimezone(pytz.timezone(tz_name))
+        data = {
+            'chat_id': 100000 + i % 5000,
+            'text': f"reminder {i}",
+            'next_run': local.isoformat(),
+            'next_run_utc': local.astimezone(pytz.UTC),
+            'repeat': rng.choice([None, None, [1, 3, 5], [6, 7]]),
+        }
+        if rng.random() < legacy_share:
+            del data['next_run_utc']
+        docs.append((tz_name, data))
+    return docs
+
+
+def legacy_display(tz_name, data):
+    user_tz = pytz.timezone(tz_name)
+    next_run = date_parser.parse(data['next_run'])
+    if next_run.tzinfo is None:
+        next_run = user_tz.localize(next_run)
+    return next_run.astimezone(user_tz).strftime('%Y-%m-%d %H:%M')
+
+
+def current_display(tz_name, data):
+    return reminders.reminder_local_time(data, get_timezone(tz_name)).strftime('%Y-%m-%d %H:%M')
+
+
+def legacy_after_send(tz_name, data, now):
+    rule = get_reminder_rule(data)
+    if rule is None:
+        return None
+    user_tz = pytz.timezone(tz_name)
+    next_run = date_parser.parse(data['next_run'])
+    if next_run.tzinfo is None:
+        next_run = user_tz.localize(next_run)
+    return advance(rule, next_run.astimezone(user_tz), user_tz, now)
+
+
+def current_after_send(tz_name, data, now):
+    return reminders.compute_reminder_after_send(data, now)
+
+
+def timed(label, func, docs, *extra):
+    started = time.process_time()
+    for tz_name, data in docs:
+        func(tz_name, data, *extra)
+    elapsed = time.process_time() - started
+    print(f"{label:28s} {elapsed:7.3f}s CPU  {elapsed / len(docs) * 1e6:7.2f} us/reminder")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reminders', type=int, default=100000)
+    parser.add_argument('--legacy-share', type=float, default=0.1, help='fraction of reminders without next_run_utc')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    docs = synthetic_reminders(args.reminders, args.legacy_share, args.seed)
+    zones_by_chat = {data['chat_id']: tz_name for tz_name, data in docs}
+    # compute_reminder_after_send looks the zone up in the (per-request cached) profile
+    reminders.get_user_profile = lambda chat_id: {'timezone': zones_by_chat[chat_id]}
+    now = datetime.datetime(2026, 10, 1, tzinfo=pytz.UTC)
+
+    strings = [(tz_name, data['next_run']) for tz_name, data in docs]
+    before = timed("parse: dateutil", lambda tz_name, s: date_parser.parse(s), strings)
+    after = timed("parse: fromisoformat first", lambda tz_name, s: parse_iso_datetime(s), strings)
+    print(f"{'':28s} {before / after:.1f}x faster\n")
+
+    before = timed("list: before", legacy_display, docs)
+    after = timed("list: after", current_display, docs)
+    print(f"{'':28s} {before / after:.1f}x faster\n")
+
+    before = timed("reschedule: before", legacy_after_send, docs, now)
+    after = timed("reschedule: after", current_after_send, docs, now)
+    print(f"{'':28s} {before / after:.1f}x faster")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
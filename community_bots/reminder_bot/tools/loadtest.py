@@ -0,0 +1,306 @@
+"""Load-test the telegram_webhook and scheduler_tick entry points locally.
+
+Both functions are loaded through functions_framework (as Cloud Functions
+would) and driven in-process against the Firestore emulator and the stub
+Telegram/Gemini servers from stub_servers.py, with configurable latency and
+429 injection. A synthetic population is seeded first: users with reminders
+whose local times cluster at a 09:00 peak, laid out as if it were 09:00 for
+every user when the run starts, so the first scheduler ticks see the peak.
+
+Reports p50/p99 latency per entry point, Firestore document reads, writes and
+deletes (as accounted by instrumentation.py), and messages per second.
+Use --json to keep the numbers for regression tracking.
+
+    gcloud emulators firestore start --host-port=localhost:8081
+    export FIRESTORE_EMULATOR_HOST=localhost:8081 GOOGLE_CLOUD_PROJECT=demo-reminder-bot
+    python tools/loadtest.py --users 10000 --reminders 200000 --updates 2000
+    python tools/loadtest.py --no-seed --scenario webhook --gemini-429-rate 0.1
+"""
+import argparse
+import base64
+import datetime
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+if not os.environ.get('FIRESTORE_EMULATOR_HOST'):
+    sys.exit("FIRESTORE_EMULATOR_HOST is not set; refusing to run against a real project")
+# The client would otherwise retry every write for a minute before failing
+_emulator_host, _, _emulator_port = os.environ['FIRESTORE_EMULATOR_HOST'].rpartition(':')
+try:
+    socket.create_connection((_emulator_host or 'localhost', int(_emulator_port)), timeout=2).close()
+except (OSError, ValueError) as e:
+    sys.exit(f"Firestore emulator not reachable at {os.environ['FIRESTORE_EMULATOR_HOST']}: {e}")
+os.environ.setdefault('GOOGLE_CLOUD_PROJECT', 'demo-reminder-bot')
+
+import pytz
+from instrumentation import firestore_totals
+from stub_servers import start_stub_servers
+
+ZONES = ['Europe/Berlin', 'Europe/London', 'America/New_York', 'Asia/Kolkata', 'Europe/Moscow']
+WEBHOOK_SECRET = 'loadtest'
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def configure_environment(args, telegram, gemini):
+    """Point the bot at the stubs; must run before main.py is loaded."""
+    os.environ['TELEGRAM_API_BASE'] = f"http://127.0.0.1:{telegram.server_port}"
+    os.environ['GEMINI_API_BASE'] = f"http://127.0.0.1:{gemini.server_port}"
+    os.environ.setdefault('TELEGRAM_BOT_TOKEN', 'loadtest')
+    os.environ.setdefault('GEMINI_API_KEY', 'loadtest')
+    os.environ['WEBHOOK_SECRET'] = WEBHOOK_SECRET
+    os.environ['WHITELIST_USER_IDS'] = ''
+    # The stub is not quota limited; keep the client budget out of the way unless asked
+    os.environ.setdefault('GEMINI_RPM', str(args.gemini_rpm))
+    os.environ.setdefault('GEMINI_TPM', str(args.gemini_rpm * 25000))
+
+
+def seed_population(args, rng):
+    """Write users, reminders (30% at the 09:00 peak by default) and their reminder indexes."""
+    from google.cloud import firestore
+    import reminders
+    from migrations import MIGRATIONS
+    from recurrence import format_rule, from_repeat_days
+
+    db = firestore.Client()
+    now = datetime.datetime.now(pytz.UTC)
+    # "09:00 local" for the whole population is 30 seconds ago
+    peak = now - datetime.timedelta(seconds=30)
+    batch = db.batch()
+    pending = 0
+
+    def write(ref, data):
+        nonlocal batch, pending
+        batch.set(ref, data)
+        pending += 1
+        if pending >= 500:
+            batch.commit()
+            batch = db.batch()
+            pending = 0
+
+    per_user = max(1, args.reminders // args.users)
+    for u in range(args.users):
+        chat_id = 100000 + u
+        tz_name = rng.choice(ZONES)
+        user_tz = pytz.timezone(tz_name)
+        write(db.collection('users').document(str(chat_id)), {
+            'timezone': tz_name,
+            'system_prompt': 'You are a friendly fitness coach.',
+            'recent_chat': [],
+        })
+        entries = []
+        for _ in range(per_user):
+            if rng.random() < args.peak_share:
+                minutes_from_peak = 0
+            else:
+                # Any quarter hour of the day, as an offset from the peak
+                minutes_from_peak = rng.randrange(1, 96) * 15
+            next_run_utc = peak + datetime.timedelta(minutes=minutes_from_peak)
+            next_run_local = next_run_utc.astimezone(user_tz)
+            repeat = rng.choice([None, [1, 2, 3, 4, 5], [1, 2, 3, 4, 5, 6, 7], [6, 7]])
+            ref = db.collection('reminders').document()
+            data = {
+                'chat_id': chat_id,
+                'text': f"synthetic reminder for {chat_id}",
+                'next_run': next_run_local.isoformat(),
+                'next_run_utc': next_run_utc,
+                'rule': format_rule(from_repeat_days(repeat)) if repeat else None,
+                'timezone_hint': tz_name,
+                'shard_key': reminders.get_shard_key(chat_id),
+            }
+            write(ref, data)
+            entries.append(reminders._index_entry(ref.id, data))
+        write(reminders._index_ref(chat_id), {
+            'chat_id': chat_id,
+            'entries': reminders._sorted_entries(entries),
+        })
+
+    # The population is created in the current schema; skip the backfills
+    write(db.collection('meta').document('migrations'), {'applied': [name for name, _, _ in MIGRATIONS]})
+    if pending:
+        batch.commit()
+    print(f"seeded {args.users} users, {per_user * args.users} reminders")
+
+
+def make_update(rng, update_id, args):
+    chat_id = 100000 + rng.randrange(args.users)
+    roll = rng.random()
+    if roll < args.ai_share:
+        text = rng.choice(["How should I plan my workouts this week?",
+                           "I skipped the gym today, any advice?",
+                           "Can you remind me to stretch tomorrow at 8?"])
+    elif roll < args.ai_share + (1 - args.ai_share) / 2:
+        text = '/list_reminders'
+    else:
+        when = (datetime.datetime.now() + datetime.timedelta(days=rng.randrange(1, 30))).strftime('%Y-%m-%dT%H:%M:00')
+        text = f"/remind {when} drink water daily"
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+            'chat': {'id': chat_id, 'type': 'private'},
+            'date': int(time.time()),
+            'text': text,
+        },
+    }
+
+
+def run_webhook(args, app, rng, telegram):
+    updates = [make_update(rng, 10_000_000 + i, args) for i in range(args.updates)]
+    local = threading.local()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def post(update):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        started = time.perf_counter()
+        response = local.client.post(f"/?token={WEBHOOK_SECRET}", json=update)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    ops_before = firestore_totals()
+    sent_before = len(telegram.calls_for('sendMessage'))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(post, updates))
+    elapsed = time.perf_counter() - started
+    return summarize('telegram_webhook', latencies, elapsed, ops_before,
+                     len(telegram.calls_for('sendMessage')) - sent_before, statuses)
+
+
+def run_scheduler(args, app, telegram):
+    client = app.test_client()
+    headers = {
+        'ce-id': 'loadtest',
+        'ce-source': '//pubsub.googleapis.com/projects/demo/topics/scheduler-tick',
+        'ce-type': 'google.cloud.pubsub.topic.v1.messagePublished',
+        'ce-specversion': '1.0',
+    }
+    body = {'message': {'data': base64.b64encode(b'{}').decode('ascii')}}
+    latencies = []
+    statuses = {}
+
+    ops_before = firestore_totals()
+    sent_before = len(telegram.calls_for('sendMessage'))
+    started = time.perf_counter()
+    for tick in range(args.ticks):
+        headers['ce-id'] = f"loadtest-{tick}"
+        sent = len(telegram.calls_for('sendMessage'))
+        tick_started = time.perf_counter()
+        response = client.post('/', json=body, headers=headers)
+        latencies.append(time.perf_counter() - tick_started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        if len(telegram.calls_for('sendMessage')) == sent:
+            break  # peak drained
+    elapsed = time.perf_counter() - started
+    return summarize('scheduler_tick', latencies, elapsed, ops_before,
+                     len(telegram.calls_for('sendMessage')) - sent_before, statuses)
+
+
+def summarize(name, latencies, elapsed, ops_before, messages, statuses):
+    ops_after = firestore_totals()
+    ops = {kind: ops_after[kind] - ops_before[kind] for kind in ops_after}
+    calls = len(latencies) or 1
+    return {
+        'entry_point': name,
+        'calls': len(latencies),
+        'statuses': statuses,
+        'elapsed_s': round(elapsed, 3),
+        'latency_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'latency_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'messages_sent': messages,
+        'messages_per_s': round(messages / elapsed, 1) if elapsed else 0.0,
+        'firestore': ops,
+        'firestore_per_call': {kind: round(n / calls, 1) for kind, n in ops.items()},
+    }
+
+
+def print_report(result, telegram, gemini):
+    print(f"\n{result['entry_point']}: {result['calls']} calls in {result['elapsed_s']}s, statuses {result['statuses']}")
+    print(f"  latency p50 {result['latency_p50_ms']} ms, p99 {result['latency_p99_ms']} ms")
+    print(f"  messages sent {result['messages_sent']} ({result['messages_per_s']}/s)")
+    ops = result['firestore']
+    per_call = result['firestore_per_call']
+    print(f"  firestore reads {ops['reads']} writes {ops['writes']} deletes {ops['deletes']} "
+          f"(per call {per_call['reads']}/{per_call['writes']}/{per_call['deletes']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenario', default='webhook,scheduler', help='comma separated: webhook, scheduler')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reminders', type=int, default=20000)
+    parser.add_argument('--peak-share', type=float, default=0.3, help='fraction of reminders at the 09:00 peak')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the population already in the emulator')
+    parser.add_argument('--updates', type=int, default=500, help='webhook updates to send')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent webhook requests')
+    parser.add_argument('--ai-share', type=float, default=0.6, help='fraction of updates that go to Gemini')
+    parser.add_argument('--ticks', type=int, default=10, help='most scheduler ticks to run while draining the peak')
+    parser.add_argument('--telegram-latency-ms', type=float, default=50)
+    parser.add_argument('--telegram-429-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-latency-ms', type=float, default=500)
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-rpm', type=int, default=100000, help='client-side Gemini budget for the run')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the results to this file')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    telegram, gemini = start_stub_servers(
+        telegram_options={'latency_s': args.telegram_latency_ms / 1000, 'error_rate': args.telegram_429_rate,
+                          'seed': args.seed},
+        latency_s=args.gemini_latency_ms / 1000, error_rate=args.gemini_429_rate, seed=args.seed)
+    configure_environment(args, telegram, gemini)
+
+    import functions_framework
+    main_path = os.path.join(BOT_DIR, 'main.py')
+    webhook_app = functions_framework.create_app('telegram_webhook', main_path, 'http')
+    tick_app = functions_framework.create_app('scheduler_tick', main_path, 'cloudevent')
+    # Per-request INFO logs would dominate the run
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if not args.no_seed:
+        seed_population(args, rng)
+
+    results = []
+    scenarios = [s.strip() for s in args.scenario.split(',') if s.strip()]
+    if 'scheduler' in scenarios:
+        results.append(run_scheduler(args, tick_app, telegram))
+    if 'webhook' in scenarios:
+        results.append(run_webhook(args, webhook_app, rng, telegram))
+
+    for result in results:
+        print_report(result, telegram, gemini)
+    print(f"\nstubs: telegram 429s injected {telegram.rejected}, gemini requests {gemini.requests} "
+          f"(429s injected {gemini.rejected})")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results,
+                       'telegram_429s': telegram.rejected, 'gemini_429s': gemini.rejected}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Local stand-ins for the Telegram Bot API and the Gemini API.
+
+The Telegram stub accepts any bot method, hands out increasing message ids for
+sendMessage and records every call; getUpdates long-polls the updates queued
+with push_update. The Gemini stub answers generateContent with a canned
+reply, and streamGenerateContent?alt=sse with the same reply split into word
+chunks sent as server-sent events with a delay between them.
+Both can add a fixed latency to every request and reject a share of them with
+429 (Telegram's answer carries parameters.retry_after, like the real API).
+
+Point the bot at the stubs through the base URL overrides in http_client.py:
+
+    python tools/stub_servers.py --telegram-port 8090 --gemini-port 8091
+    export TELEGRAM_API_BASE=http://localhost:8090 GEMINI_API_BASE=http://localhost:8091
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_REPLY = (
+    "Great question! Consistency beats intensity, so start with three short "
+    "sessions a week and add one more once they feel easy. Keep a simple log, "
+    "celebrate small wins, and tell me how the first week went so we can adjust "
+    "the plan together."
+)
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port, handler, latency_s=0.0, error_rate=0.0, seed=None):
+        super().__init__(('127.0.0.1', port), handler)
+        self.latency_s = latency_s
+        self.error_rate = error_rate
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    def should_reject(self):
+        """Delay the request by the configured latency and decide on 429 injection."""
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.rejected += 1
+                return True
+        return False
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else {}
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TelegramStub(_StubServer):
+    """Records accepted Bot API calls as (method, payload) in `calls`."""
+
+    def __init__(self, port=0, latency_s=0.0, error_rate=0.0, retry_after=1, seed=None):
+        super().__init__(port, _TelegramHandler, latency_s, error_rate, seed)
+        self.retry_after = retry_after
+        self.calls = []
+        self.next_message_id = 1
+        self.updates = []
+        self.next_update_id = 1
+        self.updates_changed = threading.Condition(self.lock)
+
+    def push_update(self, update):
+        """Queue an update for getUpdates; update_id is assigned if missing."""
+        with self.lock:
+            if 'update_id' not in update:
+                update = dict(update, update_id=self.next_update_id)
+            self.next_update_id = max(self.next_update_id, update['update_id'] + 1)
+            self.updates.append(update)
+            self.updates_changed.notify_all()
+        return update
+
+    def take_updates(self, offset, limit, timeout):
+        """getUpdates semantics: drop updates below offset, wait up to timeout for more."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            self.updates = [u for u in self.updates if u['update_id'] >= (offset or 0)]
+            while not self.updates and time.monotonic() < deadline:
+                self.updates_changed.wait(deadline - time.monotonic())
+            return self.updates[:limit]
+
+    def calls_for(self, method):
+        with self.lock:
+            return [payload for name, payload in self.calls if name == method]
+
+
+class _TelegramHandler(_QuietHandler):
+    def do_POST(self):
+        stub = self.server
+        # /bot<token>/<method>
+        method = urlparse(self.path).path.rsplit('/', 1)[-1]
+        payload = self._read_json()
+        if stub.should_reject():
+            self._send_json(429, {'ok': False, 'error_code': 429,
+                                  'description': f"Too Many Requests: retry after {stub.retry_after}",
+                                  'parameters': {'retry_after': stub.retry_after}})
+            return
+        if method == 'getUpdates':
+            updates = stub.take_updates(payload.get('offset'), payload.get('limit', 100), payload.get('timeout', 0))
+            self._send_json(200, {'ok': True, 'result': updates})
+            return
+        with stub.lock:
+            stub.calls.append((method, payload))
+            if method == 'sendMessage':
+                message_id = stub.next_message_id
+                stub.next_message_id += 1
+                result = {'message_id': message_id, 'chat': {'id': payload.get('chat_id')}, 'text': payload.get('text')}
+            elif method == 'editMessageText':
+                result = {'message_id': payload.get('message_id'), 'chat': {'id': payload.get('chat_id')}, 'text': payload.get('text')}
+            else:
+                result = True
+        self._send_json(200, {'ok': True, 'result': result})
+
+
+class GeminiStub(_StubServer):
+    """Serves `reply` for generateContent and streamGenerateContent requests."""
+
+    def __init__(self, port=0, reply=DEFAULT_REPLY, latency_s=0.0, chunk_delay_s=0.05, words_per_chunk=3,
+                 error_rate=0.0, seed=None):
+        super().__init__(port, _GeminiHandler, latency_s, error_rate, seed)
+        self.reply = reply
+        self.chunk_delay_s = chunk_delay_s
+        self.words_per_chunk = words_per_chunk
+        self.requests = 0
+
+    def chunks(self):
+        words = self.reply.split(' ')
+        for i in range(0, len(words), self.words_per_chunk):
+            text = ' '.join(words[i:i + self.words_per_chunk])
+            yield text if i + self.words_per_chunk >= len(words) else text + ' '
+
+    def usage(self):
+        output_tokens = len(self.reply) // 4
+        return {'promptTokenCount': 100, 'candidatesTokenCount': output_tokens,
+                'totalTokenCount': 100 + output_tokens}
+
+
+class _GeminiHandler(_QuietHandler):
+    def do_POST(self):
+        stub = self.server
+        url = urlparse(self.path)
+        self._read_json()
+        with stub.lock:
+            stub.requests += 1
+        if stub.should_reject():
+            self._send_json(429, {'error': {'code': 429, 'status': 'RESOURCE_EXHAUSTED',
+                                            'message': 'Resource has been exhausted (e.g. check quota).'}})
+            return
+
+        if url.path.endswith(':streamGenerateContent') and parse_qs(url.query).get('alt') == ['sse']:
+            self._stream(stub)
+        elif url.path.endswith(':generateContent'):
+            self._send_json(200, {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': stub.reply}]}, 'finishReason': 'STOP'}],
+                'usageMetadata': stub.usage(),
+            })
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': f"Unknown path {url.path}"}})
+
+    def _stream(self, stub):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for text in stub.chunks():
+            event = {
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}}],
+                'usageMetadata': stub.usage(),
+            }
+            data = f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+            time.sleep(stub.chunk_delay_s)
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_servers(telegram_port=0, gemini_port=0, telegram_options=None, **gemini_options):
+    """Start both stubs on background threads and return (telegram, gemini).
+
+    Port 0 picks a free port; the chosen one is in server.server_port.
+    """
+    telegram = TelegramStub(telegram_port, **(telegram_options or {}))
+    gemini = GeminiStub(gemini_port, **gemini_options)
+    for server in (telegram, gemini):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return telegram, gemini
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--telegram-port', type=int, default=8090)
+    parser.add_argument('--gemini-port', type=int, default=8091)
+    parser.add_argument('--reply', default=DEFAULT_REPLY, help='text the Gemini stub answers with')
+    parser.add_argument('--chunk-delay-ms', type=float, default=50, help='delay between streamed chunks')
+    parser.add_argument('--telegram-latency-ms', type=float, default=0)
+    parser.add_argument('--telegram-429-rate', type=float, default=0, help='share of Telegram calls rejected with 429')
+    parser.add_argument('--gemini-latency-ms', type=float, default=0)
+    parser.add_argument('--gemini-429-rate', type=float, default=0, help='share of Gemini calls rejected with 429')
+    args = parser.parse_args()
+
+    telegram, gemini = start_stub_servers(
+        args.telegram_port, args.gemini_port,
+        telegram_options={'latency_s': args.telegram_latency_ms / 1000, 'error_rate': args.telegram_429_rate},
+        reply=args.reply, chunk_delay_s=args.chunk_delay_ms / 1000,
+        latency_s=args.gemini_latency_ms / 1000, error_rate=args.gemini_429_rate)
+    print(f"export TELEGRAM_API_BASE=http://localhost:{telegram.server_port} "
+          f"GEMINI_API_BASE=http://localhost:{gemini.server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import datetime
+import os
+import threading
+from collections import OrderedDict
+from google.cloud import firestore
+from firestore_client import get_db
+from google.api_core.exceptions import AlreadyExists
+from logging_config import logger
+
+# processed_updates docs expire after this long (Firestore TTL policy on expires_at)
+UPDATE_DEDUP_TTL_S = int(os.environ.get('UPDATE_DEDUP_TTL_S', str(24 * 3600)))
+# update_ids remembered in memory so warm instances skip the Firestore round trip
+UPDATE_DEDUP_LRU_SIZE = int(os.environ.get('UPDATE_DEDUP_LRU_SIZE', '2048'))
+
+_recent_updates = OrderedDict()
+_lock = threading.Lock()
+_duplicate_hits = 0
+
+def _remember(key):
+    _recent_updates[key] = True
+    _recent_updates.move_to_end(key)
+    while len(_recent_updates) > UPDATE_DEDUP_LRU_SIZE:
+        _recent_updates.popitem(last=False)
+
+def _record_duplicate(key):
+    global _duplicate_hits
+    _duplicate_hits += 1
+    logger.info(f"Skipping duplicate update {key} (duplicate hits: {_duplicate_hits})")
+
+def claim_update(update_id):
+    """Return True the first time an update_id is seen, False for redeliveries.
+
+    Checks the in-memory LRU first, then claims the id with a create-if-absent
+    write to processed_updates/{update_id}.
+    """
+    if update_id is None:
+        return True
+    key = str(update_id)
+
+    with _lock:
+        if key in _recent_updates:
+            _recent_updates.move_to_end(key)
+            _record_duplicate(key)
+            return False
+
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=UPDATE_DEDUP_TTL_S)
+    try:
+        get_db().collection('processed_updates').document(key).create({
+            'created_at': firestore.SERVER_TIMESTAMP,
+            'expires_at': expires_at
+        })
+    except AlreadyExists:
+        with _lock:
+            _remember(key)
+            _record_duplicate(key)
+        return False
+
+    with _lock:
+        _remember(key)
+    return True
+
+def release_update(update_id):
+    """Forget a claimed update so a redelivery is processed again (used after failures)."""
+    if update_id is None:
+        return
+    key = str(update_id)
+    with _lock:
+        _recent_updates.pop(key, None)
+    try:
+        get_db().collection('processed_updates').document(key).delete()
+    except Exception as e:
+        logger.error(f"Failed to release update {key}: {e}")
+
+def get_duplicate_hits():
+    """Number of duplicate deliveries skipped by this instance."""
+    return _duplicate_hits
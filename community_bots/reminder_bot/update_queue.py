@@ -0,0 +1,49 @@
+import os
+import queue
+import threading
+from pubsub_client import publish_json, decode_pubsub_event
+from logging_config import logger
+
+# 'pubsub' publishes to the updates topic (honors PUBSUB_EMULATOR_HOST for local runs),
+# 'inprocess' hands updates to a background thread in this process (local development only)
+UPDATE_QUEUE_BACKEND = os.environ.get('UPDATE_QUEUE_BACKEND', 'pubsub')
+TELEGRAM_UPDATES_TOPIC = os.environ.get('TELEGRAM_UPDATES_TOPIC', 'telegram-webhook')
+
+_update_handler = None
+_inprocess_queue = queue.Queue()
+_inprocess_worker = None
+
+def register_update_handler(handler):
+    """Set the function the in-process backend calls for each queued update."""
+    global _update_handler
+    _update_handler = handler
+
+def _run_inprocess_worker():
+    while True:
+        update = _inprocess_queue.get()
+        try:
+            _update_handler(update)
+        except Exception as e:
+            logger.error(f"In-process update worker failed: {e}")
+        finally:
+            _inprocess_queue.task_done()
+
+def publish_update(update):
+    """Queue a raw Telegram update for asynchronous processing."""
+    global _inprocess_worker
+    if UPDATE_QUEUE_BACKEND == 'inprocess':
+        if _inprocess_worker is None:
+            _inprocess_worker = threading.Thread(target=_run_inprocess_worker, daemon=True)
+            _inprocess_worker.start()
+        _inprocess_queue.put(update)
+        return
+
+    publish_json(TELEGRAM_UPDATES_TOPIC, update)
+
+def wait_for_inprocess_updates():
+    """Block until the in-process backend has processed every queued update."""
+    _inprocess_queue.join()
+
+def decode_update_event(cloud_event):
+    """Extract the Telegram update from a Pub/Sub CloudEvent."""
+    return decode_pubsub_event(cloud_event)
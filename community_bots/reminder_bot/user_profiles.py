@@ -0,0 +1,71 @@
+import contextvars
+import copy
+import threading
+from firestore_client import get_db
+
+# users/{chat_id} snapshots cached for the lifetime of one webhook request or
+# scheduler tick. Entry points call reset_user_profile_cache() when they start,
+# which gives the current context (thread, or request in it) a cache of its
+# own; worker threads started with instrumentation.propagate_context share it.
+_profile_cache = contextvars.ContextVar('profile_cache', default=None)
+_cache_lock = threading.Lock()
+
+def _cache():
+    cache = _profile_cache.get()
+    if cache is None:
+        cache = {}
+        _profile_cache.set(cache)
+    return cache
+
+def _store_snapshot(doc):
+    """Cache a users/{chat_id} snapshot and return its data."""
+    data = doc.to_dict() if doc.exists else {}
+    cache = _cache()
+    with _cache_lock:
+        cache[doc.id] = data
+    return data
+
+def reset_user_profile_cache():
+    """Start an empty cache for the current request. Call at the start of every request or tick."""
+    _profile_cache.set({})
+
+def invalidate_user_profile(chat_id):
+    """Forget the cached profile of a single user."""
+    cache = _cache()
+    with _cache_lock:
+        cache.pop(str(chat_id), None)
+
+def get_user_profile(chat_id):
+    """Get the user's profile dict, reading Firestore at most once per request.
+
+    Returns an empty dict for unknown users. The result is a copy, so callers may
+    modify it freely.
+    """
+    key = str(chat_id)
+    cache = _cache()
+    with _cache_lock:
+        cached = cache.get(key)
+    if cached is None:
+        cached = _store_snapshot(get_db().collection('users').document(key).get())
+    return copy.deepcopy(cached)
+
+def prefetch_user_profiles(chat_ids):
+    """Batch-load profiles for many users with a single get_all call."""
+    cache = _cache()
+    with _cache_lock:
+        missing = {str(chat_id) for chat_id in chat_ids} - cache.keys()
+    if not missing:
+        return
+    refs = [get_db().collection('users').document(key) for key in missing]
+    for doc in get_db().get_all(refs):
+        _store_snapshot(doc)
+
+def cache_user_profile_snapshot(doc):
+    """Cache a users snapshot that was already fetched by a query."""
+    _store_snapshot(doc)
+
+def set_user_profile(chat_id, fields):
+    """Merge fields into the user's profile and invalidate the cached copy."""
+    doc_ref = get_db().collection('users').document(str(chat_id))
+    doc_ref.set(fields, merge=True)
+    invalidate_user_profile(chat_id)
@@ -1,12 +1,45 @@
-def format_repeat_days(repeat_list):
-    """Format repeat days list into readable string."""
-    if not repeat_list: return ""
-    days = ["Mondays", "Tuesdays", "Wednesdays", "Thursdays", "Fridays", "Saturdays", "Sundays"]
-    day_names = [days[d-1] for d in repeat_list if 1 <= d <= 7]
-    if not day_names: return ""
-    if len(day_names) == 1:
-        return f" (repeat {day_names[0]})"
-    elif len(day_names) == 2:
-        return f" (repeat {day_names[0]} and {day_names[1]})"
-    else:
-        return f" (repeat {', '.join(day_names[:-1])} and {day_names[-1]})"
\ No newline at end of file
+import datetime
+import functools
+import pytz
+
+def parse_index_list(args, max_index=1000):
+    """Parse reminder numbers like ['1', '3,5', '7-9'] into [1, 3, 5, 7, 8, 9].
+
+    Raises ValueError for anything that is not a positive number or range.
+    """
+    indices = []
+    for token in ','.join(args).split(','):
+        token = token.strip()
+        if not token:
+            continue
+        if '-' in token:
+            start, end = (int(part) for part in token.split('-', 1))
+            if start < 1 or end < start or end > max_index:
+                raise ValueError(f"Invalid range '{token}'")
+            indices.extend(range(start, end + 1))
+        else:
+            index = int(token)
+            if index < 1:
+                raise ValueError(f"Invalid number '{token}'")
+            indices.append(index)
+    if not indices:
+        raise ValueError("No reminder numbers given")
+    return indices
+
+@functools.lru_cache(maxsize=None)
+def get_timezone(name):
+    """pytz timezone for a name, memoized (pytz.timezone is slow for a hot path)."""
+    return pytz.timezone(name or 'UTC')
+
+def parse_iso_datetime(value):
+    """Parse a stored datetime string.
+
+    Everything the bot writes comes from isoformat(), which
+    datetime.fromisoformat reads directly; dateutil's much slower generic
+    parser is only the fallback for other formats.
+    """
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil import parser as date_parser
+        return date_parser.parse(value)
@@ -41,11 +41,74 @@ resource "google_cloudfunctions2_function" "telegram_webhook" {
     max_instance_count = 1
     available_memory   = "256M"
     timeout_seconds    = 60
-    environment_variables = {
-      PROJECT_ID         = var.project_id
-      WEBHOOK_SECRET     = random_password.webhook_secret.result
-      WHITELIST_USER_IDS = var.whitelist_user_ids
+    # Bot-specific settings are only set when enabled, so other bots get the same env as before
+    environment_variables = merge(
+      {
+        PROJECT_ID         = var.project_id
+        WEBHOOK_SECRET     = random_password.webhook_secret.result
+        WHITELIST_USER_IDS = var.whitelist_user_ids
+      },
+      var.webhook_mode == "async" ? {
+        WEBHOOK_MODE           = var.webhook_mode
+        TELEGRAM_UPDATES_TOPIC = google_pubsub_topic.telegram_webhook.name
+      } : {},
+      var.gemini_streaming ? { GEMINI_STREAMING = "1" } : {}
+    )
+    secret_environment_variables {
+      key        = "TELEGRAM_BOT_TOKEN"
+      project_id = var.project_id
+      secret     = var.telegram_bot_token_secret
+      version    = "latest"
+    }
+    secret_environment_variables {
+      key        = "GEMINI_API_KEY"
+      project_id = var.project_id
+      secret     = "gemini-api-key"
+      version    = "latest"
+    }
+  }
+
+  depends_on = [
+    google_project_service.cloudfunctions,
+    google_project_service.cloudbuild,
+    google_project_service.secretmanager,
+    google_project_service.artifactregistry,
+    google_project_service.compute,
+    google_project_service.run,
+    google_project_service.eventarc
+  ]
+}
+
+resource "google_cloudfunctions2_function" "telegram_update_worker" {
+  # Only deployed for bots running the webhook in async mode
+  count = var.webhook_mode == "async" ? 1 : 0
+
+  name        = "telegram-update-worker"
+  location    = var.region
+  description = "Processes Telegram updates queued by the webhook in async mode"
+
+  build_config {
+    runtime     = "python311"
+    entry_point = "telegram_update_worker"
+    source {
+      storage_source {
+        bucket = google_storage_bucket.function_bucket.name
+        object = google_storage_bucket_object.bot_zip.name
+      }
     }
+  }
+
+  service_config {
+    max_instance_count = 1
+    available_memory   = "256M"
+    timeout_seconds    = 120
+    environment_variables = merge(
+      {
+        PROJECT_ID         = var.project_id
+        WHITELIST_USER_IDS = var.whitelist_user_ids
+      },
+      var.gemini_streaming ? { GEMINI_STREAMING = "1" } : {}
+    )
     secret_environment_variables {
       key        = "TELEGRAM_BOT_TOKEN"
       project_id = var.project_id
@@ -60,6 +123,13 @@ resource "google_cloudfunctions2_function" "telegram_webhook" {
     }
   }
 
+  event_trigger {
+    trigger_region = var.region
+    event_type     = "google.cloud.pubsub.topic.v1.messagePublished"
+    pubsub_topic   = google_pubsub_topic.telegram_webhook.id
+    retry_policy   = "RETRY_POLICY_DO_NOT_RETRY"
+  }
+
   depends_on = [
     google_project_service.cloudfunctions,
     google_project_service.cloudbuild,
@@ -88,12 +158,16 @@ resource "google_cloudfunctions2_function" "scheduler_tick" {
   }
 
   service_config {
-    max_instance_count = 1
+    max_instance_count = var.scheduler_max_instances
     available_memory   = "256M"
     timeout_seconds    = 60
-    environment_variables = {
-      PROJECT_ID = var.project_id
-    }
+    environment_variables = merge(
+      { PROJECT_ID = var.project_id },
+      var.scheduler_shards > 1 ? {
+        SCHEDULER_SHARDS = tostring(var.scheduler_shards)
+        SCHEDULER_TOPIC  = google_pubsub_topic.scheduler_tick.name
+      } : {}
+    )
     secret_environment_variables {
       key        = "TELEGRAM_BOT_TOKEN"
       project_id = var.project_id
@@ -16,6 +16,16 @@ resource "google_project_iam_member" "compute_firestore" {
   depends_on = [google_project_service.compute]
 }
 
+# Allow functions to publish to Pub/Sub (async webhook mode, sharded scheduler ticks)
+resource "google_project_iam_member" "compute_pubsub_publisher" {
+  count   = var.webhook_mode == "async" || var.scheduler_shards > 1 ? 1 : 0
+  project = var.project_id
+  role    = "roles/pubsub.publisher"
+  member  = "serviceAccount:${data.google_project.project.number}-compute@developer.gserviceaccount.com"
+
+  depends_on = [google_project_service.pubsub, google_project_service.compute]
+}
+
 # Allow unauthenticated access to webhook function
 resource "google_cloud_run_service_iam_member" "webhook_invoker" {
   service  = google_cloudfunctions2_function.telegram_webhook.name
@@ -1,4 +1,4 @@
-# Topic for Telegram webhook messages
+# Topic for Telegram webhook updates (consumed by telegram-update-worker in async mode)
 resource "google_pubsub_topic" "telegram_webhook" {
   name = "telegram-webhook"
 }
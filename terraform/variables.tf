@@ -21,6 +21,24 @@ variable "scheduler_frequency" {
   default     = "* * * * *"  # Every minute
 }
 
+variable "scheduler_max_instances" {
+  description = "Maximum scheduler-tick instances; reminders are leased before sending, so overlapping ticks never double-send"
+  type        = number
+  default     = 3
+}
+
+variable "scheduler_shards" {
+  description = "Number of shards each scheduler tick fans out to (1 = deliver all reminders in the tick itself)"
+  type        = number
+  default     = 1
+
+  validation {
+    # Reminders are spread over 60 shard keys (REMINDER_SHARD_SPACE in reminders.py)
+    condition     = var.scheduler_shards >= 1 && var.scheduler_shards <= 60 && floor(var.scheduler_shards) == var.scheduler_shards
+    error_message = "scheduler_shards must be a whole number from 1 to 60."
+  }
+}
+
 variable "telegram_bot_token" {
   description = "Telegram bot token from BotFather"
   type        = string
@@ -46,6 +64,23 @@ variable "whitelist_user_ids" {
   default     = ""
 }
 
+variable "webhook_mode" {
+  description = "How the webhook handles updates: 'sync' (process in the request) or 'async' (publish to Pub/Sub and process in telegram-update-worker)"
+  type        = string
+  default     = "sync"
+
+  validation {
+    condition     = contains(["sync", "async"], var.webhook_mode)
+    error_message = "webhook_mode must be \"sync\" or \"async\"."
+  }
+}
+
+variable "gemini_streaming" {
+  description = "Stream AI replies into a Telegram message that is edited as Gemini generates them"
+  type        = bool
+  default     = false
+}
+
 variable "bot_source_path" {
   description = "Path to the bot source code directory"
   type        = string